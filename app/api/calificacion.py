@@ -12,6 +12,8 @@ import json
 
 from app.database import get_db
 from app.models import HojaRespuesta, Respuesta, ClaveRespuesta, Calificacion, Postulante
+from app.services.motor_calificacion import calificar_hoja, calificar_hojas
+from app.services.trabajos_calificacion import iniciar_calificacion, obtener_estado_trabajo, reanudar_trabajo
 
 router = APIRouter()
 
@@ -36,93 +38,12 @@ async def calificar_hoja_individual(hoja_id: int, gabarito_id: int, db: Session)
     if not gabarito:
         raise HTTPException(status_code=404, detail="Gabarito no encontrado")
     
-    # Respuestas correctas
-    respuestas_correctas = json.loads(gabarito.respuestas_json) if isinstance(gabarito.respuestas_json, str) else gabarito.respuestas_json
-    
-    # Obtener respuestas del postulante
-    respuestas_postulante = db.query(Respuesta).filter(
-        Respuesta.hoja_respuesta_id == hoja_id
-    ).order_by(Respuesta.numero_pregunta).all()
-    
-    if not respuestas_postulante:
-        raise HTTPException(
-            status_code=400,
-            detail=f"No hay respuestas registradas para la hoja {hoja_id}"
-        )
-    
-    # Calificar
-    correctas = 0
-    incorrectas = 0
-    en_blanco = 0
-    no_legibles = 0
-    
-    for respuesta in respuestas_postulante:
-        num_pregunta = str(respuesta.numero_pregunta)
-        respuesta_correcta = respuestas_correctas.get(num_pregunta)
-        
-        # Solo calificar respuestas válidas (A-E)
-        if respuesta.respuesta_marcada in ['A', 'B', 'C', 'D', 'E']:
-            if respuesta.respuesta_marcada == respuesta_correcta:
-                respuesta.es_correcta = True
-                correctas += 1
-            else:
-                respuesta.es_correcta = False
-                incorrectas += 1
-        
-        elif respuesta.respuesta_marcada == 'VACIO':
-            en_blanco += 1
-        
-        else:
-            # LETRA_INVALIDA, GARABATO, MULTIPLE, ILEGIBLE
-            no_legibles += 1
-    
-    db.commit()
-    
-    # Calcular nota (sobre 20, sistema vigesimal peruano)
-    total_preguntas = len(respuestas_postulante)
-    porcentaje = (correctas / total_preguntas) * 100 if total_preguntas > 0 else 0
-    nota_final = (correctas / total_preguntas) * 20 if total_preguntas > 0 else 0
-    
-    # Nota mínima de aprobación (típicamente 10.5 en Perú)
-    nota_minima = 10.5
-    aprobado = nota_final >= nota_minima
-    
-    # Actualizar hoja
-    hoja.nota_final = round(nota_final, 2)
-    hoja.respuestas_correctas_count = correctas
-    hoja.estado = "calificado"
-    
-    # Crear o actualizar registro en tabla calificaciones
-    calificacion_existente = db.query(Calificacion).filter(
-        Calificacion.postulante_id == hoja.postulante_id
-    ).first()
-    
-    if calificacion_existente:
-        # Actualizar
-        calificacion_existente.nota = round(nota_final, 2)
-        calificacion_existente.correctas = correctas
-        calificacion_existente.incorrectas = incorrectas
-        calificacion_existente.en_blanco = en_blanco
-        calificacion_existente.no_legibles = no_legibles
-        calificacion_existente.porcentaje_aciertos = round(porcentaje, 2)
-        calificacion_existente.aprobado = aprobado
-        calificacion_existente.nota_minima = nota_minima
-        calificacion_existente.calificado_at = datetime.now()
-    else:
-        # Crear nuevo
-        calificacion = Calificacion(
-            postulante_id=hoja.postulante_id,
-            nota=round(nota_final, 2),
-            correctas=correctas,
-            incorrectas=incorrectas,
-            en_blanco=en_blanco,
-            no_legibles=no_legibles,
-            porcentaje_aciertos=round(porcentaje, 2),
-            aprobado=aprobado,
-            nota_minima=nota_minima,
-            calificado_at=datetime.now()
-        )
-        db.add(calificacion)
+    # Mismo motor que la calificación masiva (N = 1); la clave es la del
+    # proceso al que pertenece el gabarito
+    try:
+        resultado = calificar_hoja(db, hoja_id, proceso=gabarito.proceso_admision)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     db.commit()
     
@@ -130,14 +51,14 @@ async def calificar_hoja_individual(hoja_id: int, gabarito_id: int, db: Session)
         "success": True,
         "hoja_id": hoja_id,
         "codigo_hoja": hoja.codigo_hoja,
-        "nota_final": round(nota_final, 2),
-        "correctas": correctas,
-        "incorrectas": incorrectas,
-        "en_blanco": en_blanco,
-        "no_legibles": no_legibles,
-        "total": total_preguntas,
-        "porcentaje": round(porcentaje, 2),
-        "aprobado": aprobado
+        "nota_final": resultado["nota_final"],
+        "correctas": resultado["correctas"],
+        "incorrectas": resultado["incorrectas"],
+        "en_blanco": resultado["en_blanco"],
+        "no_legibles": resultado["no_legibles"],
+        "total": resultado["total"],
+        "porcentaje": resultado["porcentaje"],
+        "aprobado": resultado["aprobado"]
     }
 
 # ============================================================================
@@ -163,56 +84,33 @@ async def calificar_hojas_pendientes(
                 detail=f"No existe gabarito para {proceso_admision}"
             )
         
-        # Obtener pendientes
-        hojas_pendientes = db.query(HojaRespuesta).filter_by(
+        # Contar pendientes
+        pendientes = db.query(HojaRespuesta).filter_by(
             estado="pendiente_calificar",
             proceso_admision=proceso_admision
-        ).all()
+        ).count()
         
-        if not hojas_pendientes:
+        if not pendientes:
             return {
                 "success": True,
                 "mensaje": "No hay hojas pendientes",
                 "calificadas": 0
             }
         
-        calificadas = 0
-        errores = []
-        
-        for hoja in hojas_pendientes:
-            try:
-                # Obtener respuestas
-                respuestas = db.query(Respuesta).filter_by(
-                    hoja_respuesta_id=hoja.id
-                ).order_by(Respuesta.numero_pregunta).all()
-                
-                respuestas_array = [r.respuesta_marcada for r in respuestas]
-                
-                # Calificar
-                from app.services import calcular_calificacion
-                calificacion = calcular_calificacion(
-                    respuestas_array,
-                    proceso_admision,
-                    db
-                )
-                
-                # Actualizar
-                hoja.nota_final = calificacion["nota"]
-                hoja.respuestas_correctas_count = calificacion["correctas"]
-                hoja.estado = "completado"
-                hoja.fecha_calificacion = datetime.now()
-                
-                calificadas += 1
-                
-            except Exception as e:
-                errores.append({"hoja_id": hoja.id, "error": str(e)})
-        
-        db.commit()
+        # Calificar en segundo plano (por bloques, un commit por bloque)
+        trabajo_id = iniciar_calificacion(
+            proceso_admision,
+            estados_origen=("pendiente_calificar",),
+            estado_final="completado",
+            actualizar_calificaciones=False
+        )
         
         return {
             "success": True,
-            "calificadas": calificadas,
-            "errores": errores
+            "mensaje": f"Calificación de {pendientes} hojas iniciada",
+            "trabajo_id": trabajo_id,
+            "total": pendientes,
+            "estado_url": f"/api/calificacion/trabajos/{trabajo_id}"
         }
         
     except HTTPException:
@@ -222,6 +120,34 @@ async def calificar_hojas_pendientes(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/calificacion/trabajos/{trabajo_id}")
+async def estado_trabajo_calificacion(trabajo_id: str):
+    """Progreso de una calificación en segundo plano (para polling)."""
+    
+    estado = obtener_estado_trabajo(trabajo_id)
+    
+    if not estado:
+        raise HTTPException(status_code=404, detail="Trabajo de calificación no encontrado")
+    
+    return {"success": True, **estado}
+
+
+@router.post("/calificacion/trabajos/{trabajo_id}/reanudar")
+async def reanudar_trabajo_calificacion(trabajo_id: str):
+    """Relanza una calificación interrumpida (solo las hojas que faltan)."""
+    
+    nuevo_id = reanudar_trabajo(trabajo_id)
+    
+    if not nuevo_id:
+        raise HTTPException(status_code=404, detail="Trabajo de calificación no encontrado")
+    
+    return {
+        "success": True,
+        "trabajo_id": nuevo_id,
+        "estado_url": f"/api/calificacion/trabajos/{nuevo_id}"
+    }
+
+
 @router.post("/calificar-hojas")
 async def calificar_hojas_masivo(
     proceso: str = "2025-2",
@@ -255,15 +181,18 @@ async def calificar_hojas_masivo(
             "calificadas": 0
         }
     
+    # Calificar todas las hojas a la vez (matriz NumPy)
+    codigos = {hoja.id: hoja.codigo_hoja for hoja in hojas_sin_calificar}
+    
+    calificacion = calificar_hojas(db, proceso, list(codigos))
+    db.commit()
+    
     resultados = []
+    for resultado in calificacion["resultados"]:
+        resultados.append({"success": True, "codigo_hoja": codigos[resultado["hoja_id"]], **resultado})
     
-    for hoja in hojas_sin_calificar:
-        try:
-            resultado = await calificar_hoja_individual(hoja.id, gabarito.id, db)
-            resultados.append(resultado)
-        except Exception as e:
-            print(f"Error al calificar hoja {hoja.id}: {e}")
-            continue
+    for error in calificacion["errores"]:
+        print(f"Error al calificar hoja {error['hoja_id']}: {error['error']}")
     
     return {
         "success": True,
@@ -8,16 +8,88 @@ from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pathlib import Path
-import shutil
+from typing import Dict, List, Optional
+import asyncio
 import uuid
+import zipfile
+import shutil
+import tempfile
 from datetime import datetime
 import json
 
-from app.database import get_db
-from app.models import HojaRespuesta, Postulante, ClaveRespuesta, Calificacion, ValidacionDNI
+import aiofiles
+
+from app.config import settings
+from app.database import get_db, SessionLocal
+from app.models import HojaRespuesta, Postulante, Calificacion, ValidacionDNI
+from app.services.cola_captura import crear_lote, obtener_estado_lote
+from app.services.motor_calificacion import calificar_respuestas, cargar_clave_cacheada, empaquetar_dict
+from app.services.vision_async import ejecutar_bloqueante
 
 router = APIRouter()
 
+EXTENSIONES_IMAGEN = {".jpg", ".jpeg", ".png", ".webp"}
+
+MB = 1024 * 1024
+
+# Registro de hojas (DNI único + orden_aula) serializado: asyncio.Lock entre
+# los workers de este proceso y advisory lock de PostgreSQL entre procesos
+LLAVE_LOCK_REGISTRO_HOJA = 7250003
+_lock_registro = asyncio.Lock()
+
+
+def _nueva_imagen(nombre_original: str) -> Dict:
+    """
+    Genera nombre y ruta únicos para guardar una hoja capturada.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    unique_id = str(uuid.uuid4())[:8]
+    filename = f"hoja_{timestamp}_{unique_id}.jpg"
+
+    uploads_dir = Path("uploads/hojas_originales")
+    uploads_dir.mkdir(parents=True, exist_ok=True)
+
+    return {
+        "timestamp": timestamp,
+        "unique_id": unique_id,
+        "filename": filename,
+        "filepath": uploads_dir / filename,
+        "imagen_url": f"/uploads/hojas_originales/{filename}",
+        "nombre_original": nombre_original
+    }
+
+
+async def _leer_upload_acotado(file: UploadFile) -> bytes:
+    """
+    Lee el upload UNA sola vez a memoria, en bloques, y corta con 413 si
+    supera settings.captura_max_upload_mb. Estos bytes son los que usan la
+    Vision API y el cache: la imagen no se vuelve a leer de disco.
+    """
+    limite = settings.captura_max_upload_mb * 1024 * 1024
+    partes = []
+    total = 0
+    
+    while True:
+        bloque = await file.read(1024 * 1024)
+        if not bloque:
+            break
+        
+        total += len(bloque)
+        if total > limite:
+            raise HTTPException(
+                status_code=413,
+                detail=f"La imagen supera el máximo de {settings.captura_max_upload_mb} MB"
+            )
+        partes.append(bloque)
+    
+    return b"".join(partes)
+
+
+async def _guardar_copia(filepath: Path, datos: bytes):
+    """Copia de archivo de la hoja (para revisión), sin bloquear el event loop."""
+    async with aiofiles.open(filepath, "wb") as f:
+        await f.write(datos)
+
 
 @router.post("/procesar-hoja-completa")
 async def procesar_hoja_completa(
@@ -38,7 +110,7 @@ async def procesar_hoja_completa(
     - Crea invitados automáticamente
     
     FLUJO:
-    1. Guardar imagen
+    1. Leer imagen a memoria (la copia en disco se escribe en paralelo)
     2. Extraer código hoja + DNI manuscrito + respuestas (Gemini)
     3. Validar DNI (8 dígitos o solicitar corrección manual)
     4. Verificar que DNI NO tenga hoja procesada
@@ -48,11 +120,7 @@ async def procesar_hoja_completa(
     8. Calificar si hay gabarito
     """
     
-    from app.services.vision_service_v3_simple import (
-        procesar_hoja_completa_v3,
-        procesar_y_guardar_respuestas,
-        calificar_hoja_con_gabarito
-    )
+    from app.services.vision_service_v3_simple import procesar_hoja_completa_v3
     
     inicio = datetime.now()
     
@@ -61,24 +129,16 @@ async def procesar_hoja_completa(
         # 1. GUARDAR IMAGEN
         # ================================================================
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        filename = f"hoja_{timestamp}_{unique_id}.jpg"
-        
-        uploads_dir = Path("uploads/hojas_originales")
-        uploads_dir.mkdir(parents=True, exist_ok=True)
-        
-        filepath = uploads_dir / filename
-        
-        with filepath.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        imagen = _nueva_imagen(file.filename)
+        contenido = await _leer_upload_acotado(file)
         
-        imagen_url = f"/uploads/hojas_originales/{filename}"
+        # La copia de archivo se escribe mientras la Vision API trabaja
+        guardado = asyncio.create_task(_guardar_copia(imagen["filepath"], contenido))
         
         print(f"\n{'='*70}")
         print(f"🚀 PROCESANDO HOJA DE RESPUESTAS")
         print(f"{'='*70}")
-        print(f"📁 Archivo guardado: {filename}")
+        print(f"📁 Archivo: {imagen['filename']} ({len(contenido) / 1024:.0f} KB)")
         
         # ================================================================
         # 2. PROCESAR CON GEMINI 2.5 FLASH
@@ -86,7 +146,10 @@ async def procesar_hoja_completa(
         
         print(f"\n🔍 Extrayendo datos con Vision API...")
         
-        resultado_vision = await procesar_hoja_completa_v3(str(filepath))
+        try:
+            resultado_vision = await procesar_hoja_completa_v3(str(imagen["filepath"]), contenido)
+        finally:
+            await guardado
         
         if not resultado_vision.get("success"):
             raise HTTPException(
@@ -94,366 +157,654 @@ async def procesar_hoja_completa(
                 detail=resultado_vision.get('error', 'Error en Vision API')
             )
         
-        datos_vision = resultado_vision.get("datos", {})
-        respuestas_array = datos_vision.get("respuestas", [])
-        codigo_hoja = datos_vision.get("codigo_hoja")  # Se extrae pero NO se usa
-        dni_manuscrito = datos_vision.get("dni_postulante", "")
-        
-        # ================================================================
-        # 3. PRIORIZAR DNI MANUAL si fue enviado
-        # ================================================================
-        if dni_manual:
-            print(f"  ✏️ DNI corregido manualmente: {dni_manuscrito} → {dni_manual}")
-            dni_manuscrito = dni_manual
-        
-        # ================================================================
-        # 4. VALIDACIONES BÁSICAS
-        # ================================================================
-        
-        if len(respuestas_array) != 100:
-            raise HTTPException(
-                status_code=400,
-                detail=f"❌ Se esperaban 100 respuestas, se detectaron {len(respuestas_array)}"
-            )
-        
-        # NOTA: Código de hoja se ignora, no se valida
-        
-        if not dni_manuscrito:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "titulo": "DNI NO DETECTADO",
-                    "mensaje": "No se pudo leer el DNI manuscrito.",
-                    "icono": "❌",
-                    "sugerencia": "Verifica que el DNI esté escrito claramente en los 8 rectángulos."
-                }
-            )
-        
-        # ================================================================
-        # 5. VALIDACIÓN DE LONGITUD DNI (8 dígitos)
-        # ================================================================
-        if len(dni_manuscrito) != 8:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "error": "DNI_INCOMPLETO",
-                    "titulo": "⚠️ DNI INCOMPLETO",
-                    "mensaje": f"Se detectaron solo {len(dni_manuscrito)} dígitos: {dni_manuscrito}",
-                    "dni_detectado": dni_manuscrito,
-                    "digitos_faltantes": 8 - len(dni_manuscrito),
-                    "sugerencia": "El DNI debe tener exactamente 8 dígitos. Por favor, ingrésalo manualmente.",
-                    "icono": "🔢",
-                    "requiere_recaptura": False
-                }
-            )
-        
-        print(f"✅ DNI manuscrito: {dni_manuscrito}")
-        print(f"✅ Respuestas: {len(respuestas_array)}/100")
-        print(f"ℹ️  Código de hoja detectado: {codigo_hoja} (se ignora)")
-        
-        # ================================================================
-        # 6. VALIDAR SI DNI YA TIENE HOJA COMPLETADA
-        # ================================================================
-        
-        print(f"\n📋 Validando DNI único...")
-        
-        query_hoja_existente = text("""
-            SELECT h.id, h.codigo_hoja, h.estado, h.fecha_captura,
-                   p.nombres, p.apellido_paterno, p.apellido_materno
-            FROM hojas_respuestas h
-            JOIN postulantes p ON h.postulante_id = p.id
-            WHERE p.dni = :dni 
-              AND h.proceso_admision = :proceso
-              AND h.estado IN ('completado', 'calificado')
-            ORDER BY h.fecha_captura DESC
-            LIMIT 1
-        """)
-        
-        hoja_duplicada = db.execute(query_hoja_existente, {
-            "dni": dni_manuscrito,
-            "proceso": "2025-2"
-        }).fetchone()
+        return await _registrar_hoja_procesada(
+            db=db,
+            resultado_vision=resultado_vision,
+            imagen=imagen,
+            metadata_captura=metadata_captura,
+            dni_manual=dni_manual,
+            inicio=inicio
+        )
         
-        if hoja_duplicada:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "error": "HOJA_YA_CAPTURADA",
-                    "titulo": "⚠️ DNI YA TIENE HOJA CAPTURADA",
-                    "mensaje": f"El DNI {dni_manuscrito} ya tiene una hoja procesada.",
-                    "postulante": f"{hoja_duplicada.nombres} {hoja_duplicada.apellido_paterno} {hoja_duplicada.apellido_materno}",
-                    "codigo_anterior": hoja_duplicada.codigo_hoja,
-                    "fecha_captura": str(hoja_duplicada.fecha_captura),
-                    "sugerencia": "Esta persona ya rindió el examen. No se puede capturar otra hoja con el mismo DNI."
-                }
-            )
+    except HTTPException:
+        raise
+    
+    except Exception as e:
+        db.rollback()
         
-        # ================================================================
-        # 7. BUSCAR O CREAR POSTULANTE
-        # ================================================================
+        import traceback
+        error_detail = traceback.format_exc()
         
-        postulante = db.query(Postulante).filter(
-            Postulante.dni == dni_manuscrito
-        ).first()
+        print(f"\n{'='*70}")
+        print(f"❌ ERROR EN PROCESAMIENTO")
+        print(f"{'='*70}")
+        print(error_detail)
+        print(f"{'='*70}\n")
         
-        if not postulante:
-            # Crear postulante invitado
-            print(f"  📝 Creando postulante invitado para DNI {dni_manuscrito}...")
+        return {
+            "success": False,
+            "error": {
+                "titulo": "Error en Procesamiento",
+                "mensaje": str(e),
+                "icono": "❌",
+                "detalles_tecnicos": error_detail
+            }
+        }
+
+
+async def _registrar_hoja_procesada(
+    db: Session,
+    resultado_vision: Dict,
+    imagen: Dict,
+    metadata_captura: str = None,
+    dni_manual: str = None,
+    inicio: datetime = None
+) -> Dict:
+    """
+    Pasos 3-14 de la captura: valida el DNI, crea postulante/hoja,
+    guarda las 100 respuestas y califica si hay gabarito.
+    
+    Compartido por la captura individual y los workers de captura por lotes.
+    Lanza HTTPException con el detalle estructurado si la validación falla.
+    
+    La verificación de DNI duplicado y el MAX(orden_aula) + 1 no son
+    atómicos: el registro corre bajo _lock_registro y, en PostgreSQL, bajo
+    un advisory lock de transacción hasta el commit (o el rollback, que se
+    hace aquí mismo si algo falla para liberar el lock).
+    """
+    async with _lock_registro:
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                db.execute(text("SELECT pg_advisory_xact_lock(:llave)"), {"llave": LLAVE_LOCK_REGISTRO_HOJA})
             
-            postulante = Postulante(
-                dni=dni_manuscrito,
-                nombres="INVITADO",
-                apellido_paterno=f"DNI-{dni_manuscrito}",
-                apellido_materno="",
-                codigo_unico=f"INV-{dni_manuscrito}",
-                programa_educativo="INVITADO",
-                proceso_admision="2025-2",
-                tipo="invitado",
-                activo=True,
-                examen_rendido=False
+            return await _registrar_hoja(
+                db, resultado_vision, imagen, metadata_captura, dni_manual, inicio
             )
-            
-            db.add(postulante)
-            db.flush()
-            
-            print(f"  ✅ Invitado creado (ID: {postulante.id})")
-        else:
-            print(f"  ✅ Postulante encontrado: {postulante.nombres} {postulante.apellido_paterno}")
-        
-        # ================================================================
-        # 8. CREAR HOJA NUEVA (SIEMPRE)
-        # ================================================================
-        
-        print(f"  📄 Creando hoja nueva...")
-        
-        # Obtener último orden_aula
-        query_max_orden = text("""
-            SELECT COALESCE(MAX(orden_aula), 0) 
-            FROM hojas_respuestas
-            WHERE proceso_admision = :proceso
-        """)
-        max_orden = db.execute(query_max_orden, {"proceso": "2025-2"}).scalar()
-        nuevo_orden = max_orden + 1
-        
-        # Generar código único basado en timestamp
-        codigo_unico = f"DEMO-{timestamp}-{unique_id[:4].upper()}"
+        except Exception:
+            db.rollback()
+            raise
 
-        if len(codigo_unico) > 20:
-            codigo_unico = codigo_unico[:20]
-        
-        hoja = HojaRespuesta(
-            codigo_hoja=codigo_unico,  # ← Código autogenerado, NO el detectado
-            postulante_id=postulante.id,
-            proceso_admision="2025-2",
-            orden_aula=nuevo_orden,
-            codigo_aula="PILOTO",
-            dni_profesor="00000000",
-            estado="generada",
-            respuestas_detectadas=0,
-            created_at=datetime.now(),
-            updated_at=datetime.now()
+
+async def _registrar_hoja(
+    db: Session,
+    resultado_vision: Dict,
+    imagen: Dict,
+    metadata_captura: str = None,
+    dni_manual: str = None,
+    inicio: datetime = None
+) -> Dict:
+    """Cuerpo de _registrar_hoja_procesada (llamar solo con el lock tomado)."""
+    
+    from app.services.vision_service_v3_simple import procesar_y_guardar_respuestas
+    
+    inicio = inicio or datetime.now()
+    
+    datos_vision = resultado_vision.get("datos", {})
+    respuestas_array = datos_vision.get("respuestas", [])
+    codigo_hoja = datos_vision.get("codigo_hoja")  # Se extrae pero NO se usa
+    dni_manuscrito = datos_vision.get("dni_postulante", "")
+    
+    # ================================================================
+    # 3. PRIORIZAR DNI MANUAL si fue enviado
+    # ================================================================
+    if dni_manual:
+        print(f"  ✏️ DNI corregido manualmente: {dni_manuscrito} → {dni_manual}")
+        dni_manuscrito = dni_manual
+    
+    # ================================================================
+    # 4. VALIDACIONES BÁSICAS
+    # ================================================================
+    
+    if len(respuestas_array) != 100:
+        raise HTTPException(
+            status_code=400,
+            detail=f"❌ Se esperaban 100 respuestas, se detectaron {len(respuestas_array)}"
         )
+    
+    # NOTA: Código de hoja se ignora, no se valida
+    
+    if not dni_manuscrito:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "titulo": "DNI NO DETECTADO",
+                "mensaje": "No se pudo leer el DNI manuscrito.",
+                "icono": "❌",
+                "sugerencia": "Verifica que el DNI esté escrito claramente en los 8 rectángulos."
+            }
+        )
+    
+    # ================================================================
+    # 5. VALIDACIÓN DE LONGITUD DNI (8 dígitos)
+    # ================================================================
+    if len(dni_manuscrito) != 8:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": "DNI_INCOMPLETO",
+                "titulo": "⚠️ DNI INCOMPLETO",
+                "mensaje": f"Se detectaron solo {len(dni_manuscrito)} dígitos: {dni_manuscrito}",
+                "dni_detectado": dni_manuscrito,
+                "digitos_faltantes": 8 - len(dni_manuscrito),
+                "sugerencia": "El DNI debe tener exactamente 8 dígitos. Por favor, ingrésalo manualmente.",
+                "icono": "🔢",
+                "requiere_recaptura": False
+            }
+        )
+    
+    print(f"✅ DNI manuscrito: {dni_manuscrito}")
+    print(f"✅ Respuestas: {len(respuestas_array)}/100")
+    print(f"ℹ️  Código de hoja detectado: {codigo_hoja} (se ignora)")
+    
+    # ================================================================
+    # 6. VALIDAR SI DNI YA TIENE HOJA COMPLETADA
+    # ================================================================
+    
+    print(f"\n📋 Validando DNI único...")
+    
+    query_hoja_existente = text("""
+        SELECT h.id, h.codigo_hoja, h.estado, h.fecha_captura,
+               p.nombres, p.apellido_paterno, p.apellido_materno
+        FROM hojas_respuestas h
+        JOIN postulantes p ON h.postulante_id = p.id
+        WHERE p.dni = :dni 
+          AND h.proceso_admision = :proceso
+          AND h.estado IN ('completado', 'calificado')
+        ORDER BY h.fecha_captura DESC
+        LIMIT 1
+    """)
+    
+    hoja_duplicada = db.execute(query_hoja_existente, {
+        "dni": dni_manuscrito,
+        "proceso": "2025-2"
+    }).fetchone()
+    
+    if hoja_duplicada:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": "HOJA_YA_CAPTURADA",
+                "titulo": "⚠️ DNI YA TIENE HOJA CAPTURADA",
+                "mensaje": f"El DNI {dni_manuscrito} ya tiene una hoja procesada.",
+                "postulante": f"{hoja_duplicada.nombres} {hoja_duplicada.apellido_paterno} {hoja_duplicada.apellido_materno}",
+                "codigo_anterior": hoja_duplicada.codigo_hoja,
+                "fecha_captura": str(hoja_duplicada.fecha_captura),
+                "sugerencia": "Esta persona ya rindió el examen. No se puede capturar otra hoja con el mismo DNI."
+            }
+        )
+    
+    # ================================================================
+    # 7. BUSCAR O CREAR POSTULANTE
+    # ================================================================
+    
+    postulante = db.query(Postulante).filter(
+        Postulante.dni == dni_manuscrito
+    ).first()
+    
+    if not postulante:
+        # Crear postulante invitado
+        print(f"  📝 Creando postulante invitado para DNI {dni_manuscrito}...")
         
-        db.add(hoja)
-        db.flush()
-        
-        print(f"  ✅ Hoja creada (ID: {hoja.id}, Orden: {nuevo_orden}, Código: {codigo_unico})")
-        
-        postulante_final = postulante
-        
-        # ================================================================
-        # 9. REGISTRAR VALIDACIÓN DNI (para trazabilidad)
-        # ================================================================
-        
-        validacion = ValidacionDNI(
-            hoja_respuesta_id=hoja.id,
+        postulante = Postulante(
             dni=dni_manuscrito,
-            estado="detectado",
-            fecha_captura=datetime.now()
+            nombres="INVITADO",
+            apellido_paterno=f"DNI-{dni_manuscrito}",
+            apellido_materno="",
+            codigo_unico=f"INV-{dni_manuscrito}",
+            programa_educativo="INVITADO",
+            proceso_admision="2025-2",
+            tipo="invitado",
+            activo=True,
+            examen_rendido=False
         )
-        db.add(validacion)
-        
-        # ================================================================
-        # 10. ACTUALIZAR HOJA
-        # ================================================================
-        
-        tiempo_procesamiento = (datetime.now() - inicio).total_seconds()
-        
-        metadata_dict = {}
-        if metadata_captura:
-            try:
-                metadata_dict = json.loads(metadata_captura)
-            except:
-                pass
-        
-        metadata_dict["vision_result"] = {
-            "api": resultado_vision.get("api"),
-            "modelo": resultado_vision.get("modelo"),
-            "dni_manuscrito_detectado": dni_manuscrito,
-            "dni_manual": bool(dni_manual),
-            "codigo_hoja_detectado": codigo_hoja,
-            "codigo_hoja_usado": codigo_unico
-        }
-        
-        hoja.imagen_url = imagen_url
-        hoja.imagen_original_nombre = file.filename
-        hoja.estado = "completado"
-        hoja.fecha_captura = datetime.now()
-        hoja.api_utilizada = "google"
-        hoja.tiempo_procesamiento = tiempo_procesamiento
-        hoja.respuestas_detectadas = len(respuestas_array)
-        hoja.metadata_json = json.dumps(metadata_dict)
-        hoja.updated_at = datetime.now()
         
+        db.add(postulante)
         db.flush()
         
-        print(f"\n💾 Hoja actualizada")
-        print(f"   Postulante: {postulante_final.dni} - {postulante_final.nombres} {postulante_final.apellido_paterno}")
-        print(f"   Código detectado (ignorado): {codigo_hoja}")
-        print(f"   Código generado (usado): {codigo_unico}")
-        
-        # ================================================================
-        # 11. GUARDAR RESPUESTAS
-        # ================================================================
+        print(f"  ✅ Invitado creado (ID: {postulante.id})")
+    else:
+        print(f"  ✅ Postulante encontrado: {postulante.nombres} {postulante.apellido_paterno}")
+    
+    # ================================================================
+    # 8. CREAR HOJA NUEVA (SIEMPRE)
+    # ================================================================
+    
+    print(f"  📄 Creando hoja nueva...")
+    
+    # Obtener último orden_aula
+    query_max_orden = text("""
+        SELECT COALESCE(MAX(orden_aula), 0) 
+        FROM hojas_respuestas
+        WHERE proceso_admision = :proceso
+    """)
+    max_orden = db.execute(query_max_orden, {"proceso": "2025-2"}).scalar()
+    nuevo_orden = max_orden + 1
+    
+    # Generar código único basado en timestamp
+    codigo_unico = f"DEMO-{imagen['timestamp']}-{imagen['unique_id'][:4].upper()}"
+
+    if len(codigo_unico) > 20:
+        codigo_unico = codigo_unico[:20]
+    
+    hoja = HojaRespuesta(
+        codigo_hoja=codigo_unico,  # ← Código autogenerado, NO el detectado
+        postulante_id=postulante.id,
+        proceso_admision="2025-2",
+        orden_aula=nuevo_orden,
+        codigo_aula="PILOTO",
+        dni_profesor="00000000",
+        estado="generada",
+        respuestas_detectadas=0,
+        created_at=datetime.now(),
+        updated_at=datetime.now()
+    )
+    
+    db.add(hoja)
+    db.flush()
+    
+    print(f"  ✅ Hoja creada (ID: {hoja.id}, Orden: {nuevo_orden}, Código: {codigo_unico})")
+    
+    postulante_final = postulante
+    
+    # ================================================================
+    # 9. REGISTRAR VALIDACIÓN DNI (para trazabilidad)
+    # ================================================================
+    
+    validacion = ValidacionDNI(
+        hoja_respuesta_id=hoja.id,
+        dni=dni_manuscrito,
+        estado="detectado",
+        fecha_captura=datetime.now()
+    )
+    db.add(validacion)
+    
+    # ================================================================
+    # 10. ACTUALIZAR HOJA
+    # ================================================================
+    
+    tiempo_procesamiento = (datetime.now() - inicio).total_seconds()
+    
+    metadata_dict = {}
+    if metadata_captura:
+        try:
+            metadata_dict = json.loads(metadata_captura)
+        except:
+            pass
+    
+    metadata_dict["vision_result"] = {
+        "api": resultado_vision.get("api"),
+        "modelo": resultado_vision.get("modelo"),
+        "dni_manuscrito_detectado": dni_manuscrito,
+        "dni_manual": bool(dni_manual),
+        "codigo_hoja_detectado": codigo_hoja,
+        "codigo_hoja_usado": codigo_unico
+    }
+    
+    hoja.imagen_url = imagen["imagen_url"]
+    hoja.imagen_original_nombre = imagen["nombre_original"]
+    hoja.estado = "completado"
+    hoja.fecha_captura = datetime.now()
+    hoja.api_utilizada = "google"
+    hoja.tiempo_procesamiento = tiempo_procesamiento
+    hoja.respuestas_detectadas = len(respuestas_array)
+    hoja.metadata_json = json.dumps(metadata_dict)
+    hoja.updated_at = datetime.now()
+    
+    # Calificación en memoria contra la clave en cache (antes de insertar):
+    # los totales viajan en este mismo UPDATE de la hoja
+    clave = cargar_clave_cacheada(db, hoja.proceso_admision)
+    resultado_calificacion = calificar_respuestas(respuestas_array, clave) if clave.any() else None
+    
+    if resultado_calificacion:
+        hoja.respuestas_correctas_count = resultado_calificacion["correctas"]
+        hoja.nota_final = resultado_calificacion["nota_final"]
+        hoja.fecha_calificacion = datetime.now()
+        hoja.respuestas_compactas = resultado_calificacion["respuestas_compactas"]
+        hoja.mascara_correctas = resultado_calificacion["mascara_correctas"]
+    else:
+        hoja.respuestas_compactas = empaquetar_dict(dict(enumerate(respuestas_array, start=1)))
+    
+    db.flush()
+    
+    print(f"\n💾 Hoja actualizada")
+    print(f"   Postulante: {postulante_final.dni} - {postulante_final.nombres} {postulante_final.apellido_paterno}")
+    print(f"   Código detectado (ignorado): {codigo_hoja}")
+    print(f"   Código generado (usado): {codigo_unico}")
+    
+    # ================================================================
+    # 11. GUARDAR RESPUESTAS
+    # ================================================================
+    
+    print(f"\n💾 Guardando 100 respuestas...")
+    
+    resultado_para_guardar = {
+        "respuestas": respuestas_array
+    }
+    
+    stats_guardado = await procesar_y_guardar_respuestas(
+        hoja_respuesta_id=hoja.id,
+        resultado_api=resultado_para_guardar,
+        db=db,
+        es_correcta=resultado_calificacion["es_correcta"] if resultado_calificacion else None
+    )
+    
+    stats = stats_guardado.get("estadisticas", {})
+    
+    print(f"✅ Respuestas guardadas:")
+    print(f"   Válidas: {stats.get('validas', 0)}")
+    print(f"   Vacías: {stats.get('vacias', 0)}")
+    
+    # ================================================================
+    # 12. CALIFICAR SI HAY GABARITO
+    # ================================================================
+    
+    # La hoja ya se calificó en memoria (paso 10): solo falta la calificación
+    calificacion_data = None
+    
+    if resultado_calificacion:
+        print(f"\n📊 Calificada con gabarito")
         
-        print(f"\n💾 Guardando 100 respuestas...")
+        # Guardar calificación
+        calificacion_existente = db.query(Calificacion).filter(
+            Calificacion.postulante_id == postulante_final.id
+        ).first()
         
-        resultado_para_guardar = {
-            "respuestas": respuestas_array
+        if calificacion_existente:
+            calificacion_existente.nota = resultado_calificacion["nota_final"]
+            calificacion_existente.correctas = resultado_calificacion["correctas"]
+            calificacion_existente.incorrectas = resultado_calificacion["incorrectas"]
+            calificacion_existente.en_blanco = resultado_calificacion["no_calificables"]
+            calificacion_existente.porcentaje_aciertos = resultado_calificacion["porcentaje"]
+            calificacion_existente.aprobado = resultado_calificacion["nota_final"] >= 10.5
+            calificacion_existente.calificado_at = datetime.now()
+        else:
+            calificacion = Calificacion(
+                postulante_id=postulante_final.id,
+                nota=int(resultado_calificacion["nota_final"]),
+                correctas=resultado_calificacion["correctas"],
+                incorrectas=resultado_calificacion["incorrectas"],
+                en_blanco=resultado_calificacion["no_calificables"],
+                no_legibles=0,
+                porcentaje_aciertos=resultado_calificacion["porcentaje"],
+                aprobado=resultado_calificacion["nota_final"] >= 10.5,
+                nota_minima=10,
+                created_at=datetime.now(),
+                calificado_at=datetime.now()
+            )
+            db.add(calificacion)
+        
+        calificacion_data = {
+            "nota": resultado_calificacion["nota_final"],
+            "correctas": resultado_calificacion["correctas"],
+            "incorrectas": resultado_calificacion["incorrectas"],
+            "en_blanco": resultado_calificacion["no_calificables"],
+            "porcentaje": resultado_calificacion["porcentaje"],
+            "aprobado": resultado_calificacion["nota_final"] >= 10.5
         }
         
-        stats_guardado = await procesar_y_guardar_respuestas(
-            hoja_respuesta_id=hoja.id,
-            resultado_api=resultado_para_guardar,
-            db=db
+        print(f"✅ Nota: {calificacion_data['nota']}/20")
+    
+    # ================================================================
+    # 13. MARCAR EXAMEN RENDIDO
+    # ================================================================
+    
+    postulante_final.examen_rendido = True
+    db.commit()
+    
+    # ================================================================
+    # 14. RESPUESTA
+    # ================================================================
+    
+    print(f"\n{'='*70}")
+    print(f"✅ PROCESAMIENTO COMPLETADO")
+    print(f"{'='*70}\n")
+    
+    respuesta_final = {
+        "success": True,
+        "message": "Hoja procesada exitosamente",
+        "hoja_respuesta_id": hoja.id,
+        "codigo_hoja": codigo_unico,  # ← Código generado, NO el detectado
+        "postulante": {
+            "id": postulante_final.id,
+            "dni": postulante_final.dni,
+            "nombres": f"{postulante_final.apellido_paterno} {postulante_final.apellido_materno}, {postulante_final.nombres}",
+            "programa": postulante_final.programa_educativo,
+            "tipo": getattr(postulante_final, 'tipo', 'regular')
+        },
+        "procesamiento": {
+            "api": "gemini-2.5-flash",
+            "tiempo": round(tiempo_procesamiento, 2),
+            "dni_detectado": bool(dni_manuscrito),
+            "dni_manual": bool(dni_manual)
+        },
+        "respuestas_detectadas": len(respuestas_array),
+        "detalle": stats,
+        "calificacion": calificacion_data
+    }
+    
+    return respuesta_final
+
+
+# ============================================================================
+# CAPTURA POR LOTES
+# ============================================================================
+
+async def _procesar_hoja_de_lote(imagen: Dict) -> Dict:
+    """
+    Procesador de la cola de captura: Vision API + registro en BD de UNA hoja.
+    Cada hoja usa su propia sesión de BD (los workers corren en paralelo).
+    """
+    from app.services.vision_service_v3 import procesar_hoja_dividida
+    
+    inicio = datetime.now()
+    
+    resultado_vision = await procesar_hoja_dividida(str(imagen["filepath"]))
+    
+    if not resultado_vision.get("success"):
+        raise ValueError(resultado_vision.get("error", "Error en Vision API"))
+    
+    db = SessionLocal()
+    try:
+        resultado = await _registrar_hoja_procesada(
+            db=db,
+            resultado_vision=resultado_vision,
+            imagen=imagen,
+            metadata_captura=imagen.get("metadata_captura"),
+            inicio=inicio
         )
         
-        stats = stats_guardado.get("estadisticas", {})
-        
-        print(f"✅ Respuestas guardadas:")
-        print(f"   Válidas: {stats.get('validas', 0)}")
-        print(f"   Vacías: {stats.get('vacias', 0)}")
-        
-        # ================================================================
-        # 12. CALIFICAR SI HAY GABARITO
-        # ================================================================
-        
-        gabarito = db.query(ClaveRespuesta).filter(
-            ClaveRespuesta.proceso_admision == hoja.proceso_admision
-        ).first()
-        
-        calificacion_data = None
-        
-        if gabarito:
-            print(f"\n📊 Calificando con gabarito...")
+        return {
+            "hoja_respuesta_id": resultado["hoja_respuesta_id"],
+            "codigo_hoja": resultado["codigo_hoja"],
+            "dni": resultado["postulante"]["dni"],
+            "calificacion": resultado["calificacion"]
+        }
+    
+    except Exception:
+        db.rollback()
+        raise
+    
+    finally:
+        db.close()
+
+
+async def _volcar_upload_acotado(file: UploadFile, destino, limite: int, detalle: str) -> int:
+    """
+    Copia el upload a destino (archivo temporal) en bloques de 1 MB y corta
+    con 413 si supera limite bytes.
+
+    Returns:
+        Bytes copiados
+    """
+    total = 0
+    
+    while True:
+        bloque = await file.read(MB)
+        if not bloque:
+            break
+        
+        total += len(bloque)
+        if total > limite:
+            raise HTTPException(status_code=413, detail=detalle)
+        destino.write(bloque)
+    
+    destino.seek(0)
+    return total
+
+
+def _guardar_lote(subidos: List, metadata_captura: Optional[str]) -> List[Dict]:
+    """
+    Escribe en uploads/hojas_originales cada imagen del lote ya validado.
+    Si algo falla borra las que alcanzó a escribir.
+    """
+    imagenes = []
+    
+    try:
+        for nombre, temporal, entradas in subidos:
+            if entradas is None:
+                imagen = _nueva_imagen(nombre)
+                imagenes.append(imagen)
+                
+                temporal.seek(0)
+                with open(imagen["filepath"], "wb") as destino:
+                    shutil.copyfileobj(temporal, destino, MB)
+                continue
             
-            resultado_calificacion = await calificar_hoja_con_gabarito(
-                hoja_respuesta_id=hoja.id,
-                gabarito_id=gabarito.id,
-                db=db
-            )
+            temporal.seek(0)
+            with zipfile.ZipFile(temporal) as zf:
+                for info in entradas:
+                    imagen = _nueva_imagen(info.filename)
+                    imagenes.append(imagen)
+                    
+                    with zf.open(info) as origen, open(imagen["filepath"], "wb") as destino:
+                        shutil.copyfileobj(origen, destino, MB)
+    
+    except Exception:
+        for imagen in imagenes:
+            imagen["filepath"].unlink(missing_ok=True)
+        raise
+    
+    for imagen in imagenes:
+        imagen["metadata_captura"] = metadata_captura
+    
+    return imagenes
+
+
+@router.post("/procesar-hojas-lote")
+async def procesar_hojas_lote(
+    files: List[UploadFile] = File(...),
+    metadata_captura: str = Form(None)
+):
+    """
+    Captura por LOTES: recibe varias imágenes (o ZIPs con imágenes),
+    las guarda y las encola para procesarlas en segundo plano.
+    
+    La cola se drena con settings.captura_workers workers concurrentes,
+    respetando los límites por proveedor de Vision API.
+    
+    Retorna inmediatamente un lote_id; el progreso se consulta en
+    GET /api/procesar-hojas-lote/{lote_id}
+    """
+    
+    maximo = settings.captura_lote_max_archivos
+    limite_imagen = settings.captura_max_upload_mb * MB
+    limite_lote = settings.captura_lote_max_mb * MB
+    
+    subidos = []        # (nombre, temporal, entradas del ZIP o None si es imagen)
+    total_subido = 0    # bytes recibidos, todos los archivos
+    total_imagenes = 0  # bytes que se escribirán en disco
+    cantidad = 0
+    
+    try:
+        # 1. Volcar cada upload a un temporal y validar TODO el lote (tamaños
+        #    y cantidad desde infolist()) antes de escribir imágenes: un lote
+        #    rechazado no deja archivos huérfanos
+        for file in files:
+            nombre = file.filename or "hoja.jpg"
+            es_zip = Path(nombre).suffix.lower() == ".zip"
             
-            # Guardar calificación
-            calificacion_existente = db.query(Calificacion).filter(
-                Calificacion.postulante_id == postulante_final.id
-            ).first()
+            temporal = tempfile.SpooledTemporaryFile(max_size=MB)
+            subidos.append((nombre, temporal, None))
             
-            if calificacion_existente:
-                calificacion_existente.nota = resultado_calificacion["nota_final"]
-                calificacion_existente.correctas = resultado_calificacion["correctas"]
-                calificacion_existente.incorrectas = resultado_calificacion["incorrectas"]
-                calificacion_existente.en_blanco = resultado_calificacion["no_calificables"]
-                calificacion_existente.porcentaje_aciertos = resultado_calificacion["porcentaje"]
-                calificacion_existente.aprobado = resultado_calificacion["nota_final"] >= 10.5
-                calificacion_existente.calificado_at = datetime.now()
+            restante = limite_lote - total_subido
+            if es_zip or restante <= limite_imagen:
+                limite, detalle = restante, f"El lote supera el máximo de {settings.captura_lote_max_mb} MB"
             else:
-                calificacion = Calificacion(
-                    postulante_id=postulante_final.id,
-                    nota=int(resultado_calificacion["nota_final"]),
-                    correctas=resultado_calificacion["correctas"],
-                    incorrectas=resultado_calificacion["incorrectas"],
-                    en_blanco=resultado_calificacion["no_calificables"],
-                    no_legibles=0,
-                    porcentaje_aciertos=resultado_calificacion["porcentaje"],
-                    aprobado=resultado_calificacion["nota_final"] >= 10.5,
-                    nota_minima=10,
-                    created_at=datetime.now(),
-                    calificado_at=datetime.now()
-                )
-                db.add(calificacion)
+                limite, detalle = limite_imagen, f"{nombre} supera el máximo de {settings.captura_max_upload_mb} MB"
             
-            calificacion_data = {
-                "nota": resultado_calificacion["nota_final"],
-                "correctas": resultado_calificacion["correctas"],
-                "incorrectas": resultado_calificacion["incorrectas"],
-                "en_blanco": resultado_calificacion["no_calificables"],
-                "porcentaje": resultado_calificacion["porcentaje"],
-                "aprobado": resultado_calificacion["nota_final"] >= 10.5
-            }
+            tamano = await _volcar_upload_acotado(file, temporal, limite, detalle)
+            total_subido += tamano
             
-            print(f"✅ Nota: {calificacion_data['nota']}/20")
-        
-        # ================================================================
-        # 13. MARCAR EXAMEN RENDIDO
-        # ================================================================
-        
-        postulante_final.examen_rendido = True
-        db.commit()
-        
-        # ================================================================
-        # 14. RESPUESTA
-        # ================================================================
-        
-        print(f"\n{'='*70}")
-        print(f"✅ PROCESAMIENTO COMPLETADO")
-        print(f"{'='*70}\n")
-        
-        respuesta_final = {
-            "success": True,
-            "message": "Hoja procesada exitosamente",
-            "hoja_respuesta_id": hoja.id,
-            "codigo_hoja": codigo_unico,  # ← Código generado, NO el detectado
-            "postulante": {
-                "id": postulante_final.id,
-                "dni": postulante_final.dni,
-                "nombres": f"{postulante_final.apellido_paterno} {postulante_final.apellido_materno}, {postulante_final.nombres}",
-                "programa": postulante_final.programa_educativo,
-                "tipo": getattr(postulante_final, 'tipo', 'regular')
-            },
-            "procesamiento": {
-                "api": "gemini-2.5-flash",
-                "tiempo": round(tiempo_procesamiento, 2),
-                "dni_detectado": bool(dni_manuscrito),
-                "dni_manual": bool(dni_manual)
-            },
-            "respuestas_detectadas": len(respuestas_array),
-            "detalle": stats,
-            "calificacion": calificacion_data
-        }
+            if not es_zip:
+                cantidad += 1
+                total_imagenes += tamano
+            else:
+                try:
+                    with zipfile.ZipFile(temporal) as zf:
+                        entradas = [
+                            info for info in zf.infolist()
+                            if not info.is_dir()
+                            and Path(info.filename).suffix.lower() in EXTENSIONES_IMAGEN
+                        ]
+                except zipfile.BadZipFile:
+                    raise HTTPException(status_code=400, detail=f"ZIP inválido: {nombre}")
+                
+                for info in entradas:
+                    if info.file_size > limite_imagen:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"{info.filename} supera el máximo de {settings.captura_max_upload_mb} MB"
+                        )
+                
+                subidos[-1] = (nombre, temporal, entradas)
+                cantidad += len(entradas)
+                total_imagenes += sum(info.file_size for info in entradas)
+            
+            if cantidad > maximo:
+                raise HTTPException(status_code=400, detail=f"Máximo {maximo} hojas por lote")
+            
+            if total_imagenes > limite_lote:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"El lote supera el máximo de {settings.captura_lote_max_mb} MB"
+                )
         
-        return respuesta_final
+        if cantidad == 0:
+            raise HTTPException(status_code=400, detail="No se recibieron imágenes")
         
-    except HTTPException:
-        raise
+        # 2. Escribir las imágenes una por una (las del ZIP se extraen
+        #    directo a su archivo, sin pasar por memoria)
+        try:
+            imagenes = await ejecutar_bloqueante(_guardar_lote, subidos, metadata_captura)
+        except (zipfile.BadZipFile, OSError, EOFError, RuntimeError) as e:
+            raise HTTPException(status_code=400, detail=f"No se pudo extraer el lote: {e}")
     
-    except Exception as e:
-        db.rollback()
-        
-        import traceback
-        error_detail = traceback.format_exc()
-        
-        print(f"\n{'='*70}")
-        print(f"❌ ERROR EN PROCESAMIENTO")
-        print(f"{'='*70}")
-        print(error_detail)
-        print(f"{'='*70}\n")
-        
-        return {
-            "success": False,
-            "error": {
-                "titulo": "Error en Procesamiento",
-                "mensaje": str(e),
-                "icono": "❌",
-                "detalles_tecnicos": error_detail
-            }
-        }
\ No newline at end of file
+    finally:
+        for _, temporal, _ in subidos:
+            temporal.close()
+    
+    lote_id = crear_lote(imagenes, _procesar_hoja_de_lote)
+    
+    return {
+        "success": True,
+        "lote_id": lote_id,
+        "total_hojas": len(imagenes),
+        "workers": settings.captura_workers,
+        "estado_url": f"/api/procesar-hojas-lote/{lote_id}"
+    }
+
+
+@router.get("/procesar-hojas-lote/{lote_id}")
+async def estado_lote_captura(lote_id: str):
+    """
+    Progreso de un lote de captura (para polling desde el navegador).
+    """
+    estado = obtener_estado_lote(lote_id)
+    
+    if not estado:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    
+    return {
+        "success": True,
+        **estado
+    }
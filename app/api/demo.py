@@ -31,6 +31,7 @@ from app.schemas.respuesta import (
     ResultadoCompleto
 )
 from app.services.vision_orchestrator import vision_orchestrator
+from app.services.cache_gabarito import invalidar_clave
 from app.models.clave_respuesta import ClaveRespuesta
 
 logger = logging.getLogger(__name__)
@@ -268,6 +269,7 @@ async def capturar_clave_respuestas(
             db.add(clave)
         
         db.commit()
+        invalidar_clave()
         
         logger.info(f"✅ Clave de respuestas procesada correctamente")
         
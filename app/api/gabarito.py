@@ -20,6 +20,9 @@ from datetime import datetime, timezone
 
 from app.database import get_db
 from app.models import ClaveRespuesta
+from app.services.cache_gabarito import invalidar_clave
+from app.services.calificacion_service import actualizar_orden_merito
+from app.services.motor_calificacion import cargar_clave, clave_desde_dict, recalcular_por_cambio_de_clave
 
 router = APIRouter()
 
@@ -67,6 +70,7 @@ async def registrar_gabarito_manual(
             db.add(cr)
         
         db.commit()
+        invalidar_clave(proceso_admision)
         
         return {
             "success": True,
@@ -357,6 +361,7 @@ async def confirmar_gabarito(
             registros_creados += 1
         
         db.commit()
+        invalidar_clave(proceso)
         
         print(f"✅ Gabarito guardado: {registros_creados} registros creados")
         
@@ -420,6 +425,8 @@ async def reemplazar_gabarito(
         # ELIMINAR GABARITO ANTERIOR
         # ================================================================
         
+        clave_anterior = cargar_clave(db, proceso)
+        
         eliminados = db.query(ClaveRespuesta).filter(
             ClaveRespuesta.proceso_admision == proceso
         ).delete()
@@ -446,15 +453,31 @@ async def reemplazar_gabarito(
             db.add(clave)
             registros_creados += 1
         
+        # ================================================================
+        # RECALCULAR SOLO LAS PREGUNTAS QUE CAMBIARON
+        # ================================================================
+        
+        recalculo = recalcular_por_cambio_de_clave(
+            db, proceso, clave_anterior, clave_desde_dict(respuestas)
+        )
+        
         db.commit()
+        invalidar_clave(proceso)
+        
+        puestos_movidos = actualizar_orden_merito(proceso, db) if recalculo["hojas_afectadas"] else 0
         
         print(f"✅ Gabarito reemplazado: {registros_creados} registros creados")
+        print(f"   Preguntas cambiadas: {len(recalculo['preguntas_cambiadas'])} | "
+              f"Hojas recalculadas: {recalculo['hojas_afectadas']} | Puestos movidos: {puestos_movidos}")
         
         return {
             "success": True,
             "proceso": proceso,
             "eliminados": eliminados,
             "creados": registros_creados,
+            "preguntas_cambiadas": recalculo["preguntas_cambiadas"],
+            "hojas_recalculadas": recalculo["hojas_afectadas"],
+            "puestos_movidos": puestos_movidos,
             "message": f"Gabarito reemplazado correctamente"
         }
         
@@ -507,6 +530,16 @@ async def editar_gabarito(
 ):
     """
     Permite editar un gabarito existente.
+    
+    gabarito_id es cualquier registro de clave_respuestas del proceso.
+    
+    Body esperado:
+    {
+        "respuestas": {"15": "C", "42": "-"},   # "-" = pregunta anulada
+        "observaciones": "opcional"
+    }
+    
+    Solo se recalculan las hojas afectadas por las preguntas cambiadas.
     """
     
     respuestas = data.get('respuestas', {})
@@ -517,22 +550,58 @@ async def editar_gabarito(
     if not gabarito:
         raise HTTPException(status_code=404, detail="Gabarito no encontrado")
     
-    # Actualizar
-    gabarito.respuestas_json = json.dumps(respuestas)
-    gabarito.observaciones = observaciones
-    gabarito.updated_at = datetime.now()
+    proceso = gabarito.proceso_admision
     
-    # TODO: Actualizar tabla respuestas_correctas si existe
+    respuestas_validas = {'A', 'B', 'C', 'D', 'E', '-'}
+    for num, resp in respuestas.items():
+        if not str(num).isdigit() or not 1 <= int(num) <= 100 or (resp or '').upper() not in respuestas_validas:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Respuesta inválida en pregunta {num}: '{resp}'. Solo se permiten A, B, C, D, E o - (anulada)"
+            )
     
-    db.commit()
+    try:
+        clave_anterior = cargar_clave(db, proceso)
+        
+        # Actualizar solo las preguntas enviadas
+        if respuestas:
+            db.execute(text("""
+                UPDATE clave_respuestas
+                SET respuesta_correcta = :respuesta, updated_at = :ahora
+                WHERE proceso_admision = :proceso AND numero_pregunta = :numero
+            """), [
+                {"respuesta": resp.upper(), "ahora": datetime.now(), "proceso": proceso, "numero": int(num)}
+                for num, resp in respuestas.items()
+            ])
+        
+        if observaciones is not None:
+            gabarito.observaciones = observaciones
+            gabarito.updated_at = datetime.now()
+        
+        recalculo = recalcular_por_cambio_de_clave(
+            db, proceso, clave_anterior, cargar_clave(db, proceso)
+        )
+        
+        db.commit()
+        invalidar_clave(proceso)
+        
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    puestos_movidos = actualizar_orden_merito(proceso, db) if recalculo["hojas_afectadas"] else 0
     
     return {
         "success": True,
-        "message": "Gabarito actualizado correctamente"
+        "message": "Gabarito actualizado correctamente",
+        "proceso": proceso,
+        "preguntas_cambiadas": recalculo["preguntas_cambiadas"],
+        "hojas_recalculadas": recalculo["hojas_afectadas"],
+        "respuestas_actualizadas": recalculo["respuestas_actualizadas"],
+        "puestos_movidos": puestos_movidos
     }
 
 
-
 # ==================================
 # API Gabarito - Endpoints Completos
 # ==================================
@@ -614,6 +683,7 @@ async def guardar_gabarito(
         
         # COMMIT DEL GABARITO (independiente de la calificación)
         db.commit()
+        invalidar_clave(data.proceso)
         print("✅ Gabarito guardado correctamente")
         
         # Contar distribución (ANTES de intentar calificar)
@@ -10,19 +10,19 @@ CAMBIO CRÍTICO:
 """
 
 from fastapi import APIRouter, Form, Depends, HTTPException
-from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional
-from io import BytesIO
-import zipfile
+from functools import partial
 import tempfile
 import os
+import shutil
 from datetime import datetime
 
 from app.database import get_db
 from app.models import Postulante, HojaRespuesta, Profesor, Aula, AsignacionExamen
 from app.services.pdf_generator_v3 import generar_hoja_respuestas_v3 as generar_hoja_respuestas_v2
-from app.utils import generar_codigo_hoja_unico
+from app.utils import reservar_codigos_hoja
+from app.utils.zip_stream import respuesta_zip
 
 router = APIRouter()
 
@@ -177,22 +177,16 @@ async def generar_hojas(
         
         crear_directorio_generadas()
         
+        # Códigos únicos para todas las hojas: una consulta, no una por hoja
+        codigos = reservar_codigos_hoja(db, len(postulantes_data))
+        
         for idx, item in enumerate(postulantes_data, 1):
             print(f"\n{'='*60}")
             print(f"📄 Procesando hoja {idx}/{len(postulantes_data)}")
             print(f"   DNI: {item['codigo']}")
             print(f"   Postulante ID: {item['postulante_id']}")
             
-            # Generar código único
-            codigo_hoja = generar_codigo_hoja_unico()
-            
-            # Verificar que sea único
-            intentos = 0
-            while db.query(HojaRespuesta).filter_by(codigo_hoja=codigo_hoja).first():
-                codigo_hoja = generar_codigo_hoja_unico()
-                intentos += 1
-                if intentos > 10:
-                    raise Exception("No se pudo generar código único después de 10 intentos")
+            codigo_hoja = codigos[idx - 1]
             
             print(f"   Código generado: {codigo_hoja}")
             
@@ -290,23 +284,7 @@ async def generar_hojas(
             raise HTTPException(status_code=500, detail=f"Error al guardar en BD: {str(e)}")
         
         # ====================================================================
-        # 5. CREAR ZIP
-        # ====================================================================
-        
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for pdf_file in pdf_files:
-                zip_file.write(pdf_file, os.path.basename(pdf_file))
-        
-        zip_buffer.seek(0)
-        
-        # Limpiar temporales
-        for pdf_file in pdf_files:
-            os.remove(pdf_file)
-        os.rmdir(temp_dir)
-        
-        # ====================================================================
-        # 6. RESPUESTA
+        # 5. RESPUESTA: ZIP EN STREAMING (los temporales se borran al terminar)
         # ====================================================================
         
         filename = f"hojas_respuestas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
@@ -315,15 +293,15 @@ async def generar_hojas(
         print(f"   Archivo ZIP: {filename}")
         print(f"   Total PDFs: {len(pdf_files)}")
         
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
+        return respuesta_zip(
+            [(pdf_file, os.path.basename(pdf_file)) for pdf_file in pdf_files],
+            filename,
             headers={
-                "Content-Disposition": f"attachment; filename={filename}",
                 "X-Total-Hojas": str(len(pdf_files)),
                 "X-Hojas-Registradas": str(len(hojas_registradas)),
                 "X-Hojas-Sin-Registrar": str(len(hojas_sin_registrar))
-            }
+            },
+            al_terminar=partial(shutil.rmtree, temp_dir, ignore_errors=True)
         )
         
     except HTTPException:
@@ -547,6 +525,11 @@ async def generar_hojas_desde_asignaciones(
     crear_directorio_generadas()
     
     for idx, asignacion in enumerate(asignaciones, 1):
+        # Códigos únicos por bloque de 10 (una consulta por bloque): el lock
+        # de reservar_codigos_hoja dura hasta el commit parcial del bloque
+        if idx % 10 == 1:
+            codigos = iter(reservar_codigos_hoja(db, min(10, len(asignaciones) - idx + 1)))
+        
         try:
             # Imprimir progreso cada 10 hojas
             if idx % 10 == 0 or idx == 1:
@@ -573,15 +556,7 @@ async def generar_hojas_desde_asignaciones(
                 })
                 continue
             
-            # Generar código único
-            codigo_hoja = generar_codigo_hoja_unico()
-            
-            intentos = 0
-            while db.query(HojaRespuesta).filter_by(codigo_hoja=codigo_hoja).first():
-                codigo_hoja = generar_codigo_hoja_unico()
-                intentos += 1
-                if intentos > 10:
-                    raise Exception("No se pudo generar código único")
+            codigo_hoja = next(codigos)
             
             # ================================================================
             # CREAR REGISTRO EN BD (NO actualizar, siempre crear nuevo)
@@ -629,25 +604,25 @@ async def generar_hojas_desde_asignaciones(
                 "hoja_id": hoja.id
             })
             
-            # ================================================================
-            # COMMIT PARCIAL CADA 10 HOJAS (para progreso visible)
-            # ================================================================
-            
-            if idx % 10 == 0:
-                try:
-                    db.commit()
-                    print(f"   💾 Commit parcial: {idx} hojas guardadas")
-                except Exception as e:
-                    print(f"   ⚠️  Error en commit parcial: {str(e)}")
-                    db.rollback()
-                    # Continuar con las siguientes
-            
         except Exception as e:
             print(f"   ❌ ERROR en {postulante.dni if postulante else 'unknown'}: {str(e)}")
             errores.append({
                 "asignacion_id": asignacion.id,
                 "error": str(e)
             })
+        
+        # ================================================================
+        # COMMIT PARCIAL CADA 10 HOJAS (para progreso visible)
+        # ================================================================
+        
+        if idx % 10 == 0:
+            try:
+                db.commit()
+                print(f"   💾 Commit parcial: {idx} hojas guardadas")
+            except Exception as e:
+                print(f"   ⚠️  Error en commit parcial: {str(e)}")
+                db.rollback()
+                # Continuar con las siguientes
     
     # ====================================================================
     # 3. COMMIT A BD
@@ -666,7 +641,7 @@ async def generar_hojas_desde_asignaciones(
         raise HTTPException(status_code=500, detail=f"Error al guardar: {str(e)}")
     
     # ====================================================================
-    # 4. CREAR ZIP
+    # 4. VERIFICAR PDFs GENERADOS
     # ====================================================================
     
     if not pdf_files:
@@ -676,27 +651,8 @@ async def generar_hojas_desde_asignaciones(
             "errores": errores
         }
     
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for pdf_file in pdf_files:
-            zip_file.write(pdf_file, os.path.basename(pdf_file))
-    
-    zip_buffer.seek(0)
-    
-    # Limpiar temporales
-    for pdf_file in pdf_files:
-        try:
-            os.remove(pdf_file)
-        except:
-            pass
-    
-    try:
-        os.rmdir(temp_dir)
-    except:
-        pass
-    
     # ====================================================================
-    # 5. RESPUESTA
+    # 5. RESPUESTA: ZIP EN STREAMING (los temporales se borran al terminar)
     # ====================================================================
     
     filename = f"hojas_asignadas_{proceso}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
@@ -705,15 +661,15 @@ async def generar_hojas_desde_asignaciones(
     print(f"   Archivo ZIP: {filename}")
     print(f"   Total PDFs: {len(pdf_files)}\n")
     
-    return StreamingResponse(
-        zip_buffer,
-        media_type="application/zip",
+    return respuesta_zip(
+        [(pdf_file, os.path.basename(pdf_file)) for pdf_file in pdf_files],
+        filename,
         headers={
-            "Content-Disposition": f"attachment; filename={filename}",
             "X-Total-Hojas": str(len(pdf_files)),
             "X-Hojas-Generadas": str(len(hojas_generadas)),
             "X-Errores": str(len(errores))
-        }
+        },
+        al_terminar=partial(shutil.rmtree, temp_dir, ignore_errors=True)
     )
 
 
@@ -863,7 +819,7 @@ async def reimprimir_hoja(
     
     from app.models.log_anulacion import LogAnulacionHoja
     from app.services.pdf_generator_v3 import generar_hoja_respuestas_v3
-    from app.utils import generar_codigo_hoja_unico
+    from app.utils import reservar_codigos_hoja
     from fastapi.responses import FileResponse
     import tempfile
     import os
@@ -930,14 +886,7 @@ async def reimprimir_hoja(
         # 2. GENERAR NUEVO CÓDIGO
         # ================================================================
         
-        nuevo_codigo = generar_codigo_hoja_unico()
-        
-        intentos = 0
-        while db.query(HojaRespuesta).filter_by(codigo_hoja=nuevo_codigo).first():
-            nuevo_codigo = generar_codigo_hoja_unico()
-            intentos += 1
-            if intentos > 10:
-                raise Exception("No se pudo generar código único")
+        nuevo_codigo, = reservar_codigos_hoja(db, 1)
         
         print(f"✅ Código anterior: {codigo_anterior}")
         print(f"✅ Código nuevo: {nuevo_codigo}")
@@ -14,6 +14,7 @@ import random
 import string
 
 from app.database import get_db
+from app.utils import reservar_codigos_hoja
 
 router = APIRouter()
 
@@ -174,11 +175,7 @@ async def generar_hoja_individual(
             raise HTTPException(status_code=404, detail="Postulante no encontrado")
         
         # 2. Generar código único de hoja
-        nuevo_codigo = generar_codigo_hoja()
-        
-        # Verificar que no exista
-        while verificar_codigo_existe(db, nuevo_codigo):
-            nuevo_codigo = generar_codigo_hoja()
+        nuevo_codigo, = reservar_codigos_hoja(db, 1, generador=generar_codigo_hoja)
         
         # 3. Marcar hoja anterior como ANULADA (si existe)
         query_anular = text("""
@@ -367,16 +364,6 @@ def generar_codigo_hoja() -> str:
     return f"{letras1}{numeros}{letra2}"
 
 
-def verificar_codigo_existe(db: Session, codigo: str) -> bool:
-    """
-    Verifica si un código de hoja ya existe.
-    """
-    query = text("SELECT COUNT(*) FROM hojas_respuestas WHERE codigo_hoja = :codigo")
-    result = db.execute(query, {"codigo": codigo})
-    count = result.scalar()
-    return count > 0
-
-
 def crear_tabla_auditoria(db: Session):
     """
     Crea la tabla de log de auditoría si no existe.
@@ -514,15 +501,11 @@ async def regenerar_hojas_aula(
             "cargo": request.get("cargo")
         })
         
-        # 3. Generar nuevas hojas
+        # 3. Generar nuevas hojas (códigos únicos en una sola consulta)
         hojas_generadas = []
+        codigos = reservar_codigos_hoja(db, len(postulantes), generador=generar_codigo_hoja)
         
-        for postulante in postulantes:
-            # Generar código único
-            nuevo_codigo = generar_codigo_hoja()
-            while verificar_codigo_existe(db, nuevo_codigo):
-                nuevo_codigo = generar_codigo_hoja()
-            
+        for postulante, nuevo_codigo in zip(postulantes, codigos):
             # Insertar nueva hoja
             query_insert = text("""
                 INSERT INTO hojas_respuestas (
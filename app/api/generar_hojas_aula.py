@@ -446,25 +446,36 @@ async def asignar_y_generar_hojas(
     Body:
     {
         "proceso_admision": "2025-2",
-        "modo_generacion": "individual" | "unico"
+        "modo_generacion": "individual" | "unico" | "pdf_aula" | "pdf_unico"
     }
+    
+    Modos:
+    - individual: un ZIP por aula (un PDF por postulante)
+    - unico: un ZIP con todas las aulas (un PDF por postulante)
+    - pdf_aula: un PDF multi-página por aula (JSON con URLs)
+    - pdf_unico: un PDF multi-página con todo el proceso (descarga)
+    
+    En los modos pdf_* las hojas van en orden alfabético dentro de cada aula
+    y la plantilla de la hoja se dibuja una sola vez por documento.
     """
     
     import tempfile
     import os
-    import zipfile
     import shutil
-    from io import BytesIO
     from datetime import datetime
-    from fastapi.responses import StreamingResponse
-    from app.services.pdf_generator_simple import generar_hoja_generica
-    from app.utils import generar_codigo_hoja_unico
+    from functools import partial
+    from fastapi.responses import FileResponse
+    from starlette.background import BackgroundTask
+    from app.services.pool_pdf import iterar_renderizados, renderizar_hojas
+    from app.utils.zip_stream import escribir_zip, respuesta_zip
+    from app.utils import reservar_codigos_hoja
     
     temp_dir = None
     
     try:
         proceso = data.get('proceso_admision', '2025-2')
         modo_generacion = data.get('modo_generacion', 'unico')
+        multipagina = modo_generacion in ('pdf_aula', 'pdf_unico')
         
         print(f"\n{'='*70}")
         print(f"🎯 ASIGNACIÓN ALFABÉTICA Y GENERACIÓN MASIVA V2.0")
@@ -545,7 +556,6 @@ async def asignar_y_generar_hojas(
         os.makedirs("uploads/hojas_generadas", exist_ok=True)
         
         archivos_por_aula = []
-        todos_los_pdfs = []
         
         # Agrupar por aula
         aulas_dict = {}
@@ -559,162 +569,195 @@ async def asignar_y_generar_hojas(
         print(f"Aulas a procesar: {len(aulas_dict)}")
         
         # ================================================================
-        # 4. GENERAR PDFs POR AULA (CON ORDEN)
+        # 4. REGISTRAR HOJAS (BD) Y ARMAR TRABAJOS DE PDF (CON ORDEN)
         # ================================================================
         
+        # Códigos únicos para todas las hojas: una consulta, no una por hoja
+        codigos = iter(reservar_codigos_hoja(db, len(asignaciones)))
+        
+        trabajos = []
+        indices_por_aula = {}
+        hojas_por_aula = {}
+        
         for idx_aula, (aula_codigo, asignaciones_aula) in enumerate(aulas_dict.items(), 1):
-            print(f"\n{'='*70}")
-            print(f"📦 AULA {idx_aula}/{len(aulas_dict)}: {aula_codigo}")
-            print(f"   Cantidad: {len(asignaciones_aula)}")
-            print(f"{'='*70}")
+            print(f"📦 AULA {idx_aula}/{len(aulas_dict)}: {aula_codigo} ({len(asignaciones_aula)} hojas)")
             
             # Crear subdirectorio por aula
             aula_dir = os.path.join(temp_dir, aula_codigo)
             os.makedirs(aula_dir, exist_ok=True)
             
-            pdf_files_aula = []
+            indices_por_aula[aula_codigo] = []
+            hojas_por_aula[aula_codigo] = []
             
             for asig in asignaciones_aula:
-                try:
-                    # Generar código único
-                    codigo_hoja = generar_codigo_hoja_unico()
-                    
-                    intentos = 0
-                    while db.query(HojaRespuesta).filter_by(codigo_hoja=codigo_hoja).first():
-                        codigo_hoja = generar_codigo_hoja_unico()
-                        intentos += 1
-                        if intentos > 10:
-                            raise Exception("No se pudo generar código único")
-                    
-                    # ============================================================
-                    # CREAR HOJA CON ORDEN_AULA
-                    # ============================================================
-                    
-                    hoja = HojaRespuesta(
-                        postulante_id=asig.postulante_id,
-                        dni_profesor=asig.profesor_dni,
-                        codigo_aula=aula_codigo,
-                        codigo_hoja=codigo_hoja,
-                        proceso_admision=proceso,
-                        estado="generada",
-                        orden_aula=asig.orden_alfabetico  # ← GUARDAR ORDEN
-                    )
-                    db.add(hoja)
-                    
-                    # ============================================================
-                    # GENERAR PDF CON ORDEN_AULA
-                    # ============================================================
-                    
-                    filename = f"hoja_{asig.dni}_{codigo_hoja}.pdf"
-                    filepath = os.path.join(aula_dir, filename)
-                    
-                    generar_hoja_generica(
-                        output_path=filepath,
-                        numero_hoja=asig.orden_alfabetico,
-                        codigo_hoja=codigo_hoja,
-                        proceso=proceso,
-                        descripcion="Examen de Admisión"
-                    )
-                    
-                    if not os.path.exists(filepath):
-                        raise Exception(f"PDF no generado: {filename}")
-                    
-                    pdf_files_aula.append(filepath)
-                    todos_los_pdfs.append(filepath)
-                    
-                    # Commit parcial cada 10
-                    if len(todos_los_pdfs) % 10 == 0:
-                        db.commit()
-                        print(f"   💾 Commit parcial: {len(todos_los_pdfs)} hojas")
+                codigo_hoja = next(codigos)
                 
-                except Exception as e:
-                    print(f"   ❌ ERROR: {str(e)}")
-                    raise
-            
-            print(f"✅ Aula {aula_codigo}: {len(pdf_files_aula)} hojas generadas")
-            
-            # ============================================================
-            # CREAR ZIP POR AULA (modo individual)
-            # ============================================================
-            
-            if modo_generacion == 'individual':
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                zip_filename = f"hojas_{aula_codigo}_{timestamp}.zip"
-                zip_path = os.path.join("uploads/hojas_generadas", zip_filename)
+                # ============================================================
+                # CREAR HOJA CON ORDEN_AULA
+                # ============================================================
                 
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    for pdf_file in pdf_files_aula:
-                        arcname = os.path.basename(pdf_file)
-                        zip_file.write(pdf_file, arcname)
+                hoja = HojaRespuesta(
+                    postulante_id=asig.postulante_id,
+                    dni_profesor=asig.profesor_dni,
+                    codigo_aula=aula_codigo,
+                    codigo_hoja=codigo_hoja,
+                    proceso_admision=proceso,
+                    estado="generada",
+                    orden_aula=asig.orden_alfabetico  # ← GUARDAR ORDEN
+                )
+                db.add(hoja)
                 
-                archivos_por_aula.append({
-                    "aula": aula_codigo,
-                    "cantidad": len(pdf_files_aula),
-                    "archivo": zip_filename,
-                    "url_descarga": f"/uploads/hojas_generadas/{zip_filename}",
-                    "tamanio_mb": round(os.path.getsize(zip_path) / (1024*1024), 2)
+                hojas_por_aula[aula_codigo].append({
+                    "numero_hoja": asig.orden_alfabetico,
+                    "codigo_hoja": codigo_hoja
                 })
                 
-                print(f"   📦 ZIP creado: {zip_filename}")
-        
-        # ================================================================
-        # 5. COMMIT FINAL
-        # ================================================================
-        
+                if multipagina:
+                    continue
+                
+                filename = f"hoja_{asig.dni}_{codigo_hoja}.pdf"
+                
+                indices_por_aula[aula_codigo].append(len(trabajos))
+                trabajos.append(("generica", {
+                    "output_path": os.path.join(aula_dir, filename),
+                    "numero_hoja": asig.orden_alfabetico,
+                    "codigo_hoja": codigo_hoja,
+                    "proceso": proceso,
+                    "descripcion": "Examen de Admisión"
+                }))
+        
+        # Commit ANTES de renderizar: libera el lock de códigos y la
+        # transacción mientras el pool genera los PDFs
         db.commit()
-        print(f"\n✅ COMMIT FINAL: {len(todos_los_pdfs)} hojas registradas en BD")
+        print(f"\n✅ COMMIT: {len(asignaciones)} hojas registradas en BD")
         
         # ================================================================
-        # 6. RETORNAR SEGÚN MODO
+        # 5. MODOS PDF MULTI-PÁGINA (un documento por aula o por proceso)
         # ================================================================
         
-        if modo_generacion == 'individual':
-            # Modo individual: retornar JSON con URLs
-            shutil.rmtree(temp_dir)
+        if multipagina:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            total_hojas = sum(len(hojas) for hojas in hojas_por_aula.values())
             
-            return {
-                "success": True,
-                "modo": "individual",
-                "total_hojas": len(todos_los_pdfs),
-                "total_aulas": len(archivos_por_aula),
-                "archivos": archivos_por_aula,
-                "mensaje": f"Se generaron {len(archivos_por_aula)} archivos ZIP (uno por aula) con orden alfabético"
-            }
-        
-        else:
-            # Modo único: retornar ZIP con todo
-            print(f"\n📦 Creando ZIP único...")
+            if modo_generacion == 'pdf_aula':
+                documentos = [
+                    (aula_codigo, os.path.join("uploads/hojas_generadas", f"hojas_{aula_codigo}_{timestamp}.pdf"), hojas)
+                    for aula_codigo, hojas in hojas_por_aula.items()
+                ]
+            else:
+                documentos = [(
+                    None,
+                    os.path.join(temp_dir, f"hojas_{proceso}_{timestamp}.pdf"),
+                    [hoja for hojas in hojas_por_aula.values() for hoja in hojas]
+                )]
             
-            zip_buffer = BytesIO()
+            print(f"\n🖨️  Generando {len(documentos)} PDF(s) multi-página con {total_hojas} hojas...")
             
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for pdf_file in todos_los_pdfs:
-                    arcname = os.path.relpath(pdf_file, temp_dir)
-                    zip_file.write(pdf_file, arcname)
+            await renderizar_hojas([
+                ("documento_generica", {"output_path": ruta, "hojas": hojas, "proceso": proceso})
+                for _, ruta, hojas in documentos
+            ])
+            
+            if modo_generacion == 'pdf_aula':
+                shutil.rmtree(temp_dir)
+                
+                return {
+                    "success": True,
+                    "modo": "pdf_aula",
+                    "total_hojas": total_hojas,
+                    "total_aulas": len(documentos),
+                    "archivos": [
+                        {
+                            "aula": aula_codigo,
+                            "cantidad": len(hojas),
+                            "archivo": os.path.basename(ruta),
+                            "url_descarga": f"/uploads/hojas_generadas/{os.path.basename(ruta)}",
+                            "tamanio_mb": round(os.path.getsize(ruta) / (1024*1024), 2)
+                        }
+                        for aula_codigo, ruta, hojas in documentos
+                    ],
+                    "mensaje": f"Se generaron {len(documentos)} PDFs (uno por aula) con orden alfabético"
+                }
             
-            zip_buffer.seek(0)
-            zip_size = len(zip_buffer.getvalue())
+            _, ruta, _ = documentos[0]
             
-            shutil.rmtree(temp_dir)
+            print(f"✅ PDF único: {os.path.basename(ruta)} ({os.path.getsize(ruta) / (1024*1024):.2f} MB)\n")
             
+            return FileResponse(
+                path=ruta,
+                filename=os.path.basename(ruta),
+                media_type="application/pdf",
+                headers={
+                    "X-Total-Hojas": str(total_hojas),
+                    "Cache-Control": "no-cache"
+                },
+                background=BackgroundTask(shutil.rmtree, temp_dir, ignore_errors=True)
+            )
+        
+        # ================================================================
+        # 6. MODO ÚNICO: ZIP EN STREAMING A MEDIDA QUE SALEN LOS PDFs
+        # ================================================================
+        
+        if modo_generacion != 'individual':
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"hojas_{proceso}_{timestamp}.zip"
             
-            print(f"\n✅ ZIP único creado: {filename}")
-            print(f"   Tamaño: {zip_size / (1024*1024):.2f} MB")
-            print(f"   Total hojas: {len(todos_los_pdfs)}\n")
+            print(f"\n📦 Enviando ZIP único en streaming: {filename}")
+            print(f"   Total hojas: {len(trabajos)}\n")
             
-            return StreamingResponse(
-                iter([zip_buffer.getvalue()]),
-                media_type="application/zip",
-                headers={
-                    "Content-Disposition": f"attachment; filename={filename}",
-                    "Content-Length": str(zip_size),
-                    "X-Total-Hojas": str(len(todos_los_pdfs)),
-                    "Cache-Control": "no-cache"
-                }
+            # Cada PDF entra al ZIP (y se borra) apenas el pool lo termina,
+            # en orden de envío: el cliente recibe bytes desde la primera hoja
+            return respuesta_zip(
+                (
+                    (pdf_file, os.path.relpath(pdf_file, temp_dir))
+                    async for pdf_file in iterar_renderizados(trabajos)
+                ),
+                filename,
+                headers={"X-Total-Hojas": str(len(trabajos))},
+                al_terminar=partial(shutil.rmtree, temp_dir, ignore_errors=True),
+                borrar=True
             )
         
+        # ================================================================
+        # 7. MODO INDIVIDUAL: PDFs EN PARALELO Y UN ZIP POR AULA
+        # ================================================================
+        
+        print(f"\n🖨️  Generando {len(trabajos)} PDFs...")
+        
+        todos_los_pdfs = await renderizar_hojas(trabajos)
+        
+        for aula_codigo, indices in indices_por_aula.items():
+            pdf_files_aula = [todos_los_pdfs[i] for i in indices]
+            
+            print(f"✅ Aula {aula_codigo}: {len(pdf_files_aula)} hojas generadas")
+            
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            zip_filename = f"hojas_{aula_codigo}_{timestamp}.zip"
+            zip_path = os.path.join("uploads/hojas_generadas", zip_filename)
+            
+            escribir_zip(zip_path, [(pdf_file, os.path.basename(pdf_file)) for pdf_file in pdf_files_aula])
+            
+            archivos_por_aula.append({
+                "aula": aula_codigo,
+                "cantidad": len(pdf_files_aula),
+                "archivo": zip_filename,
+                "url_descarga": f"/uploads/hojas_generadas/{zip_filename}",
+                "tamanio_mb": round(os.path.getsize(zip_path) / (1024*1024), 2)
+            })
+            
+            print(f"   📦 ZIP creado: {zip_filename}")
+        
+        shutil.rmtree(temp_dir)
+        
+        return {
+            "success": True,
+            "modo": "individual",
+            "total_hojas": len(todos_los_pdfs),
+            "total_aulas": len(archivos_por_aula),
+            "archivos": archivos_por_aula,
+            "mensaje": f"Se generaron {len(archivos_por_aula)} archivos ZIP (uno por aula) con orden alfabético"
+        }
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -755,13 +798,12 @@ async def regenerar_hojas_desde_asignaciones(
     
     import tempfile
     import os
-    import zipfile
     import shutil
-    from io import BytesIO
     from datetime import datetime
-    from fastapi.responses import StreamingResponse
-    from app.services.pdf_generator_v3 import generar_hoja_respuestas_v3
-    from app.utils import generar_codigo_hoja_unico
+    from functools import partial
+    from app.services.pool_pdf import iterar_renderizados, renderizar_hojas
+    from app.utils.zip_stream import escribir_zip, respuesta_zip
+    from app.utils import reservar_codigos_hoja
     
     temp_dir = None
     
@@ -818,7 +860,6 @@ async def regenerar_hojas_desde_asignaciones(
         os.makedirs("uploads/hojas_generadas", exist_ok=True)
         
         archivos_por_aula = []
-        todos_los_pdfs = []
         
         # Agrupar por aula
         aulas_dict = {}
@@ -831,147 +872,113 @@ async def regenerar_hojas_desde_asignaciones(
         print(f"📦 Aulas a procesar: {len(aulas_dict)}")
         
         # ================================================================
-        # 3. GENERAR PDFs POR AULA
+        # 3. REGISTRAR HOJAS (BD) Y ARMAR TRABAJOS DE PDF
         # ================================================================
         
+        # Códigos únicos para todas las hojas: una consulta, no una por hoja
+        codigos = iter(reservar_codigos_hoja(db, len(asignaciones)))
+        
+        trabajos = []
+        indices_por_aula = {}
+        
         for idx, (aula_codigo, asignaciones_aula) in enumerate(aulas_dict.items(), 1):
-            print(f"\n{'='*70}")
-            print(f"📦 AULA {idx}/{len(aulas_dict)}: {aula_codigo}")
-            print(f"   Cantidad: {len(asignaciones_aula)}")
-            print(f"{'='*70}")
+            print(f"📦 AULA {idx}/{len(aulas_dict)}: {aula_codigo} ({len(asignaciones_aula)} hojas)")
             
             # Crear subdirectorio por aula
             aula_dir = os.path.join(temp_dir, aula_codigo)
             os.makedirs(aula_dir, exist_ok=True)
             
-            pdf_files_aula = []
+            indices_por_aula[aula_codigo] = []
             
             for asig in asignaciones_aula:
-                try:
-                    # Generar código único
-                    codigo_hoja = generar_codigo_hoja_unico()
-                    
-                    intentos = 0
-                    while db.query(HojaRespuesta).filter_by(codigo_hoja=codigo_hoja).first():
-                        codigo_hoja = generar_codigo_hoja_unico()
-                        intentos += 1
-                        if intentos > 10:
-                            raise Exception("No se pudo generar código único")
-                    
-                    # Crear nuevo registro de hoja
-                    hoja = HojaRespuesta(
-                        postulante_id=asig.postulante_id,
-                        dni_profesor=asig.profesor_dni,
-                        codigo_aula=aula_codigo,
-                        codigo_hoja=codigo_hoja,
-                        proceso_admision=proceso,
-                        estado="generada"
-                    )
-                    db.add(hoja)
-                    
-                    # Generar PDF
-                    filename = f"hoja_{asig.dni}_{codigo_hoja}.pdf"
-                    filepath = os.path.join(aula_dir, filename)
-                    
-                    generar_hoja_respuestas_v3(
-                        output_path=filepath,
-                        dni_postulante=asig.dni,
-                        codigo_aula=aula_codigo,
-                        dni_profesor=asig.profesor_dni,
-                        codigo_hoja=codigo_hoja,
-                        proceso=proceso
-                    )
-                    
-                    if not os.path.exists(filepath):
-                        raise Exception(f"PDF no generado: {filename}")
-                    
-                    pdf_files_aula.append(filepath)
-                    todos_los_pdfs.append(filepath)
-                    
-                    # Commit parcial cada 10
-                    if len(todos_los_pdfs) % 10 == 0:
-                        db.commit()
-                        print(f"   💾 Commit parcial: {len(todos_los_pdfs)} hojas")
+                codigo_hoja = next(codigos)
                 
-                except Exception as e:
-                    print(f"   ❌ ERROR en {asig.dni}: {str(e)}")
-                    raise
-            
-            print(f"✅ Aula {aula_codigo}: {len(pdf_files_aula)} hojas regeneradas")
-            
-            # Crear ZIP por aula (modo individual)
-            if modo_generacion == 'individual':
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                zip_filename = f"hojas_{aula_codigo}_{timestamp}.zip"
-                zip_path = os.path.join("uploads/hojas_generadas", zip_filename)
+                # Crear nuevo registro de hoja
+                hoja = HojaRespuesta(
+                    postulante_id=asig.postulante_id,
+                    dni_profesor=asig.profesor_dni,
+                    codigo_aula=aula_codigo,
+                    codigo_hoja=codigo_hoja,
+                    proceso_admision=proceso,
+                    estado="generada"
+                )
+                db.add(hoja)
                 
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    for pdf_file in pdf_files_aula:
-                        arcname = os.path.basename(pdf_file)
-                        zip_file.write(pdf_file, arcname)
+                filename = f"hoja_{asig.dni}_{codigo_hoja}.pdf"
                 
-                archivos_por_aula.append({
-                    "aula": aula_codigo,
-                    "cantidad": len(pdf_files_aula),
-                    "archivo": zip_filename,
-                    "url_descarga": f"/uploads/hojas_generadas/{zip_filename}",
-                    "tamanio_mb": round(os.path.getsize(zip_path) / (1024*1024), 2)
-                })
+                indices_por_aula[aula_codigo].append(len(trabajos))
+                trabajos.append(("v3", {
+                    "output_path": os.path.join(aula_dir, filename),
+                    "dni_postulante": asig.dni,
+                    "codigo_aula": aula_codigo,
+                    "dni_profesor": asig.profesor_dni,
+                    "codigo_hoja": codigo_hoja,
+                    "proceso": proceso
+                }))
+        
+        # Commit ANTES de renderizar: libera el lock de códigos y la
+        # transacción mientras el pool genera los PDFs
+        db.commit()
+        print(f"\n✅ COMMIT: {len(asignaciones)} hojas registradas en BD")
         
         # ================================================================
-        # 4. COMMIT FINAL
+        # 4. MODO ÚNICO: ZIP EN STREAMING A MEDIDA QUE SALEN LOS PDFs
         # ================================================================
         
-        db.commit()
-        print(f"\n✅ COMMIT FINAL: {len(todos_los_pdfs)} hojas regeneradas")
+        if modo_generacion != 'individual':
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = f"hojas_regeneradas_{proceso}_{timestamp}.zip"
+            
+            print(f"\n📦 Enviando ZIP único en streaming: {filename}\n")
+            
+            return respuesta_zip(
+                (
+                    (pdf_file, os.path.relpath(pdf_file, temp_dir))
+                    async for pdf_file in iterar_renderizados(trabajos)
+                ),
+                filename,
+                headers={"X-Total-Hojas": str(len(trabajos))},
+                al_terminar=partial(shutil.rmtree, temp_dir, ignore_errors=True),
+                borrar=True
+            )
         
         # ================================================================
-        # 5. RETORNAR SEGÚN MODO
+        # 5. MODO INDIVIDUAL: PDFs EN PARALELO Y UN ZIP POR AULA
         # ================================================================
         
-        if modo_generacion == 'individual':
-            shutil.rmtree(temp_dir)
-            
-            return {
-                "success": True,
-                "modo": "individual",
-                "total_hojas": len(todos_los_pdfs),
-                "total_aulas": len(archivos_por_aula),
-                "archivos": archivos_por_aula,
-                "mensaje": f"Se regeneraron {len(archivos_por_aula)} archivos ZIP"
-            }
+        print(f"\n🖨️  Regenerando {len(trabajos)} PDFs...")
         
-        else:
-            print(f"\n📦 Creando ZIP único...")
-            
-            zip_buffer = BytesIO()
-            
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for pdf_file in todos_los_pdfs:
-                    arcname = os.path.relpath(pdf_file, temp_dir)
-                    zip_file.write(pdf_file, arcname)
-            
-            zip_buffer.seek(0)
-            zip_size = len(zip_buffer.getvalue())
+        todos_los_pdfs = await renderizar_hojas(trabajos)
+        
+        for aula_codigo, indices in indices_por_aula.items():
+            pdf_files_aula = [todos_los_pdfs[i] for i in indices]
             
-            shutil.rmtree(temp_dir)
+            print(f"✅ Aula {aula_codigo}: {len(pdf_files_aula)} hojas regeneradas")
             
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"hojas_regeneradas_{proceso}_{timestamp}.zip"
+            zip_filename = f"hojas_{aula_codigo}_{timestamp}.zip"
+            zip_path = os.path.join("uploads/hojas_generadas", zip_filename)
             
-            print(f"\n✅ ZIP único creado: {filename}")
-            print(f"   Tamaño: {zip_size / (1024*1024):.2f} MB\n")
+            escribir_zip(zip_path, [(pdf_file, os.path.basename(pdf_file)) for pdf_file in pdf_files_aula])
             
-            return StreamingResponse(
-                iter([zip_buffer.getvalue()]),
-                media_type="application/zip",
-                headers={
-                    "Content-Disposition": f"attachment; filename={filename}",
-                    "Content-Length": str(zip_size),
-                    "X-Total-Hojas": str(len(todos_los_pdfs)),
-                    "Cache-Control": "no-cache"
-                }
-            )
+            archivos_por_aula.append({
+                "aula": aula_codigo,
+                "cantidad": len(pdf_files_aula),
+                "archivo": zip_filename,
+                "url_descarga": f"/uploads/hojas_generadas/{zip_filename}",
+                "tamanio_mb": round(os.path.getsize(zip_path) / (1024*1024), 2)
+            })
+        
+        shutil.rmtree(temp_dir)
+        
+        return {
+            "success": True,
+            "modo": "individual",
+            "total_hojas": len(todos_los_pdfs),
+            "total_aulas": len(archivos_por_aula),
+            "archivos": archivos_por_aula,
+            "mensaje": f"Se regeneraron {len(archivos_por_aula)} archivos ZIP"
+        }
         
     except HTTPException:
         raise
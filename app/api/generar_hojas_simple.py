@@ -4,15 +4,14 @@ Versión actualizada: Genera para postulantes O genéricas
 """
 
 from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pydantic import BaseModel
 from datetime import datetime
-from io import BytesIO
+from functools import partial
 import tempfile
-import zipfile
 import os
 import shutil
 import secrets
@@ -20,6 +19,7 @@ import string
 
 from app.database import get_db
 from app.services.pdf_generator_simple import generar_hoja_generica
+from app.utils.zip_stream import respuesta_zip
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -220,29 +220,7 @@ async def generar_hojas_genericas_api(
                 todos_los_pdfs.append(filepath)
         
         # ================================================================
-        # CREAR ZIP
-        # ================================================================
-        
-        print(f"\n📦 Creando ZIP...")
-        print(f"   Total archivos: {len(todos_los_pdfs)}\n")
-        
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for pdf_file in todos_los_pdfs:
-                if os.path.exists(pdf_file):
-                    arcname = os.path.basename(pdf_file)
-                    zip_file.write(pdf_file, arcname)
-        
-        zip_buffer.seek(0)
-        zip_bytes = zip_buffer.read()
-        zip_size = len(zip_bytes)
-        
-        # Limpiar temporales
-        shutil.rmtree(temp_dir)
-        
-        # ================================================================
-        # RESPUESTA
+        # RESPUESTA: ZIP EN STREAMING (los temporales se borran al terminar)
         # ================================================================
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -252,17 +230,18 @@ async def generar_hojas_genericas_api(
         print(f"{'='*70}")
         print(f"✅ GENERACIÓN COMPLETADA")
         print(f"{'='*70}")
-        print(f"📦 ZIP: {zip_size / (1024*1024):.2f} MB")
+        print(f"📦 ZIP: {filename}")
         print(f"📝 Total hojas: {len(todos_los_pdfs)}")
         print(f"{'='*70}\n")
         
-        return StreamingResponse(
-            iter([zip_bytes]),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Length": str(zip_size)
-            }
+        return respuesta_zip(
+            [
+                (pdf_file, os.path.basename(pdf_file))
+                for pdf_file in todos_los_pdfs
+                if os.path.exists(pdf_file)
+            ],
+            filename,
+            al_terminar=partial(shutil.rmtree, temp_dir, ignore_errors=True)
         )
         
     except Exception as e:
@@ -6,11 +6,14 @@ Endpoints para revisar y corregir respuestas problemáticas manualmente.
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import bindparam, text
 from sqlalchemy.orm import Session
 import json
 
 from app.database import get_db
 from app.models import Respuesta, ClaveRespuesta
+from app.services.calificacion_service import actualizar_orden_merito
+from app.services.motor_calificacion import calificar_hojas, compactar_hojas
 
 router = APIRouter()
 
@@ -64,6 +67,10 @@ async def corregir_respuesta_individual(
         respuesta_correcta = respuestas_correctas.get(str(respuesta.numero_pregunta))
         respuesta.es_correcta = (respuesta_corregida == respuesta_correcta)
     
+    # Columnas compactas de la hoja al día con la corrección
+    db.flush()
+    compactar_hojas(db, [respuesta.hoja_respuesta_id])
+    
     db.commit()
     
     return {
@@ -88,53 +95,88 @@ async def corregir_respuestas_masivo(
     
     correcciones = data.get('correcciones', {})
     
-    # Obtener gabarito
-    gabarito = db.query(ClaveRespuesta).filter(
-        ClaveRespuesta.proceso_admision == "2025-2"
-    ).first()
-    
-    respuestas_correctas = {}
-    if gabarito:
-        respuestas_correctas = json.loads(gabarito.respuestas_json) if isinstance(gabarito.respuestas_json, str) else gabarito.respuestas_json
+    # Validar (solo A-E)
+    validas = {
+        int(respuesta_id): nueva_respuesta
+        for respuesta_id, nueva_respuesta in correcciones.items()
+        if nueva_respuesta in ['A', 'B', 'C', 'D', 'E']
+    }
     
-    corregidas = 0
-    
-    for respuesta_id, nueva_respuesta in correcciones.items():
-        # Validar
-        if nueva_respuesta not in ['A', 'B', 'C', 'D', 'E']:
-            continue
-        
-        # Obtener respuesta
-        respuesta = db.query(Respuesta).filter(Respuesta.id == int(respuesta_id)).first()
-        
-        if not respuesta:
-            continue
-        
-        # Guardar original
-        if not respuesta.observacion:
-            respuesta.observacion = f"Original: {respuesta.respuesta_marcada}"
-        else:
-            respuesta.observacion += f" | Corregido de: {respuesta.respuesta_marcada}"
-        
-        # Actualizar
-        respuesta.respuesta_marcada = nueva_respuesta
-        respuesta.requiere_revision = False
-        respuesta.confianza = 1.0
-        
-        # Verificar si es correcta
-        if respuestas_correctas:
-            respuesta_correcta = respuestas_correctas.get(str(respuesta.numero_pregunta))
-            respuesta.es_correcta = (nueva_respuesta == respuesta_correcta)
-        
-        corregidas += 1
+    if not validas:
+        return {
+            "success": True,
+            "message": "0 respuestas corregidas",
+            "corregidas": 0,
+            "hojas_recalificadas": 0
+        }
+    
+    # Obtener todas las respuestas (y su proceso) en una sola consulta
+    filas = db.execute(
+        text("""
+            SELECT r.id, r.hoja_respuesta_id, hr.proceso_admision
+            FROM respuestas r
+            JOIN hojas_respuestas hr ON hr.id = r.hoja_respuesta_id
+            WHERE r.id IN :ids
+        """).bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(validas)}
+    ).fetchall()
+    
+    if not filas:
+        return {
+            "success": True,
+            "message": "0 respuestas corregidas",
+            "corregidas": 0,
+            "hojas_recalificadas": 0
+        }
+    
+    # Aplicar todas las correcciones en un solo UPDATE (executemany)
+    db.execute(text("""
+        UPDATE respuestas
+        SET
+            observacion = CASE
+                WHEN observacion IS NULL OR observacion = '' THEN 'Original: ' || respuesta_marcada
+                ELSE observacion || ' | Corregido de: ' || respuesta_marcada
+            END,
+            respuesta_marcada = :nueva_respuesta,
+            requiere_revision = FALSE,
+            confianza = 1.0
+        WHERE id = :id
+    """), [{"id": f.id, "nueva_respuesta": validas[f.id]} for f in filas])
+    
+    # Recalificar SOLO las hojas afectadas (es_correcta, conteo y nota)
+    hojas_por_proceso = {}
+    for f in filas:
+        hojas_por_proceso.setdefault(f.proceso_admision, set()).add(f.hoja_respuesta_id)
+    
+    recalificadas = 0
+    procesos_recalificados = []
+    errores = []
+    
+    for proceso, hoja_ids in hojas_por_proceso.items():
+        try:
+            resultado = calificar_hojas(db, proceso, list(hoja_ids), estado=None)
+            recalificadas += len(resultado["resultados"])
+            procesos_recalificados.append(proceso)
+            errores.extend(resultado["errores"])
+            
+            # Las incompletas no pasan por el motor: solo se compactan
+            if resultado["errores"]:
+                compactar_hojas(db, [e["hoja_id"] for e in resultado["errores"]])
+        except ValueError as e:
+            # Sin gabarito todavía: se califica cuando se registre
+            errores.append({"proceso": proceso, "error": str(e)})
+            compactar_hojas(db, list(hoja_ids))
     
     db.commit()
     
-    # Recalcular notas de las hojas afectadas
-    # (opcional, se puede hacer después)
+    # Orden de mérito al día (sin recalificar todo el proceso)
+    for proceso in procesos_recalificados:
+        actualizar_orden_merito(proceso, db)
     
     return {
         "success": True,
-        "message": f"{corregidas} respuestas corregidas",
-        "corregidas": corregidas
-    }
\ No newline at end of file
+        "message": f"{len(filas)} respuestas corregidas",
+        "corregidas": len(filas),
+        "hojas_recalificadas": recalificadas,
+        "errores": errores
+    }
@@ -66,6 +66,41 @@ class Settings(BaseSettings):
     vision_fallback_enabled: bool = True
     vision_timeout: int = 30  # segundos
     vision_retry_attempts: int = 2
+    vision_max_workers: int = 8  # hilos para llamadas bloqueantes (upload Gemini, etc.)
+    vision_limite_gemini: int = 8  # requests concurrentes máximos por proveedor
+    vision_limite_claude: int = 4
+    vision_limite_openai: int = 4
+    imagenes_procesos: int = 2  # procesos para OpenCV (pre-procesamiento, OMR); 0 = usar hilos
+    vision_fallback_mosaico: bool = False  # si Gemini falla, Claude solo ve el DNI + cajas dudosas (usa OMR local)
+    vision_cache_habilitado: bool = True  # re-subir la misma foto no vuelve a llamar a la API
+    vision_cache_dir: str = "./uploads/cache_vision"
+    vision_cache_ttl_horas: int = 72
+    vision_cache_max_mb: int = 200
+
+    # ==============================================
+    # CAPTURA POR LOTES
+    # ==============================================
+    captura_workers: int = 6  # workers concurrentes de procesar_hoja_dividida
+    captura_lote_max_archivos: int = 500
+    captura_max_upload_mb: int = 25  # tamaño máximo de UNA foto (se procesa en memoria)
+    captura_lote_max_mb: int = 300  # total de un lote (subido y descomprimido), se vuelca a disco
+
+    # ==============================================
+    # OMR LOCAL (hoja genérica)
+    # ==============================================
+    omr_local_habilitado: bool = False  # leer respuestas con OpenCV antes que la Vision API
+    omr_confianza_minima: float = 0.4  # debajo de esto la caja se manda a la Vision API
+
+    # ==============================================
+    # GENERACIÓN DE HOJAS (PDF)
+    # ==============================================
+    pdf_procesos: int = 4  # procesos para renderizar PDFs con ReportLab; 0 = usar hilos
+
+    # ==============================================
+    # CALIFICACIÓN
+    # ==============================================
+    calificacion_lote_hojas: int = 500  # hojas por bloque (un commit por bloque) en calificación en segundo plano
+    gabarito_cache_revalidar_segundos: float = 5.0  # cada cuánto se compara la versión del gabarito en cache con la BD (0 = siempre)
     
     # ==============================================
     # DEMO
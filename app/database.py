@@ -3,7 +3,7 @@ Configuración de la base de datos
 SQLAlchemy setup para PostgreSQL en Railway
 """
 
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
@@ -14,6 +14,10 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# psycopg2: los executemany de UPDATE (calificación, correcciones) van en
+# lotes de 100 filas por viaje en lugar de uno por fila
+opciones_driver = {"executemany_mode": "values_plus_batch"} if settings.database_url.startswith("postgresql") else {}
+
 # Crear engine de SQLAlchemy
 engine = create_engine(
     settings.database_url,
@@ -22,7 +26,8 @@ engine = create_engine(
     max_overflow=10,
     pool_pre_ping=True,  # Verifica conexiones antes de usarlas
     pool_recycle=3600,   # Recicla conexiones cada hora
-    echo=settings.debug  # Log de queries SQL en modo debug
+    echo=settings.debug,  # Log de queries SQL en modo debug
+    **opciones_driver
 )
 
 # Session factory
@@ -76,6 +81,44 @@ def init_db():
     logger.info("✅ Base de datos inicializada correctamente")
 
 
+# Columnas de hojas_respuestas agregadas después de la creación de la tabla
+COLUMNAS_COMPACTAS = ("respuestas_compactas", "mascara_correctas")
+
+
+def agregar_columnas_faltantes():
+    """
+    create_all no altera tablas existentes: agrega a hojas_respuestas SOLO
+    las columnas compactas (COLUMNAS_COMPACTAS), nullable y sin tocar datos.
+    
+    Primero se consulta si faltan, así un arranque normal no toma el lock
+    del ALTER TABLE; en PostgreSQL el ALTER usa ADD COLUMN IF NOT EXISTS,
+    que es idempotente si varios workers arrancan a la vez.
+    
+    Los índices nuevos NO se crean aquí: van como migración explícita en
+    migrations/.
+    """
+    from app.models import HojaRespuesta
+    
+    tabla = HojaRespuesta.__table__
+    
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        
+        if not inspector.has_table(tabla.name):
+            return
+        
+        existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+        si_no_existe = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+        
+        for nombre in COLUMNAS_COMPACTAS:
+            if nombre in existentes:
+                continue
+            
+            tipo = tabla.c[nombre].type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {si_no_existe}{nombre} {tipo}"))
+            print(f"✅ Columna agregada: {tabla.name}.{nombre} ({tipo})")
+
+
 def check_db_connection() -> bool:
     try:
         with engine.connect() as conn:
@@ -19,7 +19,7 @@ from pathlib import Path
 from sqlalchemy.orm import Session
 from app.database import get_db
 
-from app.database import engine, Base
+from app.database import engine, Base, agregar_columnas_faltantes
 from app.config import settings
 
 from app.api.documento_oficial import router as documento_router
@@ -176,6 +176,40 @@ app.include_router(api_coordinador.router)
 
 app.include_router(resultados_publicos.router, tags=["resultados"])
 app.include_router(generar_hojas_simple.router, tags=["generacion"])
+
+# ============================================================================
+# CICLO DE VIDA: COLUMNAS NUEVAS Y POOL DE PROCESOS PARA OPENCV
+# ============================================================================
+
+@app.on_event("startup")
+async def actualizar_esquema():
+    """Columnas compactas de hojas_respuestas (ADD COLUMN IF NOT EXISTS)."""
+    try:
+        agregar_columnas_faltantes()
+    except Exception as e:
+        print(f"⚠️  No se pudieron agregar columnas nuevas: {e}")
+
+
+@app.on_event("startup")
+async def iniciar_pool_imagenes():
+    """Levanta los procesos de OpenCV antes de la primera captura."""
+    from app.services.pool_imagenes import calentar_pool
+    
+    try:
+        await calentar_pool()
+    except Exception as e:
+        print(f"⚠️  No se pudo iniciar el pool de imágenes: {e}")
+
+
+@app.on_event("shutdown")
+async def cerrar_pool_imagenes():
+    from app.services.pool_imagenes import cerrar_pool
+    from app.services.pool_pdf import cerrar_pool as cerrar_pool_pdf
+    
+    cerrar_pool()
+    cerrar_pool_pdf()
+
+
 # ============================================================================
 # HEALTH CHECK
 # ============================================================================
@@ -189,6 +223,8 @@ async def health_check():
     from app.database import SessionLocal
     from app.models import Postulante
     
+    from app.services.pool_imagenes import metricas_pool
+    
     db = SessionLocal()
     try:
         total_postulantes = db.query(Postulante).count()
@@ -198,7 +234,8 @@ async def health_check():
             "message": "POSTULANDO funcionando correctamente",
             "version": "2.0.0",
             "database": "connected",
-            "postulantes": total_postulantes
+            "postulantes": total_postulantes,
+            "pool_imagenes": metricas_pool()
         }
     except Exception as e:
         return {
@@ -3,7 +3,7 @@ Modelo de Hoja de Respuesta
 Almacena metadata sobre las fotos capturadas de las hojas de respuestas
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, Text, LargeBinary, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from sqlalchemy.sql import func
@@ -62,6 +62,11 @@ class HojaRespuesta(Base):
     nota_final = Column(Float)
     respuestas_correctas_count = Column(Integer, default=0)
     
+    # Respuestas empaquetadas (una fila por hoja para lecturas masivas;
+    # la tabla respuestas queda como detalle). Ver motor_calificacion.
+    respuestas_compactas = Column(String(100))   # 'AB-C?...': '-' en blanco, '?' no legible
+    mascara_correctas = Column(LargeBinary)      # 13 bytes, bit i = pregunta i+1 correcta
+    
     # Observaciones
     observaciones = Column(Text)
     
@@ -3,7 +3,7 @@
 # Agregar a app/models.py
 # ============================================================================
 
-from sqlalchemy import Column, Integer, String, Boolean, Numeric, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, Numeric, ForeignKey, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.database import Base
@@ -20,6 +20,12 @@ class Respuesta(Base):
     
     __tablename__ = "respuestas"
     
+    # La calificación actualiza por (hoja, pregunta). En BD existentes se
+    # crea con migrations/001_ix_respuestas_hoja_pregunta.sql
+    __table_args__ = (
+        Index("ix_respuestas_hoja_pregunta", "hoja_respuesta_id", "numero_pregunta"),
+    )
+    
     id = Column(Integer, primary_key=True, index=True)
     hoja_respuesta_id = Column(Integer, ForeignKey("hojas_respuestas.id"), nullable=False, index=True)
     numero_pregunta = Column(Integer, nullable=False)  # 1-100
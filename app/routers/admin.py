@@ -22,7 +22,8 @@ import json
 
 from app.database import get_db
 #from app.services.calificacion import CalificacionService
-from app.services.calificacion_service import calificar_hojas_pendientes
+from app.services.cache_gabarito import invalidar_clave
+from app.services.trabajos_calificacion import iniciar_calificacion, obtener_estado_trabajo, reanudar_trabajo
 from app.services.auth_admin import (
     verificar_sesion_admin,
     crear_sesion_admin,
@@ -538,6 +539,7 @@ async def guardar_gabarito(
     })
     
     db.commit()
+    invalidar_clave(request.proceso)
     
     return {"success": True, "message": "Gabarito guardado correctamente"}
 
@@ -632,20 +634,53 @@ async def api_ejecutar_calificacion(
         if gabarito.total != 100:
             return JSONResponse({"success": False, "error": "Gabarito incompleto"})
         
-        # Ejecutar calificación
-        #servicio = CalificacionService(db)
-        #resultado = servicio.calificar_todas_las_hojas(proceso)
-        resultado = calificar_hojas_pendientes(proceso, db)
+        # Ejecutar calificación en segundo plano (progreso por polling)
+        trabajo_id = iniciar_calificacion(proceso)
         
         return JSONResponse({
             "success": True,
-            "calificadas": resultado.get("calificadas", 0),
-            "promedio": resultado.get("estadisticas", {}).get("nota_promedio", 0)
+            "trabajo_id": trabajo_id,
+            "estado_url": f"/admin/api/calificacion/trabajos/{trabajo_id}"
         })
     except Exception as e:
         return JSONResponse({"success": False, "error": str(e)})
 
 
+@router.get("/api/calificacion/trabajos/{trabajo_id}")
+async def api_estado_calificacion(
+    trabajo_id: str,
+    usuario: dict = Depends(obtener_usuario_actual)
+):
+    """Progreso de la calificación (hojas hechas, velocidad, ETA)"""
+    estado = obtener_estado_trabajo(trabajo_id)
+    
+    if not estado:
+        return JSONResponse({"success": False, "error": "Trabajo de calificación no encontrado"}, status_code=404)
+    
+    return JSONResponse({"success": True, **estado})
+
+
+@router.post("/api/calificacion/trabajos/{trabajo_id}/reanudar")
+async def api_reanudar_calificacion(
+    trabajo_id: str,
+    usuario: dict = Depends(obtener_usuario_actual)
+):
+    """Reanudar una calificación interrumpida (solo las hojas que faltan)"""
+    if usuario.get('rol') not in ['DIRECTOR', 'COORDINADOR']:
+        raise HTTPException(status_code=403, detail="No tiene permisos para esta acción")
+    
+    nuevo_id = reanudar_trabajo(trabajo_id)
+    
+    if not nuevo_id:
+        return JSONResponse({"success": False, "error": "Trabajo de calificación no encontrado"}, status_code=404)
+    
+    return JSONResponse({
+        "success": True,
+        "trabajo_id": nuevo_id,
+        "estado_url": f"/admin/api/calificacion/trabajos/{nuevo_id}"
+    })
+
+
 @router.post("/api/publicar")
 async def api_publicar_resultados(
     request: Request,
@@ -846,19 +881,16 @@ async def resultados_page(
     # ========================================================================
     # ESTADÍSTICAS ADICIONALES (RESPUESTAS)
     # ========================================================================
+    # Una fila por hoja (respuestas_compactas) en lugar de 100 filas
     stats_respuestas = db.execute(text("""
         SELECT 
-            COUNT(*) as total_respuestas,
-            COUNT(CASE WHEN respuesta_marcada IS NOT NULL 
-                       AND respuesta_marcada IN ('A','B','C','D','E') 
-                  THEN 1 END) as respuestas_validas,
-            COUNT(CASE WHEN respuesta_marcada IS NULL 
-                       OR respuesta_marcada = '' 
-                  THEN 1 END) as respuestas_vacias
-        FROM respuestas r
-        JOIN hojas_respuestas h ON r.hoja_respuesta_id = h.id
+            SUM(LENGTH(h.respuestas_compactas)) as total_respuestas,
+            SUM(LENGTH(TRANSLATE(h.respuestas_compactas, '-?', ''))) as respuestas_validas,
+            SUM(LENGTH(h.respuestas_compactas) - LENGTH(REPLACE(h.respuestas_compactas, '-', ''))) as respuestas_vacias
+        FROM hojas_respuestas h
         WHERE h.proceso_admision = :proceso
           AND h.estado IN ('completado', 'calificado')  -- ← SOLO CAPTURADAS
+          AND h.respuestas_compactas IS NOT NULL
     """), {"proceso": proceso}).fetchone()
     
     nota_corte = 55
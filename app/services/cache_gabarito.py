@@ -0,0 +1,92 @@
+"""
+Cache de Gabaritos - Claves de respuestas en memoria por proceso
+app/services/cache_gabarito.py
+
+La clave de un proceso cambia un par de veces en todo el proceso, pero se lee
+en cada hoja capturada y en cada calificación. Aquí se guarda en memoria:
+
+- Valor: tupla congelada de 100 letras (None = pregunta sin clave).
+- Versión: huella barata de clave_respuestas del proceso (filas, id máximo y
+  última modificación). Con varios workers, cada uno compara su versión con
+  la BD como máximo cada settings.gabarito_cache_revalidar_segundos: una
+  consulta agregada en lugar de releer la clave.
+- Invalidación explícita: los endpoints que escriben la clave llaman a
+  invalidar_clave(proceso) después del commit.
+
+IMPORTANTE: dentro de una transacción que modifica la clave (sin commit) hay
+que leerla directo de la BD (motor_calificacion.cargar_clave), no de aquí.
+"""
+
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+
+TOTAL_PREGUNTAS = 100
+
+_claves: Dict[str, Dict] = {}
+
+
+def version_clave(db: Session, proceso: str) -> str:
+    """Huella de la clave del proceso: cambia con cada INSERT, DELETE o UPDATE."""
+    fila = db.execute(text("""
+        SELECT
+            COUNT(*) AS total,
+            COALESCE(MAX(id), 0) AS max_id,
+            MAX(COALESCE(updated_at, created_at)) AS modificado
+        FROM clave_respuestas
+        WHERE proceso_admision = :proceso
+    """), {"proceso": proceso}).fetchone()
+
+    return f"{fila.total}-{fila.max_id}-{fila.modificado}"
+
+
+def obtener_clave(db: Session, proceso: str) -> Tuple[Optional[str], ...]:
+    """
+    Clave del proceso como tupla de 100 letras en mayúscula (índice 0 =
+    pregunta 1). Sin consultas mientras la entrada esté vigente.
+    """
+    ahora = time.monotonic()
+    entrada = _claves.get(proceso)
+
+    if entrada and ahora - entrada["verificado_at"] < settings.gabarito_cache_revalidar_segundos:
+        return entrada["clave"]
+
+    # La versión se lee ANTES que la clave: si alguien la cambia en medio,
+    # la entrada queda con la versión vieja y se recarga en la próxima revisión
+    version = version_clave(db, proceso)
+
+    if entrada and entrada["version"] == version:
+        entrada["verificado_at"] = ahora
+        return entrada["clave"]
+
+    filas = db.execute(text("""
+        SELECT numero_pregunta, respuesta_correcta
+        FROM clave_respuestas
+        WHERE proceso_admision = :proceso
+    """), {"proceso": proceso}).fetchall()
+
+    letras = [None] * TOTAL_PREGUNTAS
+    for f in filas:
+        if 1 <= f.numero_pregunta <= TOTAL_PREGUNTAS and f.respuesta_correcta:
+            letras[f.numero_pregunta - 1] = f.respuesta_correcta.strip().upper()
+
+    clave = tuple(letras)
+    _claves[proceso] = {"version": version, "clave": clave, "verificado_at": ahora}
+
+    if entrada:
+        print(f"🔄 Gabarito {proceso} recargado (versión {version})")
+
+    return clave
+
+
+def invalidar_clave(proceso: Optional[str] = None):
+    """Descarta la clave del proceso (o todas) en este worker."""
+    if proceso is None:
+        _claves.clear()
+    else:
+        _claves.pop(proceso, None)
@@ -0,0 +1,157 @@
+"""
+Cache de Vision - Resultados de extracción por contenido de imagen
+app/services/cache_vision.py
+
+Cuando el operador vuelve a subir la MISMA foto (DNI_INCOMPLETO, DNI duplicado,
+corrección con dni_manual...) no tiene sentido pagar otra llamada a Gemini.
+
+- Clave: SHA-256 de los bytes de la imagen + versión del extractor
+  (prompt/schema/layout). Cambiar la versión invalida todo lo anterior.
+- Valor: el resultado COMPLETO de la extracción (solo los exitosos).
+- Persistente: un JSON por entrada en settings.vision_cache_dir, así que
+  sobrevive a reinicios del servidor.
+- Expulsión: por antigüedad (settings.vision_cache_ttl_horas) y por tamaño
+  total (settings.vision_cache_max_mb, se borran las más antiguas primero).
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiofiles
+
+from app.config import settings
+from app.services.vision_async import ejecutar_bloqueante, leer_imagen_bytes
+
+
+def _directorio() -> Path:
+    directorio = Path(settings.vision_cache_dir)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def calcular_clave(imagen_bytes: bytes, version: str) -> str:
+    """SHA-256 de versión + bytes de la imagen."""
+    h = hashlib.sha256()
+    h.update(version.encode("utf-8"))
+    h.update(b"\0")
+    h.update(imagen_bytes)
+    return h.hexdigest()
+
+
+async def obtener(clave: str) -> Optional[Dict]:
+    """Resultado guardado para la clave, o None si no existe o expiró."""
+    ruta = _directorio() / f"{clave}.json"
+
+    try:
+        edad = time.time() - ruta.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+    if edad > settings.vision_cache_ttl_horas * 3600:
+        ruta.unlink(missing_ok=True)
+        return None
+
+    try:
+        async with aiofiles.open(ruta, "r", encoding="utf-8") as f:
+            return json.loads(await f.read())
+    except (OSError, ValueError):
+        # Entrada corrupta o borrada en paralelo: tratar como miss
+        return None
+
+
+async def guardar(clave: str, resultado: Dict):
+    """Guarda el resultado y aplica la expulsión por TTL/tamaño."""
+    ruta = _directorio() / f"{clave}.json"
+    temporal = ruta.with_suffix(".tmp")
+
+    contenido = json.dumps(resultado, ensure_ascii=False, default=str)
+
+    async with aiofiles.open(temporal, "w", encoding="utf-8") as f:
+        await f.write(contenido)
+
+    os.replace(temporal, ruta)
+
+    await ejecutar_bloqueante(_expulsar)
+
+
+def _expulsar():
+    """Borra entradas expiradas y, si se excede el tamaño máximo, las más antiguas."""
+    limite_edad = time.time() - settings.vision_cache_ttl_horas * 3600
+    limite_bytes = settings.vision_cache_max_mb * 1024 * 1024
+
+    entradas = []
+    total = 0
+
+    with os.scandir(_directorio()) as it:
+        for entrada in it:
+            if not entrada.name.endswith(".json"):
+                continue
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+
+            if info.st_mtime < limite_edad:
+                Path(entrada.path).unlink(missing_ok=True)
+                continue
+
+            entradas.append((info.st_mtime, info.st_size, entrada.path))
+            total += info.st_size
+
+    if total <= limite_bytes:
+        return
+
+    entradas.sort()
+    for _, tamano, ruta in entradas:
+        if total <= limite_bytes:
+            break
+        Path(ruta).unlink(missing_ok=True)
+        total -= tamano
+
+
+async def con_cache(
+    imagen_path: str,
+    version: str,
+    procesar: Callable[[str, Optional[bytes]], Awaitable[Dict]],
+    imagen_bytes: Optional[bytes] = None
+) -> Dict:
+    """
+    Ejecuta procesar(imagen_path, imagen_bytes) salvo que la misma imagen
+    (mismos bytes) ya se haya procesado con la misma versión. Agrega
+    "cache_hit" al resultado.
+
+    Los bytes leídos para calcular la clave se pasan a procesar, así la
+    imagen no se vuelve a leer de disco.
+
+    Uso:
+        return await con_cache(imagen_path, VERSION_EXTRACTOR, _procesar_sin_cache)
+    """
+    if not settings.vision_cache_habilitado:
+        return await procesar(imagen_path, imagen_bytes)
+
+    if imagen_bytes is None:
+        imagen_bytes = await leer_imagen_bytes(imagen_path)
+
+    clave = calcular_clave(imagen_bytes, version)
+
+    cacheado = await obtener(clave)
+    if cacheado is not None:
+        print(f"⚡ Resultado de Vision desde cache ({clave[:12]}) - sin llamada a la API")
+        cacheado["cache_hit"] = True
+        return cacheado
+
+    resultado = await procesar(imagen_path, imagen_bytes)
+
+    if resultado.get("success"):
+        try:
+            await guardar(clave, resultado)
+        except Exception as e:
+            # El cache nunca debe romper la captura
+            print(f"⚠️  No se pudo guardar en cache de Vision: {e}")
+
+    resultado["cache_hit"] = False
+    return resultado
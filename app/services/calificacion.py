@@ -15,6 +15,17 @@ from typing import Dict, List, Optional
 from datetime import datetime
 import time
 
+from app.services.cache_gabarito import obtener_clave
+from app.services.motor_calificacion import (
+    BLANCO,
+    CODIGOS,
+    NOTA_MAXIMA,
+    TOTAL_PREGUNTAS,
+    calificar_hojas,
+    cargar_compactas,
+    compactar_pendientes
+)
+
 
 class CalificacionService:
     """Servicio para calificación de hojas de respuesta"""
@@ -45,71 +56,12 @@ class CalificacionService:
         if len(gabarito) != 100:
             raise ValueError(f"Gabarito incompleto: {len(gabarito)} respuestas (se requieren 100)")
         
-        # Obtener respuestas del postulante
-        respuestas = self.db.execute(text("""
-            SELECT id, numero_pregunta, respuesta_marcada
-            FROM respuestas
-            WHERE hoja_respuesta_id = :hoja_id
-            ORDER BY numero_pregunta
-        """), {"hoja_id": hoja_id}).fetchall()
+        resultado = self._calificar_con_motor(proceso, [hoja_id])
         
-        if not respuestas:
-            raise ValueError(f"No hay respuestas para la hoja {hoja_id}")
+        if resultado["errores"]:
+            raise ValueError(resultado["errores"][0]["error"])
         
-        # Comparar y calificar
-        correctas = 0
-        incorrectas = 0
-        en_blanco = 0
-        
-        for resp in respuestas:
-            respuesta_correcta = gabarito.get(resp.numero_pregunta)
-            respuesta_marcada = (resp.respuesta_marcada or "").strip().upper()
-            
-            if not respuesta_marcada:
-                # En blanco
-                es_correcta = False
-                en_blanco += 1
-            elif respuesta_marcada == respuesta_correcta:
-                # Correcta
-                es_correcta = True
-                correctas += 1
-            else:
-                # Incorrecta
-                es_correcta = False
-                incorrectas += 1
-            
-            # Actualizar el campo es_correcta en la tabla respuestas
-            self.db.execute(text("""
-                UPDATE respuestas
-                SET es_correcta = :es_correcta
-                WHERE id = :id
-            """), {"es_correcta": es_correcta, "id": resp.id})
-        
-        # Calcular nota (fórmula: +1 por correcta, 0 por incorrecta/blanco)
-        nota_final = float(correctas)
-        
-        # Actualizar hoja de respuesta
-        self.db.execute(text("""
-            UPDATE hojas_respuestas
-            SET 
-                respuestas_correctas_count = :correctas,
-                nota_final = :nota,
-                fecha_calificacion = NOW(),
-                updated_at = NOW()
-            WHERE id = :hoja_id
-        """), {
-            "correctas": correctas,
-            "nota": nota_final,
-            "hoja_id": hoja_id
-        })
-        
-        return {
-            "hoja_id": hoja_id,
-            "correctas": correctas,
-            "incorrectas": incorrectas,
-            "en_blanco": en_blanco,
-            "nota_final": nota_final
-        }
+        return resultado["resultados"][0]
     
     def calificar_todas_las_hojas(self, proceso: str) -> Dict:
         """
@@ -140,26 +92,13 @@ class CalificacionService:
         if not hojas:
             raise ValueError(f"No hay hojas procesadas para el proceso {proceso}")
         
-        # Calificar cada hoja
-        total_hojas = 0
-        suma_notas = 0
-        nota_maxima = 0
-        nota_minima = 100
-        errores = []
-        
-        for hoja in hojas:
-            try:
-                resultado = self.calificar_hoja(hoja.id, proceso)
-                total_hojas += 1
-                suma_notas += resultado["nota_final"]
-                
-                if resultado["nota_final"] > nota_maxima:
-                    nota_maxima = resultado["nota_final"]
-                if resultado["nota_final"] < nota_minima:
-                    nota_minima = resultado["nota_final"]
-                    
-            except Exception as e:
-                errores.append({"hoja_id": hoja.id, "error": str(e)})
+        # Calificar TODO el proceso en bloque (en lugar de hoja por hoja)
+        resultado = self._calificar_con_motor(proceso, [hoja.id for hoja in hojas])
+        resultados = resultado["resultados"]
+        errores = resultado["errores"]
+        
+        # Hojas sin columnas compactas (capturadas antes de existir)
+        compactar_pendientes(self.db, proceso)
         
         # Commit de todos los cambios
         self.db.commit()
@@ -167,15 +106,17 @@ class CalificacionService:
         fin = time.time()
         tiempo_segundos = fin - inicio
         
-        promedio = suma_notas / total_hojas if total_hojas > 0 else 0
+        total_hojas = len(resultados)
+        notas = [r["nota_final"] for r in resultados]
+        promedio = sum(notas) / total_hojas if total_hojas > 0 else 0
         
         return {
             "total_hojas": total_hojas,
             "hojas_con_error": len(errores),
             "errores": errores if errores else None,
             "promedio_nota": round(promedio, 2),
-            "nota_maxima": nota_maxima,
-            "nota_minima": nota_minima if total_hojas > 0 else 0,
+            "nota_maxima": max(notas) if notas else 0,
+            "nota_minima": min(notas) if notas else 0,
             "tiempo_segundos": round(tiempo_segundos, 2)
         }
     
@@ -292,18 +233,21 @@ class CalificacionService:
             WHERE proceso_admision = :proceso
         """), {"proceso": proceso}).fetchone()
         
-        # Distribución por rangos
+        # Distribución por rangos (porcentaje de la nota máxima)
         distribucion = self.db.execute(text("""
             SELECT 
-                COUNT(CASE WHEN nota_final >= 90 THEN 1 END) as rango_90_100,
-                COUNT(CASE WHEN nota_final >= 80 AND nota_final < 90 THEN 1 END) as rango_80_89,
-                COUNT(CASE WHEN nota_final >= 70 AND nota_final < 80 THEN 1 END) as rango_70_79,
-                COUNT(CASE WHEN nota_final >= 60 AND nota_final < 70 THEN 1 END) as rango_60_69,
-                COUNT(CASE WHEN nota_final >= 50 AND nota_final < 60 THEN 1 END) as rango_50_59,
-                COUNT(CASE WHEN nota_final < 50 THEN 1 END) as rango_menos_50
-            FROM hojas_respuestas
-            WHERE proceso_admision = :proceso AND nota_final IS NOT NULL
-        """), {"proceso": proceso}).fetchone()
+                COUNT(CASE WHEN porcentaje >= 90 THEN 1 END) as rango_90_100,
+                COUNT(CASE WHEN porcentaje >= 80 AND porcentaje < 90 THEN 1 END) as rango_80_89,
+                COUNT(CASE WHEN porcentaje >= 70 AND porcentaje < 80 THEN 1 END) as rango_70_79,
+                COUNT(CASE WHEN porcentaje >= 60 AND porcentaje < 70 THEN 1 END) as rango_60_69,
+                COUNT(CASE WHEN porcentaje >= 50 AND porcentaje < 60 THEN 1 END) as rango_50_59,
+                COUNT(CASE WHEN porcentaje < 50 THEN 1 END) as rango_menos_50
+            FROM (
+                SELECT nota_final * 100.0 / :nota_maxima AS porcentaje
+                FROM hojas_respuestas
+                WHERE proceso_admision = :proceso AND nota_final IS NOT NULL
+            ) notas
+        """), {"proceso": proceso, "nota_maxima": NOTA_MAXIMA}).fetchone()
         
         # Estadísticas por programa
         por_programa = self.db.execute(text("""
@@ -364,60 +308,77 @@ class CalificacionService:
             Lista con análisis de cada pregunta
         """
         
-        result = self.db.execute(text("""
-            SELECT 
-                r.numero_pregunta,
-                cr.respuesta_correcta,
-                COUNT(*) as total_respuestas,
-                COUNT(CASE WHEN r.respuesta_marcada = 'A' THEN 1 END) as marcaron_a,
-                COUNT(CASE WHEN r.respuesta_marcada = 'B' THEN 1 END) as marcaron_b,
-                COUNT(CASE WHEN r.respuesta_marcada = 'C' THEN 1 END) as marcaron_c,
-                COUNT(CASE WHEN r.respuesta_marcada = 'D' THEN 1 END) as marcaron_d,
-                COUNT(CASE WHEN r.respuesta_marcada = 'E' THEN 1 END) as marcaron_e,
-                COUNT(CASE WHEN r.respuesta_marcada IS NULL OR r.respuesta_marcada = '' THEN 1 END) as en_blanco,
-                COUNT(CASE WHEN r.es_correcta = TRUE THEN 1 END) as acertaron,
-                ROUND(COUNT(CASE WHEN r.es_correcta = TRUE THEN 1 END) * 100.0 / NULLIF(COUNT(*), 0), 2) as porcentaje_acierto
-            FROM respuestas r
-            JOIN hojas_respuestas hr ON hr.id = r.hoja_respuesta_id
-            LEFT JOIN clave_respuestas cr ON cr.numero_pregunta = r.numero_pregunta 
-                                           AND cr.proceso_admision = :proceso
-            WHERE hr.proceso_admision = :proceso
-            GROUP BY r.numero_pregunta, cr.respuesta_correcta
-            ORDER BY r.numero_pregunta
-        """), {"proceso": proceso}).fetchall()
+        # Una fila por hoja (respuestas_compactas) en lugar de 100; las hojas
+        # antiguas se compactan al calificar el proceso
+        _, matriz, es_correcta = cargar_compactas(self.db, proceso)
         
-        return [
-            {
-                "numero": r.numero_pregunta,
-                "respuesta_correcta": r.respuesta_correcta,
-                "total_respuestas": r.total_respuestas,
+        if len(matriz) == 0:
+            return []
+        
+        clave = obtener_clave(self.db, proceso)
+        total = len(matriz)
+        por_letra = {letra: (matriz == codigo).sum(axis=0) for letra, codigo in CODIGOS.items()}
+        en_blanco = (matriz == BLANCO).sum(axis=0)
+        acertaron = es_correcta.sum(axis=0)
+        
+        analisis = []
+        for i in range(TOTAL_PREGUNTAS):
+            porcentaje = round(float(acertaron[i]) * 100 / total, 2)
+            
+            analisis.append({
+                "numero": i + 1,
+                "respuesta_correcta": clave[i],
+                "total_respuestas": total,
                 "distribucion": {
-                    "A": r.marcaron_a,
-                    "B": r.marcaron_b,
-                    "C": r.marcaron_c,
-                    "D": r.marcaron_d,
-                    "E": r.marcaron_e,
-                    "Blanco": r.en_blanco
+                    "A": int(por_letra["A"][i]),
+                    "B": int(por_letra["B"][i]),
+                    "C": int(por_letra["C"][i]),
+                    "D": int(por_letra["D"][i]),
+                    "E": int(por_letra["E"][i]),
+                    "Blanco": int(en_blanco[i])
                 },
-                "acertaron": r.acertaron,
-                "porcentaje_acierto": float(r.porcentaje_acierto) if r.porcentaje_acierto else 0,
-                "dificultad": self._clasificar_dificultad(r.porcentaje_acierto)
+                "acertaron": int(acertaron[i]),
+                "porcentaje_acierto": porcentaje,
+                "dificultad": self._clasificar_dificultad(porcentaje)
+            })
+        
+        return analisis
+    
+    def _calificar_con_motor(self, proceso: str, hoja_ids: List[int]) -> Dict:
+        """
+        Califica con el motor matricial (sin commit), en la misma escala
+        vigesimal que el resto de la aplicación, sin cambiar el estado de la
+        hoja ni la tabla calificaciones.
+        """
+        resultado = calificar_hojas(
+            self.db,
+            proceso,
+            hoja_ids,
+            estado=None,
+            actualizar_calificaciones=False
+        )
+        
+        resultado["resultados"] = [
+            {
+                "hoja_id": r["hoja_id"],
+                "correctas": r["correctas"],
+                "incorrectas": r["incorrectas"] + r["no_legibles"],
+                "en_blanco": r["en_blanco"],
+                "nota_final": r["nota_final"]
             }
-            for r in result
+            for r in resultado["resultados"]
         ]
+        
+        return resultado
     
     def _obtener_gabarito(self, proceso: str) -> Dict[int, str]:
         """
         Obtiene el gabarito como diccionario {numero_pregunta: respuesta_correcta}
+        (desde el cache de gabaritos)
         """
-        result = self.db.execute(text("""
-            SELECT numero_pregunta, respuesta_correcta
-            FROM clave_respuestas
-            WHERE proceso_admision = :proceso
-            ORDER BY numero_pregunta
-        """), {"proceso": proceso}).fetchall()
+        clave = obtener_clave(self.db, proceso)
         
-        return {r.numero_pregunta: r.respuesta_correcta.upper() for r in result}
+        return {numero: letra for numero, letra in enumerate(clave, start=1) if letra}
     
     def _clasificar_dificultad(self, porcentaje: float) -> str:
         """Clasifica la dificultad de una pregunta según el porcentaje de acierto"""
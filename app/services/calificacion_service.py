@@ -18,29 +18,29 @@ from app.models import (
     Calificacion,
     Postulante
 )
+from app.services.cache_gabarito import obtener_clave
+from app.services.motor_calificacion import calificar_hoja, calificar_hojas, clave_desde_dict
 
 
 def obtener_gabarito(proceso_admision: str, db: Session) -> Optional[Dict[str, str]]:
     """
-    Obtiene el gabarito oficial para un proceso de admisión.
+    Obtiene el gabarito oficial para un proceso de admisión (desde el cache
+    de gabaritos, sin consulta mientras esté vigente).
     
     Returns:
         Dict con {numero_pregunta: respuesta_correcta}
         Ej: {"1": "A", "2": "B", ...}
     """
     
-    claves = db.query(ClaveRespuesta).filter(
-        ClaveRespuesta.proceso_admision == proceso_admision
-    ).order_by(ClaveRespuesta.numero_pregunta).all()
+    clave = obtener_clave(db, proceso_admision)
     
-    if not claves:
-        return None
-    
-    gabarito = {}
-    for clave in claves:
-        gabarito[str(clave.numero_pregunta)] = clave.respuesta_correcta.upper()
+    gabarito = {
+        str(numero): letra
+        for numero, letra in enumerate(clave, start=1)
+        if letra
+    }
     
-    return gabarito
+    return gabarito or None
 
 
 def calificar_hoja_individual(
@@ -66,97 +66,13 @@ def calificar_hoja_individual(
     if not hoja:
         raise ValueError(f"Hoja {hoja_id} no encontrada")
     
-    # Obtener respuestas
-    respuestas = db.query(Respuesta).filter(
-        Respuesta.hoja_respuesta_id == hoja_id
-    ).order_by(Respuesta.numero_pregunta).all()
-    
-    if not respuestas or len(respuestas) != 100:
-        raise ValueError(f"La hoja {hoja_id} no tiene 100 respuestas")
-    
-    # Contadores
-    correctas = 0
-    incorrectas = 0
-    en_blanco = 0
-    invalidas = 0
-    
-    # Calificar cada respuesta
-    for respuesta in respuestas:
-        num_pregunta = str(respuesta.numero_pregunta)
-        respuesta_correcta = gabarito.get(num_pregunta)
-        
-        if not respuesta_correcta:
-            continue  # Pregunta no está en gabarito
-        
-        respuesta_marcada = respuesta.respuesta_marcada.strip().upper()
-        
-        # Clasificar respuesta
-        if respuesta_marcada == "":
-            # Vacía
-            en_blanco += 1
-            respuesta.es_correcta = False
-        elif respuesta_marcada in ['A', 'B', 'C', 'D', 'E']:
-            # Válida
-            if respuesta_marcada == respuesta_correcta:
-                correctas += 1
-                respuesta.es_correcta = True
-            else:
-                incorrectas += 1
-                respuesta.es_correcta = False
-        else:
-            # Inválida (?, GARABATO, MULTIPLE, etc.)
-            invalidas += 1
-            respuesta.es_correcta = False
-    
-    # Calcular nota
-    total_preguntas = len(respuestas)
-    porcentaje = (correctas / total_preguntas) * 100 if total_preguntas > 0 else 0
-    
-    # Sistema vigesimal peruano (0-20)
-    nota_vigesimal = (correctas / total_preguntas) * 20 if total_preguntas > 0 else 0
-    nota_vigesimal = round(nota_vigesimal, 2)
-    
-    # Nota mínima de aprobación (generalmente 10.5 en Perú)
-    nota_minima = 10.5
-    aprobado = nota_vigesimal >= nota_minima
-    
-    # Actualizar hoja
-    hoja.nota_final = nota_vigesimal
-    hoja.respuestas_correctas_count = correctas
-    hoja.estado = "calificado"
-    hoja.fecha_calificacion = datetime.now()
-    
-    # Actualizar o crear calificación
-    calificacion = db.query(Calificacion).filter(
-        Calificacion.postulante_id == hoja.postulante_id
-    ).first()
-    
-    if calificacion:
-        # Actualizar existente
-        calificacion.nota = int(nota_vigesimal)
-        calificacion.correctas = correctas
-        calificacion.incorrectas = incorrectas
-        calificacion.en_blanco = en_blanco
-        calificacion.no_legibles = invalidas
-        calificacion.porcentaje_aciertos = round(porcentaje, 2)
-        calificacion.aprobado = aprobado
-        calificacion.nota_minima = int(nota_minima)
-        calificacion.calificado_at = datetime.now()
-    else:
-        # Crear nueva
-        calificacion = Calificacion(
-            postulante_id=hoja.postulante_id,
-            nota=int(nota_vigesimal),
-            correctas=correctas,
-            incorrectas=incorrectas,
-            en_blanco=en_blanco,
-            no_legibles=invalidas,
-            porcentaje_aciertos=round(porcentaje, 2),
-            aprobado=aprobado,
-            nota_minima=int(nota_minima),
-            calificado_at=datetime.now()
-        )
-        db.add(calificacion)
+    # Mismo motor que la calificación masiva (N = 1)
+    r = calificar_hoja(
+        db,
+        hoja_id,
+        proceso=hoja.proceso_admision,
+        clave=clave_desde_dict(gabarito)
+    )
     
     # Commit
     db.commit()
@@ -165,14 +81,14 @@ def calificar_hoja_individual(
         "hoja_id": hoja_id,
         "codigo_hoja": hoja.codigo_hoja,
         "postulante_id": hoja.postulante_id,
-        "nota_final": nota_vigesimal,
-        "correctas": correctas,
-        "incorrectas": incorrectas,
-        "en_blanco": en_blanco,
-        "invalidas": invalidas,
-        "total": total_preguntas,
-        "porcentaje": round(porcentaje, 2),
-        "aprobado": aprobado
+        "nota_final": r["nota_final"],
+        "correctas": r["correctas"],
+        "incorrectas": r["incorrectas"],
+        "en_blanco": r["en_blanco"],
+        "invalidas": r["no_legibles"],
+        "total": r["total"],
+        "porcentaje": r["porcentaje"],
+        "aprobado": r["aprobado"]
     }
 
 
@@ -229,29 +145,41 @@ def calificar_hojas_pendientes(
     print(f"📋 Hojas pendientes: {len(hojas_pendientes)}")
     print("="*70)
     
-    # Calificar cada hoja
+    # Calificar todas las hojas a la vez (matriz NumPy, sin bucle por respuesta)
+    codigos = {hoja.id: hoja.codigo_hoja for hoja in hojas_pendientes}
+    
+    calificacion = calificar_hojas(
+        db,
+        proceso_admision,
+        list(codigos),
+        clave=clave_desde_dict(gabarito)
+    )
+    
     resultados = []
-    errores = []
-    
-    for i, hoja in enumerate(hojas_pendientes, 1):
-        try:
-            print(f"\n[{i}/{len(hojas_pendientes)}] Calificando hoja {hoja.codigo_hoja}...")
-            
-            resultado = calificar_hoja_individual(hoja.id, gabarito, db)
-            resultados.append(resultado)
-            
-            print(f"✅ Nota: {resultado['nota_final']}/20")
-            print(f"   Correctas: {resultado['correctas']}, "
-                  f"Incorrectas: {resultado['incorrectas']}, "
-                  f"En blanco: {resultado['en_blanco']}")
-            
-        except Exception as e:
-            print(f"❌ Error: {str(e)}")
-            errores.append({
-                "hoja_id": hoja.id,
-                "codigo_hoja": hoja.codigo_hoja,
-                "error": str(e)
-            })
+    for r in calificacion["resultados"]:
+        resultados.append({
+            "hoja_id": r["hoja_id"],
+            "codigo_hoja": codigos[r["hoja_id"]],
+            "postulante_id": r.get("postulante_id"),
+            "nota_final": r["nota_final"],
+            "correctas": r["correctas"],
+            "incorrectas": r["incorrectas"],
+            "en_blanco": r["en_blanco"],
+            "invalidas": r["no_legibles"],
+            "total": r["total"],
+            "porcentaje": r["porcentaje"],
+            "aprobado": r["aprobado"]
+        })
+    
+    errores = [
+        {**e, "codigo_hoja": codigos.get(e["hoja_id"])}
+        for e in calificacion["errores"]
+    ]
+    
+    for e in errores:
+        print(f"❌ Hoja {e['codigo_hoja']}: {e['error']}")
+    
+    db.commit()
     
     # Calcular estadísticas generales
     if resultados:
@@ -299,10 +227,13 @@ def calificar_hojas_pendientes(
     }
 
 
-def actualizar_orden_merito(proceso_admision: str, db: Session):
+def actualizar_orden_merito(proceso_admision: str, db: Session) -> int:
     """
     Actualiza el orden de mérito (puestos) de los postulantes.
     Ordena por nota descendente y asigna puestos.
+    
+    Returns:
+        Cantidad de postulantes cuyo puesto cambió
     """
     
     print("\n📊 Calculando orden de mérito...")
@@ -316,12 +247,17 @@ def actualizar_orden_merito(proceso_admision: str, db: Session):
     ).all()
     
     # Asignar puestos
+    movidos = 0
     for puesto, calificacion in enumerate(calificaciones, start=1):
-        calificacion.puesto = puesto
+        if calificacion.puesto != puesto:
+            calificacion.puesto = puesto
+            movidos += 1
     
     db.commit()
     
-    print(f"✅ Orden de mérito actualizado: {len(calificaciones)} postulantes")
+    print(f"✅ Orden de mérito actualizado: {len(calificaciones)} postulantes ({movidos} cambiaron de puesto)")
+    
+    return movidos
 
 
 def obtener_estadisticas_calificacion(proceso_admision: str, db: Session) -> Dict:
@@ -0,0 +1,214 @@
+"""
+Cola de Captura - Procesamiento por lotes de hojas de respuestas
+app/services/cola_captura.py
+
+Cola en memoria (asyncio.Queue) drenada por N workers concurrentes
+(settings.captura_workers). Cada worker ejecuta el procesador del lote
+(Vision API + guardado en BD) para una hoja a la vez.
+
+Los límites de concurrencia POR PROVEEDOR se aplican en vision_async, así que
+el throughput escala con el rate limit de la API y no con la cantidad de
+requests HTTP que haga el navegador.
+
+IMPORTANTE: el estado vive en memoria del proceso. Si el servidor se reinicia,
+los lotes en curso se pierden (las imágenes ya guardadas en disco se conservan).
+"""
+
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+
+
+# Máximo de lotes terminados que se conservan para consulta
+MAX_LOTES_EN_MEMORIA = 50
+
+_cola: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+_lotes: Dict[str, Dict] = {}
+
+
+# ============================================================================
+# API PÚBLICA
+# ============================================================================
+
+def crear_lote(
+    items: List[Dict],
+    procesador: Callable[[Dict], Awaitable[Dict]]
+) -> str:
+    """
+    Registra un lote y encola sus hojas.
+
+    Args:
+        items: Lista de dicts con los datos de cada hoja (ruta de imagen, etc.)
+        procesador: Corrutina que procesa UNA hoja y retorna un dict de resultado.
+                    Si lanza excepción la hoja queda como "error".
+
+    Returns:
+        lote_id para consultar el progreso con obtener_estado_lote()
+    """
+    _limpiar_lotes_antiguos()
+
+    lote_id = uuid.uuid4().hex[:12]
+
+    _lotes[lote_id] = {
+        "lote_id": lote_id,
+        "estado": "en_cola",
+        "total": len(items),
+        "procesadas": 0,
+        "exitosas": 0,
+        "fallidas": 0,
+        "creado_at": datetime.now(),
+        "iniciado_at": None,
+        "finalizado_at": None,
+        "procesador": procesador,
+        "hojas": [
+            {
+                "indice": indice,
+                "item": item,
+                "estado": "pendiente",
+                "resultado": None,
+                "error": None
+            }
+            for indice, item in enumerate(items)
+        ]
+    }
+
+    cola = _obtener_cola()
+    for indice in range(len(items)):
+        cola.put_nowait((lote_id, indice))
+
+    _iniciar_workers()
+
+    print(f"📥 Lote {lote_id} encolado: {len(items)} hojas (cola: {cola.qsize()})")
+
+    return lote_id
+
+
+def obtener_estado_lote(lote_id: str) -> Optional[Dict]:
+    """
+    Retorna el progreso de un lote (o None si no existe).
+    """
+    lote = _lotes.get(lote_id)
+    if not lote:
+        return None
+
+    ahora = lote["finalizado_at"] or datetime.now()
+    transcurrido = (ahora - lote["iniciado_at"]).total_seconds() if lote["iniciado_at"] else 0
+    velocidad = lote["procesadas"] / transcurrido if transcurrido > 0 else 0
+    pendientes = lote["total"] - lote["procesadas"]
+
+    return {
+        "lote_id": lote_id,
+        "estado": lote["estado"],
+        "total": lote["total"],
+        "procesadas": lote["procesadas"],
+        "exitosas": lote["exitosas"],
+        "fallidas": lote["fallidas"],
+        "pendientes": pendientes,
+        "porcentaje": round(lote["procesadas"] / lote["total"] * 100, 1) if lote["total"] else 100.0,
+        "hojas_por_minuto": round(velocidad * 60, 1),
+        "eta_segundos": round(pendientes / velocidad) if velocidad > 0 else None,
+        "creado_at": lote["creado_at"].isoformat(),
+        "iniciado_at": lote["iniciado_at"].isoformat() if lote["iniciado_at"] else None,
+        "finalizado_at": lote["finalizado_at"].isoformat() if lote["finalizado_at"] else None,
+        "cola_global": _cola.qsize() if _cola else 0,
+        "hojas": [
+            {
+                "indice": h["indice"],
+                "archivo": h["item"].get("nombre_original"),
+                "estado": h["estado"],
+                "resultado": h["resultado"],
+                "error": h["error"]
+            }
+            for h in lote["hojas"]
+        ]
+    }
+
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+def _obtener_cola() -> asyncio.Queue:
+    global _cola
+
+    if _cola is None:
+        _cola = asyncio.Queue()
+
+    return _cola
+
+
+def _iniciar_workers():
+    """
+    Levanta los workers que falten hasta llegar a settings.captura_workers.
+    Se llama en cada crear_lote(), así que un worker caído se reemplaza.
+    """
+    global _workers
+
+    _workers = [w for w in _workers if not w.done()]
+    faltantes = max(1, settings.captura_workers) - len(_workers)
+
+    for _ in range(faltantes):
+        numero = len(_workers) + 1
+        _workers.append(asyncio.create_task(_worker(numero)))
+
+
+async def _worker(numero: int):
+    cola = _obtener_cola()
+
+    while True:
+        lote_id, indice = await cola.get()
+        try:
+            await _procesar_hoja(lote_id, indice, numero)
+        except Exception as e:
+            # Nunca dejar morir al worker
+            print(f"❌ Worker {numero}: error inesperado en lote {lote_id}: {e}")
+        finally:
+            cola.task_done()
+
+
+async def _procesar_hoja(lote_id: str, indice: int, numero_worker: int):
+    lote = _lotes.get(lote_id)
+    if not lote:
+        return
+
+    hoja = lote["hojas"][indice]
+
+    if lote["iniciado_at"] is None:
+        lote["iniciado_at"] = datetime.now()
+        lote["estado"] = "procesando"
+
+    hoja["estado"] = "procesando"
+    print(f"⚙️  Worker {numero_worker}: lote {lote_id} hoja {indice + 1}/{lote['total']}")
+
+    try:
+        hoja["resultado"] = await lote["procesador"](hoja["item"])
+        hoja["estado"] = "completado"
+        lote["exitosas"] += 1
+
+    except Exception as e:
+        # HTTPException trae el detalle estructurado (DNI_INCOMPLETO, etc.)
+        hoja["error"] = getattr(e, "detail", None) or str(e)
+        hoja["estado"] = "error"
+        lote["fallidas"] += 1
+
+    lote["procesadas"] += 1
+
+    if lote["procesadas"] >= lote["total"]:
+        lote["estado"] = "completado"
+        lote["finalizado_at"] = datetime.now()
+        print(f"✅ Lote {lote_id} terminado: {lote['exitosas']} OK, {lote['fallidas']} con error")
+
+
+def _limpiar_lotes_antiguos():
+    terminados = sorted(
+        (l for l in _lotes.values() if l["estado"] == "completado"),
+        key=lambda l: l["finalizado_at"]
+    )
+
+    while len(_lotes) >= MAX_LOTES_EN_MEMORIA and terminados:
+        antiguo = terminados.pop(0)
+        _lotes.pop(antiguo["lote_id"], None)
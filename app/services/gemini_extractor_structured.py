@@ -4,12 +4,15 @@ Adaptado de TypeScript a Python usando la API de Gemini con response schema
 """
 
 import os
+import io
 import json
 import base64
 from typing import Dict, List, Optional
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig, content_types
 
+from app.services.vision_async import ejecutar_bloqueante, leer_imagen_bytes, limite_proveedor
+
 
 # ============================================================================
 # CONFIGURACIÓN
@@ -26,6 +29,16 @@ except Exception as e:
     genai = None
 
 
+# Envío de la imagen: INLINE (bytes en el mismo request, 1 round trip) o
+# UPLOAD (upload_file + generate_content + delete_file, 3 round trips).
+# Gemini acepta hasta 20 MB por request inline; dejamos margen para el prompt.
+LIMITE_INLINE_BYTES = 18 * 1024 * 1024
+
+# Lado mayor de la imagen enviada inline. Gemini re-escala internamente,
+# así que enviar más resolución solo agrega bytes y latencia.
+MAX_LADO_INLINE_PX = 3072
+
+
 # ============================================================================
 # SCHEMA DE RESPUESTA ESTRUCTURADO
 # ============================================================================
@@ -114,16 +127,44 @@ IMPORTANT:
 Return data in the specified JSON format with exactly 100 answers."""
 
 
+# ============================================================================
+# PREPARACIÓN DE IMAGEN INLINE
+# ============================================================================
+
+def _jpeg_reducido(image_data: bytes, max_lado: int = MAX_LADO_INLINE_PX) -> bytes:
+    """
+    Re-codifica la imagen como JPEG con el lado mayor <= max_lado.
+    Respeta la orientación EXIF (fotos de celular).
+    """
+    from PIL import Image, ImageOps
+    
+    with Image.open(io.BytesIO(image_data)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+        
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90, optimize=True)
+    
+    return buffer.getvalue()
+
+
 # ============================================================================
 # FUNCIÓN PRINCIPAL
 # ============================================================================
 
-async def extract_data_from_image_structured(imagen_path: str) -> Dict:
+async def extract_data_from_image_structured(
+    imagen_path: str,
+    modo_envio: str = "auto",
+    imagen_bytes: Optional[bytes] = None
+) -> Dict:
     """
     Extrae datos de la imagen usando Gemini con schema estructurado.
     
     Args:
         imagen_path: Ruta a la imagen de la hoja de respuestas
+        modo_envio: "auto" (inline si cabe, si no upload), "inline" (error
+            si la imagen no cabe inline) o "upload"
+        imagen_bytes: Contenido ya en memoria (evita releer imagen_path)
         
     Returns:
         Dict con la estructura:
@@ -156,8 +197,7 @@ async def extract_data_from_image_structured(imagen_path: str) -> Dict:
         # PASO 1: Cargar y codificar imagen
         # ====================================================================
         
-        with open(imagen_path, "rb") as f:
-            image_data = f.read()
+        image_data = imagen_bytes if imagen_bytes is not None else await leer_imagen_bytes(imagen_path)
         
         # Detectar mime type
         ext = imagen_path.lower().split('.')[-1]
@@ -173,12 +213,42 @@ async def extract_data_from_image_structured(imagen_path: str) -> Dict:
         print(f"📊 Tamaño: {len(image_data) / 1024:.1f} KB")
         
         # ====================================================================
-        # PASO 2: Subir imagen a Gemini
+        # PASO 2: Preparar imagen (inline por defecto, upload como fallback)
         # ====================================================================
         
-        print("📤 Subiendo imagen a Gemini...")
-        uploaded_file = genai.upload_file(imagen_path)
-        print(f"✅ Archivo subido: {uploaded_file.name}")
+        imagen_part = None
+        uploaded_file = None
+        
+        if modo_envio not in ("auto", "inline", "upload"):
+            raise ValueError(f"modo_envio inválido: {modo_envio}")
+        
+        if modo_envio != "upload":
+            try:
+                jpeg_data = await ejecutar_bloqueante(_jpeg_reducido, image_data)
+            except Exception as e:
+                if modo_envio == "inline":
+                    raise ValueError(f"No se pudo preparar la imagen inline: {e}")
+                jpeg_data = None
+                print(f"⚠️  No se pudo preparar imagen inline: {e}")
+            
+            if jpeg_data is not None and len(jpeg_data) <= LIMITE_INLINE_BYTES:
+                imagen_part = {"mime_type": "image/jpeg", "data": jpeg_data}
+                print(f"📎 Envío INLINE: {len(jpeg_data) / 1024:.1f} KB (JPEG reducido)")
+            elif jpeg_data is not None:
+                if modo_envio == "inline":
+                    raise ValueError(
+                        f"Imagen muy grande para inline ({len(jpeg_data) / 1024 / 1024:.1f} MB, "
+                        f"máximo {LIMITE_INLINE_BYTES / 1024 / 1024:.0f} MB)"
+                    )
+                print(f"⚠️  Imagen muy grande para inline ({len(jpeg_data) / 1024 / 1024:.1f} MB)")
+        
+        if imagen_part is None:
+            print("📤 Subiendo imagen a Gemini...")
+            uploaded_file = await ejecutar_bloqueante(
+                genai.upload_file, io.BytesIO(image_data), mime_type=mime_type
+            )
+            imagen_part = uploaded_file
+            print(f"✅ Archivo subido: {uploaded_file.name}")
         
         # ====================================================================
         # PASO 3: Configurar modelo con schema
@@ -200,10 +270,20 @@ async def extract_data_from_image_structured(imagen_path: str) -> Dict:
         
         print("🚀 Enviando request a Gemini...")
         
-        response = model.generate_content([
-            uploaded_file,
-            EXTRACTION_PROMPT
-        ])
+        try:
+            async with limite_proveedor("gemini"):
+                response = await model.generate_content_async([
+                    imagen_part,
+                    EXTRACTION_PROMPT
+                ])
+        finally:
+            # Limpiar archivo subido (solo modo upload), aunque la llamada falle
+            if uploaded_file is not None:
+                try:
+                    await ejecutar_bloqueante(genai.delete_file, uploaded_file.name)
+                    print(f"🗑️  Archivo temporal eliminado")
+                except Exception as e:
+                    print(f"⚠️  No se pudo eliminar archivo temporal: {e}")
         
         print("✅ Respuesta recibida")
         
@@ -259,23 +339,14 @@ async def extract_data_from_image_structured(imagen_path: str) -> Dict:
         for key, value in parsed_data["codes"].items():
             print(f"   - {key}: {value}")
         
-        # ====================================================================
-        # PASO 7: Limpiar archivo temporal
-        # ====================================================================
-        
-        try:
-            genai.delete_file(uploaded_file.name)
-            print(f"\n🗑️  Archivo temporal eliminado")
-        except Exception as e:
-            print(f"\n⚠️  No se pudo eliminar archivo temporal: {e}")
-        
         print(f"\n{'='*70}")
         print("✅ EXTRACCIÓN COMPLETADA")
         print(f"{'='*70}\n")
         
         return {
             "success": True,
-            "data": parsed_data
+            "data": parsed_data,
+            "modo_envio": "upload" if uploaded_file is not None else "inline"
         }
         
     except json.JSONDecodeError as e:
@@ -311,7 +382,11 @@ async def extract_data_from_image_structured(imagen_path: str) -> Dict:
 # FUNCIÓN ADAPTADORA PARA FORMATO LEGACY
 # ============================================================================
 
-async def extract_data_compatible(imagen_path: str) -> Dict:
+async def extract_data_compatible(
+    imagen_path: str,
+    modo_envio: str = "auto",
+    imagen_bytes: Optional[bytes] = None
+) -> Dict:
     """
     Versión compatible con el formato actual del sistema.
     
@@ -331,7 +406,9 @@ async def extract_data_compatible(imagen_path: str) -> Dict:
     }
     """
     
-    result = await extract_data_from_image_structured(imagen_path)
+    result = await extract_data_from_image_structured(
+        imagen_path, modo_envio=modo_envio, imagen_bytes=imagen_bytes
+    )
     
     if not result["success"]:
         return result
@@ -370,7 +447,8 @@ async def extract_data_compatible(imagen_path: str) -> Dict:
             "respuestas": respuestas
         },
         "api": "gemini-structured",
-        "modelo": "gemini-2.5-flash"
+        "modelo": "gemini-2.5-flash",
+        "modo_envio": result.get("modo_envio")
     }
 
 
@@ -391,4 +469,4 @@ if __name__ == "__main__":
         else:
             print(f"\n❌ ERROR: {resultado['error']}")
     
-    asyncio.run(test())
\ No newline at end of file
+    asyncio.run(test())
\ No newline at end of file
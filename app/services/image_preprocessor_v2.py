@@ -8,15 +8,46 @@ MEJORAS V2:
 - Detección y corrección de perspectiva mejorada
 - Reducción de sombras
 - Nitidez enfocada en áreas de texto
+
+PIPELINE EN MEMORIA (procesar_en_memoria):
+- Trabaja en escala de grises desde la lectura (sin ida y vuelta BGR/LAB)
+- Zoom solo si la resolución no alcanza (MIN_LADO_MAYOR_PX)
+- Retorna la imagen codificada en bytes (sin archivo _processed intermedio)
+- Reporta tiempos por etapa en metadata["tiempos_ms"]
 """
 
 import cv2
 import numpy as np
+import threading
+import time
 from pathlib import Path
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Union
 import os
 
 
+# Por debajo de este lado mayor (px) se amplía la imagen antes de procesar
+MIN_LADO_MAYOR_PX = 2400
+MAX_ZOOM = 2.0
+
+# Kernel de nitidez agresivo (centro 10) - se crea una sola vez
+KERNEL_NITIDEZ = np.array([
+    [-1, -1, -1],
+    [-1, 10, -1],
+    [-1, -1, -1]
+], dtype=np.float32)
+
+# Los objetos CLAHE no son thread-safe: uno por hilo, reutilizado entre llamadas
+_clahe_local = threading.local()
+
+
+def _obtener_clahe() -> "cv2.CLAHE":
+    clahe = getattr(_clahe_local, "clahe", None)
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
+        _clahe_local.clahe = clahe
+    return clahe
+
+
 class ImagePreprocessorV2:
     """
     Pre-procesador de imágenes optimizado para hojas de examen.
@@ -194,17 +225,103 @@ class ImagePreprocessorV2:
             print(f"⚠️  Error en binarización: {e}")
             return imagen
     
+    def procesar_en_memoria(
+        self,
+        imagen: Union[str, bytes],
+        formato: str = ".png"
+    ) -> Tuple[bytes, Dict]:
+        """
+        Pipeline de pre-procesamiento V2 en memoria y en escala de grises.
+        
+        Mismas etapas que procesar_completo, pero:
+        - Lee directo en gris (cv2.IMREAD_GRAYSCALE)
+        - Zoom solo si el lado mayor < MIN_LADO_MAYOR_PX (máx. 2x)
+        - CLAHE reutilizado (uno por hilo)
+        - No escribe archivos: retorna la imagen codificada
+        
+        Args:
+            imagen: Ruta de la imagen o sus bytes (JPEG/PNG)
+            formato: ".png" (binaria sin pérdida, liviana) o ".jpg"
+            
+        Returns:
+            tuple: (bytes_codificados, metadata) — metadata["media_type"] y
+                   metadata["tiempos_ms"] con la duración de cada etapa
+        """
+        tiempos = {}
+        t = time.perf_counter()
+        
+        def _marcar(etapa: str):
+            nonlocal t
+            ahora = time.perf_counter()
+            tiempos[etapa] = round((ahora - t) * 1000, 1)
+            t = ahora
+        
+        if isinstance(imagen, (bytes, bytearray, memoryview)):
+            gray = cv2.imdecode(np.frombuffer(imagen, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            gray = cv2.imread(imagen, cv2.IMREAD_GRAYSCALE)
+        
+        if gray is None:
+            raise ValueError("No se pudo decodificar la imagen")
+        
+        h, w = gray.shape
+        metadata = {
+            "original_size": (w, h),
+            "pasos_aplicados": []
+        }
+        _marcar("lectura")
+        
+        # Zoom solo si hace falta resolución
+        factor = min(MAX_ZOOM, MIN_LADO_MAYOR_PX / max(h, w))
+        if factor > 1.05:
+            gray = cv2.resize(
+                gray, (int(w * factor), int(h * factor)), interpolation=cv2.INTER_CUBIC
+            )
+            metadata["pasos_aplicados"].append(f"zoom_{factor:.2f}x")
+            metadata["zoom_size"] = (gray.shape[1], gray.shape[0])
+        _marcar("zoom")
+        
+        # Reducir sombras (división por el fondo estimado)
+        background = cv2.GaussianBlur(gray, (51, 51), 0)
+        gray = cv2.divide(gray, background, scale=255)
+        metadata["pasos_aplicados"].append("reduccion_sombras")
+        _marcar("sombras")
+        
+        # CLAHE directo sobre gris
+        gray = _obtener_clahe().apply(gray)
+        metadata["pasos_aplicados"].append("clahe_agresivo")
+        _marcar("clahe")
+        
+        gray = cv2.filter2D(gray, -1, KERNEL_NITIDEZ)
+        metadata["pasos_aplicados"].append("nitidez_agresiva")
+        _marcar("nitidez")
+        
+        _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        metadata["pasos_aplicados"].append("threshold_otsu")
+        _marcar("otsu")
+        
+        ok, codificada = cv2.imencode(formato, gray)
+        if not ok:
+            raise ValueError(f"No se pudo codificar la imagen como {formato}")
+        _marcar("codificacion")
+        
+        metadata["output_size"] = gray.shape[:2]
+        metadata["media_type"] = "image/png" if formato == ".png" else "image/jpeg"
+        metadata["bytes"] = int(codificada.size)
+        metadata["tiempos_ms"] = tiempos
+        metadata["tiempo_total_ms"] = round(sum(tiempos.values()), 1)
+        
+        print(f"✅ Pre-procesamiento en memoria: {metadata['tiempo_total_ms']}ms {tiempos}")
+        
+        return codificada.tobytes(), metadata
+    
     def procesar_completo(self, imagen_path: str) -> Tuple[str, Dict]:
         """
-        Pipeline completo de pre-procesamiento V2 con ZOOM 2X.
+        Pipeline completo de pre-procesamiento V2 (versión con archivo).
         
-        Orden optimizado:
-        1. ZOOM 2X (primero, para mayor resolución)
-        2. Reducir sombras
-        3. Corregir perspectiva
-        4. Mejorar contraste (CLAHE)
-        5. Aumentar nitidez
-        6. Threshold Otsu
+        Ejecuta procesar_en_memoria y guarda el resultado junto a la original
+        como {stem}_processed_v2{suffix}. Preferir procesar_en_memoria cuando
+        la imagen procesada se va a enviar directo a una API.
         
         Args:
             imagen_path: Ruta de la imagen original
@@ -213,132 +330,25 @@ class ImagePreprocessorV2:
             tuple: (ruta_imagen_procesada, metadata)
         """
         
-        print("🔧 Iniciando pre-procesamiento OpenCV V2 + ZOOM 2X...")
+        print("🔧 Iniciando pre-procesamiento OpenCV V2...")
         
         try:
-            # Cargar imagen
-            imagen = cv2.imread(imagen_path)
-            
-            if imagen is None:
-                raise ValueError(f"No se pudo cargar la imagen: {imagen_path}")
-            
-            h, w = imagen.shape[:2]
-            print(f"📐 Original: {w}x{h}px")
-            
-            # Pipeline de procesamiento
-            metadata = {
-                "original_size": (w, h),
-                "pasos_aplicados": []
-            }
-            
-            # ================================================================
-            # PASO 0: ZOOM 2X (NUEVO)
-            # ================================================================
-            nuevo_ancho = int(w * 2)
-            nuevo_alto = int(h * 2)
-            
-            # Interpolación bicúbica para mejor calidad
-            imagen = cv2.resize(
-                imagen, 
-                (nuevo_ancho, nuevo_alto), 
-                interpolation=cv2.INTER_CUBIC
-            )
-            
-            metadata["pasos_aplicados"].append("zoom_2x")
-            metadata["zoom_size"] = (nuevo_ancho, nuevo_alto)
-            print(f"✅ Zoom 2x aplicado: {nuevo_ancho}x{nuevo_alto}px")
-            
-            # ================================================================
-            # PASO 1: Reducir sombras
-            # ================================================================
-            imagen = self.reducir_sombras(imagen)
-            metadata["pasos_aplicados"].append("reduccion_sombras")
-            print("✅ Sombras reducidas")
-            
-            # ================================================================
-            # PASO 2: Corregir perspectiva - DESACTIVADO
-            # ================================================================
-            # NOTA: La corrección automática de perspectiva estaba reduciendo
-            # la imagen drásticamente (de 2880x3840 a 139x89). Desactivado.
-            # imagen = self.corregir_perspectiva(imagen)
-            # metadata["pasos_aplicados"].append("correccion_perspectiva")
-            print("⏭️  Perspectiva: omitida (evita reducción de imagen)")
-            
-            # ================================================================
-            # PASO 3: Mejorar contraste con CLAHE (más agresivo)
-            # ================================================================
-            try:
-                lab = cv2.cvtColor(imagen, cv2.COLOR_BGR2LAB)
-                l, a, b = cv2.split(lab)
-                
-                # CLAHE más agresivo para zoom
-                clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
-                l_clahe = clahe.apply(l)
-                
-                lab_clahe = cv2.merge([l_clahe, a, b])
-                imagen = cv2.cvtColor(lab_clahe, cv2.COLOR_LAB2BGR)
-                
-                metadata["pasos_aplicados"].append("clahe_agresivo")
-                print("✅ Contraste mejorado (CLAHE agresivo)")
-            except Exception as e:
-                print(f"⚠️  CLAHE falló: {e}")
-            
-            # ================================================================
-            # PASO 4: Aumentar nitidez (más agresivo)
-            # ================================================================
-            try:
-                # Kernel de nitidez más fuerte
-                kernel = np.array([
-                    [-1, -1, -1],
-                    [-1, 10, -1],  # Centro más fuerte
-                    [-1, -1, -1]
-                ])
-                
-                imagen = cv2.filter2D(imagen, -1, kernel)
-                metadata["pasos_aplicados"].append("nitidez_agresiva")
-                print("✅ Nitidez aumentada (agresiva)")
-            except Exception as e:
-                print(f"⚠️  Nitidez falló: {e}")
-            
-            # ================================================================
-            # PASO 5: Threshold Otsu
-            # ================================================================
-            try:
-                gray = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
-                
-                # Otsu threshold
-                _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                
-                # Convertir de vuelta a BGR
-                imagen_final = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
-                
-                metadata["pasos_aplicados"].append("threshold_otsu")
-                print("✅ Threshold Otsu aplicado")
-            except Exception as e:
-                print(f"⚠️  Threshold falló: {e}")
-                imagen_final = imagen
-            
-            # ================================================================
-            # GUARDAR
-            # ================================================================
             path_obj = Path(imagen_path)
-            output_dir = path_obj.parent
-            output_filename = f"{path_obj.stem}_processed_v2_zoom2x{path_obj.suffix}"
-            output_path = output_dir / output_filename
+            formato = ".png" if path_obj.suffix.lower() == ".png" else ".jpg"
+            
+            imagen_bytes, metadata = self.procesar_en_memoria(imagen_path, formato=formato)
             
-            cv2.imwrite(str(output_path), imagen_final)
+            output_path = path_obj.parent / f"{path_obj.stem}_processed_v2{formato}"
+            with open(output_path, "wb") as f:
+                f.write(imagen_bytes)
             
             metadata["output_path"] = str(output_path)
-            metadata["output_size"] = imagen_final.shape[:2]
             
             print(f"✅ Guardado: {output_path}")
             
-            final_h, final_w = imagen_final.shape[:2]
-            print(f"📐 Final: {final_w}x{final_h}px")
-            
             return str(output_path), metadata
             
         except Exception as e:
             print(f"❌ Error en pre-procesamiento: {e}")
             # En caso de error, retornar imagen original
-            return imagen_path, {"error": str(e), "used": False}
\ No newline at end of file
+            return imagen_path, {"error": str(e), "used": False}
@@ -0,0 +1,223 @@
+"""
+Layout de Hoja - Descriptor versionado de la hoja de respuestas genérica
+app/services/layout_hoja.py
+
+ÚNICA fuente de verdad de la geometría de la hoja:
+- pdf_generator_simple.generar_hoja_generica la usa para DIBUJAR
+- omr_local y la captura la usan para LEER (regiones de cada caja)
+
+El id de versión (LAYOUT_VERSION) se imprime en el pie de cada hoja. Si se
+cambia cualquier medida de la grilla hay que crear una versión NUEVA en
+LAYOUTS en lugar de editar la actual, para que las hojas ya impresas se
+sigan leyendo con las coordenadas con las que fueron dibujadas.
+
+Las posiciones se calculan UNA vez por versión (y por escala de pixeles),
+no se buscan en cada imagen.
+"""
+
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+
+
+# ============================================================================
+# VERSIONES DE LAYOUT
+# ============================================================================
+
+LAYOUT_VERSION = "HG100-v1"
+
+LAYOUTS = {
+    "HG100-v1": {
+        "pagina": A4,
+        "margen_externo": 1.5 * cm,
+        "margen_marco": 2.0 * cm,           # Marco negro grueso
+        "marca_size": 0.8 * cm,             # Marcas L en esquinas
+        "padding": 0.8 * cm,
+
+        "dni_digitos": 8,
+        "dni_rect_ancho": 1.0 * cm,
+        "dni_rect_alto": 0.85 * cm,
+        "dni_espaciado": 0.18 * cm,
+
+        "filas_respuestas": 20,
+        "columnas_respuestas": 5,
+        "resp_rect_ancho": 0.75 * cm,
+        "resp_rect_alto": 0.5 * cm,
+        "espacio_pie": 1.5 * cm,
+    },
+}
+
+
+# Constantes de la versión vigente (las usa el generador al dibujar)
+_ACTUAL = LAYOUTS[LAYOUT_VERSION]
+
+MARGEN_EXTERNO = _ACTUAL["margen_externo"]
+MARGEN_MARCO = _ACTUAL["margen_marco"]
+MARCA_SIZE = _ACTUAL["marca_size"]
+PADDING = _ACTUAL["padding"]
+
+DNI_DIGITOS = _ACTUAL["dni_digitos"]
+DNI_RECT_ANCHO = _ACTUAL["dni_rect_ancho"]
+DNI_RECT_ALTO = _ACTUAL["dni_rect_alto"]
+DNI_ESPACIADO = _ACTUAL["dni_espaciado"]
+
+FILAS_RESPUESTAS = _ACTUAL["filas_respuestas"]
+COLUMNAS_RESPUESTAS = _ACTUAL["columnas_respuestas"]
+TOTAL_PREGUNTAS = FILAS_RESPUESTAS * COLUMNAS_RESPUESTAS
+RESP_RECT_ANCHO = _ACTUAL["resp_rect_ancho"]
+RESP_RECT_ALTO = _ACTUAL["resp_rect_alto"]
+ESPACIO_PIE = _ACTUAL["espacio_pie"]
+
+
+# ============================================================================
+# GEOMETRÍA EN PUNTOS PDF
+# ============================================================================
+
+@lru_cache(maxsize=None)
+def obtener_layout(version: str = LAYOUT_VERSION) -> Dict:
+    """
+    Posiciones (en puntos PDF, origen abajo-izquierda) de los elementos fijos
+    de la hoja: marco, rectángulos del DNI y las 100 respuestas.
+
+    Replica el avance vertical del encabezado de generar_hoja_generica.
+    Se calcula una sola vez por versión (NO modificar el dict retornado).
+
+    Returns:
+        {
+            "version": "HG100-v1",
+            "pagina": (width, height),
+            "marco": (x, y, ancho, alto),
+            "dni": ((x, y, ancho, alto), ...) x8,
+            "respuestas": ((x, y, ancho, alto), ...) x100 (pregunta 1..100),
+            ...
+        }
+    """
+    if version not in LAYOUTS:
+        raise ValueError(f"Layout de hoja desconocido: {version}")
+
+    medidas = LAYOUTS[version]
+    width, height = medidas["pagina"]
+
+    area_x = medidas["margen_marco"]
+    area_y = medidas["margen_marco"]
+    area_width = width - 2 * medidas["margen_marco"]
+    area_height = height - 2 * medidas["margen_marco"]
+
+    padding = medidas["padding"]
+    x_start = area_x + padding
+    content_width = area_width - 2 * padding
+
+    # Encabezado: título, proceso, línea y etiqueta DNI
+    y = area_y + area_height - padding - 0.8 * cm
+    y -= 0.5 * cm + 0.7 * cm + 0.55 * cm + 0.45 * cm
+    y_dni = y
+
+    digitos = medidas["dni_digitos"]
+    dni_ancho = medidas["dni_rect_ancho"]
+    dni_alto = medidas["dni_rect_alto"]
+    dni_espaciado = medidas["dni_espaciado"]
+
+    total_ancho_dni = (digitos * dni_ancho) + ((digitos - 1) * dni_espaciado)
+    dni_start_x = x_start + (content_width - total_ancho_dni) / 2
+
+    cajas_dni = tuple(
+        (dni_start_x + i * (dni_ancho + dni_espaciado), y_dni - dni_alto,
+         dni_ancho, dni_alto)
+        for i in range(digitos)
+    )
+
+    # N° orden / código, línea separadora e instrucciones
+    y -= dni_alto + 0.45 * cm
+    y_orden = y
+    y -= 1.15 * cm + 0.55 * cm + 0.32 * cm + 0.55 * cm
+    y_respuestas = y
+
+    filas = medidas["filas_respuestas"]
+    columnas = medidas["columnas_respuestas"]
+
+    espacio_disponible = y_respuestas - (area_y + padding + medidas["espacio_pie"])
+    altura_por_fila = espacio_disponible / filas
+    col_ancho = content_width / 5.2
+
+    cajas_respuestas = []
+    for fila in range(filas):
+        y_fila = y_respuestas - fila * altura_por_fila
+        for col in range(columnas):
+            x_col = x_start + 0.1 * cm + col * col_ancho
+            cajas_respuestas.append(
+                (x_col + 0.6 * cm, y_fila - 0.05 * cm,
+                 medidas["resp_rect_ancho"], medidas["resp_rect_alto"])
+            )
+
+    return {
+        "version": version,
+        "pagina": (width, height),
+        "marco": (area_x, area_y, area_width, area_height),
+        "x_start": x_start,
+        "content_width": content_width,
+        "y_dni": y_dni,
+        "y_orden": y_orden,
+        "y_respuestas": y_respuestas,
+        "altura_por_fila": altura_por_fila,
+        "col_ancho": col_ancho,
+        "dni": cajas_dni,
+        "respuestas": tuple(cajas_respuestas)
+    }
+
+
+# ============================================================================
+# REGIONES EN PIXELES (para recortar cajas de una imagen ya registrada)
+# ============================================================================
+
+@lru_cache(maxsize=32)
+def regiones_en_pixeles(
+    escala: float,
+    elemento: str = "respuestas",
+    margen: float = 0.0,
+    version: str = LAYOUT_VERSION
+) -> Tuple[Tuple[int, int, int, int], ...]:
+    """
+    Regiones [x0, y0, x1, y1] en pixeles (origen arriba-izquierda) de los
+    rectángulos de un elemento ("respuestas" o "dni") sobre una página
+    normalizada de (ancho_pt * escala, alto_pt * escala) pixeles.
+
+    Args:
+        escala: Pixeles por punto PDF de la página normalizada
+        elemento: "respuestas" o "dni"
+        margen: Fracción de cada rectángulo a descartar en los bordes
+        version: Versión de layout
+
+    Returns:
+        Tupla de (x0, y0, x1, y1) en el orden de las preguntas / dígitos
+    """
+    layout = obtener_layout(version)
+    alto_pt = layout["pagina"][1]
+
+    regiones = []
+    for x, y, w, h in layout[elemento]:
+        x0 = (x + w * margen) * escala
+        x1 = (x + w * (1 - margen)) * escala
+        y0 = (alto_pt - (y + h * (1 - margen))) * escala
+        y1 = (alto_pt - (y + h * margen)) * escala
+        regiones.append((round(x0), round(y0), round(x1), round(y1)))
+
+    return tuple(regiones)
+
+
+def esquinas_marco_en_pixeles(escala: float, version: str = LAYOUT_VERSION) -> Tuple:
+    """
+    Esquinas del marco negro (TL, TR, BR, BL) en pixeles de la página
+    normalizada: destino de la corrección de perspectiva.
+    """
+    layout = obtener_layout(version)
+    alto_pt = layout["pagina"][1]
+    mx, my, mw, mh = layout["marco"]
+
+    return (
+        (mx * escala, (alto_pt - (my + mh)) * escala),
+        ((mx + mw) * escala, (alto_pt - (my + mh)) * escala),
+        ((mx + mw) * escala, (alto_pt - my) * escala),
+        (mx * escala, (alto_pt - my) * escala)
+    )
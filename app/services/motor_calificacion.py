@@ -0,0 +1,690 @@
+"""
+Motor de Calificación - Calificación vectorizada con NumPy
+app/services/motor_calificacion.py
+
+Las respuestas de un proceso se leen UNA vez a una matriz compacta uint8 de
+forma (n_hojas, 100) y la clave a un vector de 100:
+
+    0 = en blanco (vacío / VACIO)
+    1..5 = A..E
+    6 = no legible (LETRA_INVALIDA, GARABATO, MULTIPLE, ILEGIBLE, ...)
+
+Correctas, incorrectas, en blanco y puntajes se calculan con comparaciones
+vectorizadas (sin bucles por hoja ni por respuesta). Pesos por pregunta y
+penalización por respuesta incorrecta se aplican sobre la matriz, sin SQL
+adicional, así que sirve también para análisis "qué pasaría si".
+
+Uso:
+    clave = cargar_clave(db, proceso)
+    hoja_ids, matriz, conteo = cargar_respuestas(db, hoja_ids)
+    resultado = calificar_matriz(matriz, clave, penalizacion=0.25)
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.models import Calificacion
+from app.services.cache_gabarito import obtener_clave
+
+
+TOTAL_PREGUNTAS = 100
+
+BLANCO = 0
+NO_LEGIBLE = 6
+
+CODIGOS = {"A": 1, "B": 2, "C": 3, "D": 4, "E": 5}
+LETRAS = {v: k for k, v in CODIGOS.items()}
+
+VALORES_BLANCO = ("", "VACIO")
+
+NOTA_MAXIMA = 20            # Sistema vigesimal
+NOTA_MINIMA_APROBATORIA = 10.5
+
+# Carácter de cada código en hojas_respuestas.respuestas_compactas
+LETRAS_COMPACTAS = "-ABCDE?"
+
+# Hojas por sentencia en los UPDATE set-based de respuestas
+BLOQUE_HOJAS_SQL = 1000
+
+
+# ============================================================================
+# CODIFICACIÓN
+# ============================================================================
+
+def codificar_respuesta(respuesta_marcada: Optional[str]) -> int:
+    """'A'..'E' -> 1..5, vacío -> 0, cualquier otra marca -> 6."""
+    valor = (respuesta_marcada or "").strip().upper()
+
+    if valor in VALORES_BLANCO:
+        return BLANCO
+
+    return CODIGOS.get(valor, NO_LEGIBLE)
+
+
+def codificar_arreglo(respuestas: Sequence[Optional[str]]) -> np.ndarray:
+    """Vector uint8 (100,) desde la lista de respuestas detectadas (faltantes = 0)."""
+    codigos = np.zeros(TOTAL_PREGUNTAS, dtype=np.uint8)
+    for i, respuesta in enumerate(respuestas[:TOTAL_PREGUNTAS]):
+        codigos[i] = codificar_respuesta(respuesta)
+    return codigos
+
+
+def clave_desde_dict(gabarito: Dict) -> np.ndarray:
+    """
+    Vector uint8 de 100 desde {numero_pregunta: letra} (claves int o str).
+    Preguntas sin clave (o anuladas) quedan en 0 y no puntúan.
+    """
+    clave = np.zeros(TOTAL_PREGUNTAS, dtype=np.uint8)
+
+    for numero, letra in gabarito.items():
+        numero = int(numero)
+        if 1 <= numero <= TOTAL_PREGUNTAS:
+            clave[numero - 1] = CODIGOS.get((letra or "").strip().upper(), 0)
+
+    return clave
+
+
+# ============================================================================
+# CARGA DESDE BD (una consulta por tabla)
+# ============================================================================
+
+def cargar_clave(db: Session, proceso: str) -> np.ndarray:
+    """Vector uint8 (100,) con la clave del proceso (0 = sin clave)."""
+    filas = db.execute(text("""
+        SELECT numero_pregunta, respuesta_correcta
+        FROM clave_respuestas
+        WHERE proceso_admision = :proceso
+    """), {"proceso": proceso}).fetchall()
+
+    return clave_desde_dict({f.numero_pregunta: f.respuesta_correcta for f in filas})
+
+
+def cargar_clave_cacheada(db: Session, proceso: str) -> np.ndarray:
+    """
+    Igual que cargar_clave pero desde el cache de gabaritos (sin consulta
+    mientras esté vigente). No usar dentro de una transacción que modifica
+    la clave.
+    """
+    return clave_desde_dict(dict(enumerate(obtener_clave(db, proceso), start=1)))
+
+
+def cargar_respuestas(
+    db: Session,
+    hoja_ids: Sequence[int],
+    preguntas: Optional[Sequence[int]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Lee las respuestas de las hojas indicadas en una sola consulta.
+    Con preguntas, solo se leen esas columnas (el resto queda en 0).
+
+    Returns:
+        (hoja_ids, matriz, es_correcta, conteo)
+        - hoja_ids: int64 (n,) en el orden de las filas
+        - matriz: uint8 (n, 100) con los códigos de respuesta
+        - es_correcta: bool (n, 100) con el valor ACTUAL guardado en BD
+        - conteo: int (n,) respuestas registradas por hoja
+    """
+    ids = np.asarray(sorted(set(int(h) for h in hoja_ids)), dtype=np.int64)
+    n = len(ids)
+
+    matriz = np.zeros((n, TOTAL_PREGUNTAS), dtype=np.uint8)
+    es_correcta = np.zeros((n, TOTAL_PREGUNTAS), dtype=bool)
+    conteo = np.zeros(n, dtype=np.int32)
+
+    if n == 0:
+        return ids, matriz, es_correcta, conteo
+
+    consulta = """
+        SELECT hoja_respuesta_id, numero_pregunta, respuesta_marcada, es_correcta
+        FROM respuestas
+        WHERE hoja_respuesta_id IN :hoja_ids
+    """
+    params = {"hoja_ids": ids.tolist()}
+    expandidos = [bindparam("hoja_ids", expanding=True)]
+
+    if preguntas is not None:
+        consulta += " AND numero_pregunta IN :preguntas"
+        params["preguntas"] = [int(p) for p in preguntas]
+        expandidos.append(bindparam("preguntas", expanding=True))
+
+    filas = db.execute(text(consulta).bindparams(*expandidos), params).fetchall()
+
+    if not filas:
+        return ids, matriz, es_correcta, conteo
+
+    hojas_col = np.fromiter((f.hoja_respuesta_id for f in filas), dtype=np.int64, count=len(filas))
+    preguntas = np.fromiter((f.numero_pregunta for f in filas), dtype=np.int64, count=len(filas))
+    codigos = np.fromiter((codificar_respuesta(f.respuesta_marcada) for f in filas), dtype=np.uint8, count=len(filas))
+    correctas = np.fromiter((bool(f.es_correcta) for f in filas), dtype=bool, count=len(filas))
+
+    validas = (preguntas >= 1) & (preguntas <= TOTAL_PREGUNTAS)
+    filas_idx = np.searchsorted(ids, hojas_col[validas])
+    columnas = preguntas[validas] - 1
+
+    matriz[filas_idx, columnas] = codigos[validas]
+    es_correcta[filas_idx, columnas] = correctas[validas]
+    np.add.at(conteo, filas_idx, 1)
+
+    return ids, matriz, es_correcta, conteo
+
+
+# ============================================================================
+# CALIFICACIÓN VECTORIZADA
+# ============================================================================
+
+def calificar_matriz(
+    matriz: np.ndarray,
+    clave: np.ndarray,
+    pesos: Optional[Sequence[float]] = None,
+    penalizacion: float = 0.0,
+    nota_maxima: float = NOTA_MAXIMA
+) -> Dict[str, np.ndarray]:
+    """
+    Califica todas las hojas a la vez.
+
+    Args:
+        matriz: uint8 (n, 100) de códigos de respuesta
+        clave: uint8 (100,) con la clave (0 = pregunta sin clave / anulada)
+        pesos: Puntaje por pregunta (100,). Por defecto 1 para todas.
+        penalizacion: Fracción del peso que se descuenta por cada incorrecta
+        nota_maxima: Escala de la nota (20 = vigesimal)
+
+    Returns:
+        Dict de arrays por hoja: es_correcta (n, 100), correctas, incorrectas,
+        en_blanco, no_legibles, puntaje, nota (0-nota_maxima), porcentaje y
+        aprobado (nota vigesimal >= 10.5).
+    """
+    pesos = np.ones(TOTAL_PREGUNTAS, dtype=np.float64) if pesos is None else np.asarray(pesos, dtype=np.float64)
+
+    con_clave = clave > 0
+    marcadas = (matriz >= 1) & (matriz <= 5)
+
+    es_correcta = (matriz == clave) & con_clave
+    es_incorrecta = marcadas & con_clave & ~es_correcta
+
+    correctas = es_correcta.sum(axis=1)
+    incorrectas = es_incorrecta.sum(axis=1)
+    en_blanco = (matriz == BLANCO).sum(axis=1)
+    no_legibles = (matriz == NO_LEGIBLE).sum(axis=1)
+
+    puntaje = es_correcta @ pesos - penalizacion * (es_incorrecta @ pesos)
+    puntaje_maximo = float(pesos[con_clave].sum())
+
+    if puntaje_maximo > 0:
+        nota = np.clip(puntaje, 0, None) / puntaje_maximo * nota_maxima
+        porcentaje = correctas / con_clave.sum() * 100
+    else:
+        nota = np.zeros(len(matriz))
+        porcentaje = np.zeros(len(matriz))
+
+    return {
+        "es_correcta": es_correcta,
+        "correctas": correctas,
+        "incorrectas": incorrectas,
+        "en_blanco": en_blanco,
+        "no_legibles": no_legibles,
+        "puntaje": puntaje,
+        "nota": np.round(nota, 2),
+        "porcentaje": np.round(porcentaje, 2),
+        "aprobado": nota / nota_maxima * NOTA_MAXIMA >= NOTA_MINIMA_APROBATORIA
+    }
+
+
+# ============================================================================
+# CALIFICAR Y GUARDAR
+# ============================================================================
+
+def calificar_hojas(
+    db: Session,
+    proceso: str,
+    hoja_ids: Sequence[int],
+    pesos: Optional[Sequence[float]] = None,
+    penalizacion: float = 0.0,
+    estado: Optional[str] = "calificado",
+    actualizar_calificaciones: bool = True,
+    clave: Optional[np.ndarray] = None
+) -> Dict:
+    """
+    Califica N hojas en memoria y guarda los resultados (SIN commit).
+    Es el ÚNICO punto de calificación: todos los endpoints lo usan (una hoja
+    es simplemente N=1, ver calificar_hoja). La nota siempre va en la
+    escala NOTA_MAXIMA.
+
+    - respuestas.es_correcta: UPDATE set-based contra la clave, por bloque
+      de hojas, solo en las filas cuyo valor cambia
+    - hojas_respuestas: conteo, nota, estado, columnas compactas y fecha
+      en un executemany (estado=None conserva el estado actual de cada hoja)
+    - calificaciones: upsert por postulante (una consulta para leer las
+      existentes)
+
+    Hojas sin sus 100 respuestas se reportan en "errores" y no se tocan.
+
+    Returns:
+        {"success", "resultados": [...], "errores": [...]}
+    """
+    if clave is None:
+        clave = cargar_clave_cacheada(db, proceso)
+
+    if not clave.any():
+        raise ValueError(f"No existe gabarito para el proceso {proceso}")
+
+    ids, matriz, es_correcta_bd, conteo = cargar_respuestas(db, hoja_ids)
+
+    completas = conteo == TOTAL_PREGUNTAS
+    errores = [
+        {"hoja_id": int(h), "error": f"La hoja {int(h)} tiene {int(c)} respuestas (se requieren {TOTAL_PREGUNTAS})"}
+        for h, c in zip(ids[~completas], conteo[~completas])
+    ]
+
+    ids, matriz, es_correcta_bd = ids[completas], matriz[completas], es_correcta_bd[completas]
+
+    if len(ids) == 0:
+        return {"success": True, "resultados": [], "errores": errores}
+
+    resultado = calificar_matriz(matriz, clave, pesos=pesos, penalizacion=penalizacion)
+    ahora = datetime.now()
+
+    # es_correcta: un UPDATE ... FROM (VALUES clave) por bloque de hojas,
+    # solo para las hojas con alguna celda que cambia
+    cambiadas = ids[(resultado["es_correcta"] != es_correcta_bd).any(axis=1)]
+    if len(cambiadas):
+        _actualizar_es_correcta(db, cambiadas, clave)
+
+    resultados = [
+        {"hoja_id": int(ids[i]), **_resultado_fila(resultado, i)}
+        for i in range(len(ids))
+    ]
+
+    # Hojas: un solo executemany (incluye las columnas compactas)
+    db.execute(text("""
+        UPDATE hojas_respuestas
+        SET
+            respuestas_correctas_count = :correctas,
+            nota_final = :nota_final,
+            estado = COALESCE(:estado, estado),
+            respuestas_compactas = :compactas,
+            mascara_correctas = :mascara,
+            fecha_calificacion = :ahora
+        WHERE id = :hoja_id
+    """), [
+        {
+            "correctas": r["correctas"],
+            "nota_final": r["nota_final"],
+            "estado": estado,
+            "compactas": empaquetar_respuestas(matriz[i]),
+            "mascara": empaquetar_mascara(resultado["es_correcta"][i]),
+            "ahora": ahora,
+            "hoja_id": r["hoja_id"]
+        }
+        for i, r in enumerate(resultados)
+    ])
+
+    if actualizar_calificaciones:
+        _guardar_calificaciones(db, resultados, ahora)
+
+    return {"success": True, "resultados": resultados, "errores": errores}
+
+
+def _actualizar_es_correcta(db: Session, hoja_ids: np.ndarray, clave: np.ndarray):
+    """
+    Marca es_correcta de las hojas contra la clave indicada con un UPDATE
+    set-based por bloque (mismo criterio que calificar_matriz: solo A-E
+    que coinciden con una pregunta con clave). Solo escribe las filas cuyo
+    valor cambia.
+    """
+    valores = ", ".join(
+        f"({numero}, CAST(:letra_{numero} AS VARCHAR))"
+        for numero in range(1, TOTAL_PREGUNTAS + 1)
+    )
+    letras = {
+        f"letra_{i + 1}": LETRAS.get(int(codigo))
+        for i, codigo in enumerate(clave)
+    }
+
+    consulta = text(f"""
+        UPDATE respuestas AS r
+        SET es_correcta = COALESCE(UPPER(TRIM(r.respuesta_marcada)) = c.letra, FALSE)
+        FROM (VALUES {valores}) AS c (numero, letra)
+        WHERE r.hoja_respuesta_id IN :hoja_ids
+        AND r.numero_pregunta = c.numero
+        AND r.es_correcta IS DISTINCT FROM COALESCE(UPPER(TRIM(r.respuesta_marcada)) = c.letra, FALSE)
+    """).bindparams(bindparam("hoja_ids", expanding=True))
+
+    for inicio in range(0, len(hoja_ids), BLOQUE_HOJAS_SQL):
+        db.execute(consulta, {
+            **letras,
+            "hoja_ids": hoja_ids[inicio:inicio + BLOQUE_HOJAS_SQL].tolist()
+        })
+
+
+def calificar_respuestas(
+    respuestas: Sequence[Optional[str]],
+    clave: np.ndarray
+) -> Dict:
+    """
+    Califica UNA hoja que todavía está en memoria (la captura la califica
+    antes de insertar sus respuestas). Mismo cálculo que calificar_hojas,
+    sin tocar la BD. Las preguntas que falten cuentan como en blanco.
+
+    Returns:
+        Los totales de calificar_hojas más es_correcta (lista de 100 bool)
+        y las columnas compactas de la hoja
+    """
+    matriz = codificar_arreglo(respuestas)[np.newaxis, :]
+
+    resultado = calificar_matriz(matriz, clave)
+
+    return {
+        **_resultado_fila(resultado, 0),
+        "es_correcta": resultado["es_correcta"][0].tolist(),
+        "respuestas_compactas": empaquetar_respuestas(matriz[0]),
+        "mascara_correctas": empaquetar_mascara(resultado["es_correcta"][0])
+    }
+
+
+def calificar_hoja(
+    db: Session,
+    hoja_id: int,
+    proceso: Optional[str] = None,
+    **opciones
+) -> Dict:
+    """
+    Califica UNA hoja con calificar_hojas (sin commit). Si no se indica el
+    proceso se toma de la hoja. Lanza ValueError si la hoja no existe, no
+    hay gabarito o la hoja no tiene sus 100 respuestas.
+
+    Args:
+        opciones: Los mismos parámetros de calificar_hojas (estado, pesos, ...)
+    """
+    if proceso is None:
+        proceso = db.execute(text("""
+            SELECT proceso_admision FROM hojas_respuestas WHERE id = :hoja_id
+        """), {"hoja_id": hoja_id}).scalar()
+
+        if proceso is None:
+            raise ValueError(f"Hoja {hoja_id} no encontrada")
+
+    resultado = calificar_hojas(db, proceso, [hoja_id], **opciones)
+
+    if resultado["errores"]:
+        raise ValueError(resultado["errores"][0]["error"])
+
+    return resultado["resultados"][0]
+
+
+def _resultado_fila(resultado: Dict[str, np.ndarray], i: int) -> Dict:
+    """Totales de la fila i de calificar_matriz como tipos nativos."""
+    return {
+        "nota_final": float(resultado["nota"][i]),
+        "puntaje": round(float(resultado["puntaje"][i]), 2),
+        "correctas": int(resultado["correctas"][i]),
+        "incorrectas": int(resultado["incorrectas"][i]),
+        "en_blanco": int(resultado["en_blanco"][i]),
+        "no_legibles": int(resultado["no_legibles"][i]),
+        "no_calificables": int(resultado["en_blanco"][i] + resultado["no_legibles"][i]),
+        "total": TOTAL_PREGUNTAS,
+        "porcentaje": float(resultado["porcentaje"][i]),
+        "aprobado": bool(resultado["aprobado"][i])
+    }
+
+
+def _guardar_calificaciones(db: Session, resultados: List[Dict], ahora: datetime):
+    """Upsert de la tabla calificaciones (una fila por postulante)."""
+    postulantes = dict(db.execute(
+        text("""
+            SELECT id, postulante_id
+            FROM hojas_respuestas
+            WHERE id IN :hoja_ids AND postulante_id IS NOT NULL
+        """).bindparams(bindparam("hoja_ids", expanding=True)),
+        {"hoja_ids": [r["hoja_id"] for r in resultados]}
+    ).fetchall())
+
+    if not postulantes:
+        return
+
+    existentes = {
+        c.postulante_id: c
+        for c in db.query(Calificacion).filter(
+            Calificacion.postulante_id.in_(set(postulantes.values()))
+        ).all()
+    }
+
+    for r in resultados:
+        postulante_id = postulantes.get(r["hoja_id"])
+        if postulante_id is None:
+            continue
+
+        r["postulante_id"] = postulante_id
+
+        calificacion = existentes.get(postulante_id)
+        if calificacion is None:
+            calificacion = Calificacion(postulante_id=postulante_id)
+            db.add(calificacion)
+            existentes[postulante_id] = calificacion
+
+        calificacion.nota = int(r["nota_final"])
+        calificacion.correctas = r["correctas"]
+        calificacion.incorrectas = r["incorrectas"]
+        calificacion.en_blanco = r["en_blanco"]
+        calificacion.no_legibles = r["no_legibles"]
+        calificacion.porcentaje_aciertos = r["porcentaje"]
+        calificacion.aprobado = r["aprobado"]
+        calificacion.nota_minima = int(NOTA_MINIMA_APROBATORIA)
+        calificacion.calificado_at = ahora
+
+
+# ============================================================================
+# RECÁLCULO POR CAMBIO DE CLAVE
+# ============================================================================
+
+def recalcular_por_cambio_de_clave(
+    db: Session,
+    proceso: str,
+    clave_anterior: np.ndarray,
+    clave_nueva: np.ndarray
+) -> Dict:
+    """
+    Recalifica las hojas YA calificadas de un proceso cuando cambia la clave
+    (corrección o pregunta anulada):
+
+    - Para decidir qué hojas cambian se leen SOLO las respuestas de las
+      preguntas cambiadas
+    - Las hojas afectadas se recalifican con calificar_hojas (misma escala,
+      pesos y penalización que cualquier otra calificación), así nota,
+      columnas compactas y calificaciones quedan consistentes
+    - Si cambia el número de preguntas con clave (anulación), cambia la
+      nota de todas las hojas y se recalifican todas
+
+    No hace commit.
+
+    Returns:
+        {"success", "preguntas_cambiadas": [...], "hojas_afectadas": int,
+         "respuestas_actualizadas": int, "errores": [...]}
+    """
+    cambiadas = np.flatnonzero(clave_anterior != clave_nueva)
+    resumen = {
+        "success": True,
+        "preguntas_cambiadas": (cambiadas + 1).tolist(),
+        "hojas_afectadas": 0,
+        "respuestas_actualizadas": 0,
+        "errores": []
+    }
+
+    if len(cambiadas) == 0:
+        return resumen
+
+    hoja_ids = [f.id for f in db.execute(text("""
+        SELECT id
+        FROM hojas_respuestas
+        WHERE proceso_admision = :proceso AND nota_final IS NOT NULL
+    """), {"proceso": proceso}).fetchall()]
+
+    if not hoja_ids:
+        return resumen
+
+    ids, matriz, es_correcta_bd, _ = cargar_respuestas(db, hoja_ids, preguntas=resumen["preguntas_cambiadas"])
+
+    # Clave nueva solo en las columnas cambiadas (el resto quedó en 0 al leer)
+    clave_parcial = np.zeros(TOTAL_PREGUNTAS, dtype=np.uint8)
+    clave_parcial[cambiadas] = clave_nueva[cambiadas]
+    diferencias = calificar_matriz(matriz, clave_parcial)["es_correcta"] != es_correcta_bd
+
+    reescalar = int((clave_anterior > 0).sum()) != int((clave_nueva > 0).sum())
+    afectadas = ids if reescalar else ids[diferencias.any(axis=1)]
+
+    if len(afectadas) == 0:
+        return resumen
+
+    resultado = calificar_hojas(db, proceso, afectadas.tolist(), estado=None, clave=clave_nueva)
+
+    resumen["hojas_afectadas"] = len(resultado["resultados"])
+    resumen["respuestas_actualizadas"] = int(diferencias.sum())
+    resumen["errores"] = resultado["errores"]
+
+    return resumen
+
+
+# ============================================================================
+# RESPUESTAS COMPACTAS (una fila por hoja)
+# ============================================================================
+#
+# hojas_respuestas guarda, además de las 100 filas de respuestas (detalle
+# para auditoría y revisión):
+#   - respuestas_compactas: 100 caracteres de LETRAS_COMPACTAS
+#   - mascara_correctas: 13 bytes, bit i = pregunta i+1 correcta (mismo
+#     orden que get_bit() de PostgreSQL sobre bytea)
+# Las lecturas masivas (estadísticas, análisis por pregunta) leen una fila
+# por hoja en lugar de 100.
+
+_CODIGO_DE_CARACTER = np.full(256, NO_LEGIBLE, dtype=np.uint8)
+for _codigo, _caracter in enumerate(LETRAS_COMPACTAS):
+    _CODIGO_DE_CARACTER[ord(_caracter)] = _codigo
+
+
+def empaquetar_respuestas(codigos: np.ndarray) -> str:
+    """Códigos (100,) -> 'AB-C?...' (100 caracteres)."""
+    return "".join(LETRAS_COMPACTAS[c] for c in codigos)
+
+
+def empaquetar_dict(respuestas: Dict) -> str:
+    """
+    respuestas_compactas desde {numero_pregunta: respuesta_marcada} (para
+    guardar la hoja junto con sus filas, sin calificar todavía).
+    """
+    codigos = np.zeros(TOTAL_PREGUNTAS, dtype=np.uint8)
+
+    for numero, respuesta in respuestas.items():
+        numero = int(numero)
+        if 1 <= numero <= TOTAL_PREGUNTAS:
+            codigos[numero - 1] = codificar_respuesta(respuesta)
+
+    return empaquetar_respuestas(codigos)
+
+
+def desempaquetar_respuestas(compactas: str) -> np.ndarray:
+    """'AB-C?...' -> códigos uint8 (100,)."""
+    codigos = np.zeros(TOTAL_PREGUNTAS, dtype=np.uint8)
+    valores = np.frombuffer(compactas[:TOTAL_PREGUNTAS].encode("ascii", "replace"), dtype=np.uint8)
+    codigos[:len(valores)] = _CODIGO_DE_CARACTER[valores]
+    return codigos
+
+
+def empaquetar_mascara(es_correcta: np.ndarray) -> bytes:
+    """100 bool -> 13 bytes."""
+    return np.packbits(np.asarray(es_correcta, dtype=bool), bitorder="little").tobytes()
+
+
+def desempaquetar_mascara(mascara: bytes) -> np.ndarray:
+    """13 bytes -> bool (100,)."""
+    bits = np.unpackbits(np.frombuffer(bytes(mascara), dtype=np.uint8), bitorder="little")
+    return bits[:TOTAL_PREGUNTAS].astype(bool)
+
+
+def compactar_hojas(db: Session, hoja_ids: Sequence[int]) -> int:
+    """
+    (Re)arma las columnas compactas desde la tabla respuestas (sin commit).
+    Para hojas capturadas antes de existir las columnas o corregidas fuera
+    del motor.
+
+    Returns:
+        Cantidad de hojas compactadas (las que tienen respuestas)
+    """
+    ids, matriz, es_correcta, conteo = cargar_respuestas(db, hoja_ids)
+    con_respuestas = np.flatnonzero(conteo > 0)
+
+    if len(con_respuestas):
+        db.execute(text("""
+            UPDATE hojas_respuestas
+            SET respuestas_compactas = :compactas, mascara_correctas = :mascara
+            WHERE id = :hoja_id
+        """), [
+            {
+                "compactas": empaquetar_respuestas(matriz[i]),
+                "mascara": empaquetar_mascara(es_correcta[i]),
+                "hoja_id": int(ids[i])
+            }
+            for i in con_respuestas
+        ])
+
+    return len(con_respuestas)
+
+
+def compactar_pendientes(db: Session, proceso: str) -> int:
+    """Compacta las hojas del proceso que tienen respuestas pero no columnas compactas (sin commit)."""
+    hoja_ids = [f.id for f in db.execute(text("""
+        SELECT hr.id
+        FROM hojas_respuestas hr
+        WHERE hr.proceso_admision = :proceso
+        AND hr.respuestas_compactas IS NULL
+        AND EXISTS (SELECT 1 FROM respuestas r WHERE r.hoja_respuesta_id = hr.id)
+    """), {"proceso": proceso}).fetchall()]
+
+    if not hoja_ids:
+        return 0
+
+    print(f"🗜️  Compactando {len(hoja_ids)} hojas del proceso {proceso}")
+
+    return compactar_hojas(db, hoja_ids)
+
+
+def cargar_compactas(
+    db: Session,
+    proceso: str,
+    estados: Optional[Sequence[str]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Lee las hojas compactadas del proceso (una fila por hoja).
+
+    Returns:
+        (hoja_ids, matriz uint8 (n, 100), es_correcta bool (n, 100))
+    """
+    consulta = """
+        SELECT id, respuestas_compactas, mascara_correctas
+        FROM hojas_respuestas
+        WHERE proceso_admision = :proceso AND respuestas_compactas IS NOT NULL
+    """
+    params = {"proceso": proceso}
+    expandidos = []
+
+    if estados is not None:
+        consulta += " AND estado IN :estados"
+        params["estados"] = list(estados)
+        expandidos.append(bindparam("estados", expanding=True))
+
+    filas = db.execute(text(consulta + " ORDER BY id").bindparams(*expandidos), params).fetchall()
+
+    n = len(filas)
+    ids = np.fromiter((f.id for f in filas), dtype=np.int64, count=n)
+    matriz = np.zeros((n, TOTAL_PREGUNTAS), dtype=np.uint8)
+    es_correcta = np.zeros((n, TOTAL_PREGUNTAS), dtype=bool)
+
+    for i, f in enumerate(filas):
+        matriz[i] = desempaquetar_respuestas(f.respuestas_compactas)
+        if f.mascara_correctas is not None:
+            es_correcta[i] = desempaquetar_mascara(f.mascara_correctas)
+
+    return ids, matriz, es_correcta
@@ -0,0 +1,479 @@
+"""
+OMR Local - Lector determinístico de la hoja genérica
+app/services/omr_local.py
+
+La hoja de generar_hoja_generica tiene un diseño FIJO: marco negro grueso con
+marcas L en las esquinas y una grilla de 100 rectángulos. En lugar de pedirle
+todo a un LLM remoto:
+
+1. Se detecta el marco (marcas L) y se corrige la perspectiva a una página
+   normalizada con las MISMAS coordenadas que usa el generador PDF.
+2. Cada rectángulo se muestrea en su posición conocida (layout_hoja).
+3. La cantidad de tinta de las 100 cajas se mide de una sola vez con una
+   imagen integral (vectorizado, sin bucles por pixel).
+4. Las cajas con tinta se clasifican A-E comparando rasgos de trazo
+   (zonas, proyecciones, agujeros) contra prototipos de las letras impresas.
+
+Todo corre en milisegundos y sin red. Las cajas con confianza baja se reportan
+en "dudosas" para que la Vision API solo revise esas (y el DNI manuscrito).
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from app.services.layout_hoja import (
+    LAYOUT_VERSION,
+    TOTAL_PREGUNTAS,
+    esquinas_marco_en_pixeles,
+    obtener_layout,
+    regiones_en_pixeles
+)
+
+
+LETRAS = ["A", "B", "C", "D", "E"]
+
+# Página normalizada: pixeles por punto PDF (4.0 ≈ 288 dpi)
+ESCALA_PX = 4.0
+
+# Fracción de cada rectángulo que se descarta en los bordes (línea impresa)
+MARGEN_INTERIOR = 0.12
+
+# Proporción de tinta dentro de la caja
+UMBRAL_VACIO = 0.015
+UMBRAL_MARCADO = 0.05
+
+# Confianza mínima para aceptar la letra sin revisión
+CONFIANZA_MINIMA = 0.4
+
+TAM_GLIFO = 16
+
+# Mosaico de cajas dudosas para la Vision API (alto de cada recorte en px)
+MOSAICO_ALTO_CAJA = 96
+MOSAICO_COLUMNAS = 4
+
+
+class LectorOMR:
+    """
+    Lector OMR para la hoja genérica de 100 preguntas.
+
+    Las posiciones de las cajas y los prototipos de letras se calculan UNA vez
+    al crear el lector; leer() solo registra la página y muestrea.
+    """
+
+    def __init__(self, escala: float = ESCALA_PX, version: str = LAYOUT_VERSION):
+        layout = obtener_layout(version)
+
+        self.version = version
+        self.escala = escala
+        ancho_pt, alto_pt = layout["pagina"]
+        self.tam_pagina = (int(round(ancho_pt * escala)), int(round(alto_pt * escala)))
+
+        # Esquinas del marco (TL, TR, BR, BL) en la página normalizada
+        self.esquinas_marco = np.array(esquinas_marco_en_pixeles(escala, version), dtype="float32")
+
+        # Regiones precalculadas por layout (no se buscan en cada imagen)
+        self.cajas = np.array(
+            regiones_en_pixeles(escala, "respuestas", MARGEN_INTERIOR, version), dtype=np.int32
+        )
+        self.cajas_completas = np.array(
+            regiones_en_pixeles(escala, "respuestas", 0.0, version), dtype=np.int32
+        )
+        self.cajas_dni = np.array(regiones_en_pixeles(escala, "dni", 0.0, version), dtype=np.int32)
+
+        self.prototipos, self.clases_prototipo = self._construir_prototipos()
+
+    # ========================================================================
+    # REGISTRO DE PÁGINA
+    # ========================================================================
+
+    def registrar_pagina(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Detecta el marco negro (esquinas con marcas L) y retorna la página
+        normalizada en escala de grises, o None si no se encuentra.
+        """
+        h, w = gray.shape[:2]
+
+        # Buscar contornos en una versión reducida (rápido)
+        factor = 1000.0 / max(h, w)
+        pequena = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA) if factor < 1 else gray
+        factor = min(factor, 1.0)
+
+        binaria = cv2.adaptiveThreshold(
+            pequena, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 10
+        )
+        contornos, _ = cv2.findContours(binaria, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        area_imagen = float(pequena.shape[0] * pequena.shape[1])
+        candidatos = []
+
+        for contorno in contornos:
+            area = cv2.contourArea(contorno)
+            if area < 0.25 * area_imagen:
+                continue
+
+            aprox = cv2.approxPolyDP(contorno, 0.02 * cv2.arcLength(contorno, True), True)
+            if len(aprox) == 4 and cv2.isContourConvex(aprox):
+                candidatos.append((area, self._ordenar_esquinas(aprox.reshape(4, 2).astype("float32"))))
+
+        if not candidatos:
+            return None
+
+        # El marco es el cuadrilátero grande MÁS PEQUEÑO (el borde de la hoja
+        # queda por fuera). Sus bordes interior y exterior se promedian para
+        # quedar en el centro de la línea, igual que en el PDF.
+        candidatos.sort(key=lambda c: c[0])
+        area_marco, esquinas = candidatos[0]
+
+        if len(candidatos) > 1 and candidatos[1][0] < area_marco * 1.08:
+            esquinas = (esquinas + candidatos[1][1]) / 2
+
+        esquinas = esquinas / factor
+
+        matriz = cv2.getPerspectiveTransform(esquinas, self.esquinas_marco)
+        return cv2.warpPerspective(gray, matriz, self.tam_pagina, flags=cv2.INTER_LINEAR, borderValue=255)
+
+    @staticmethod
+    def _ordenar_esquinas(pts: np.ndarray) -> np.ndarray:
+        """Ordena puntos: top-left, top-right, bottom-right, bottom-left."""
+        s = pts.sum(axis=1)
+        diff = np.diff(pts, axis=1).ravel()
+        return np.array([
+            pts[np.argmin(s)],
+            pts[np.argmin(diff)],
+            pts[np.argmax(s)],
+            pts[np.argmax(diff)]
+        ], dtype="float32")
+
+    # ========================================================================
+    # MUESTREO Y CLASIFICACIÓN
+    # ========================================================================
+
+    @staticmethod
+    def _binarizar(pagina: np.ndarray) -> np.ndarray:
+        """Tinta = 1, papel = 0 (robusto a sombras)."""
+        binaria = cv2.adaptiveThreshold(
+            pagina, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15
+        )
+        return binaria
+
+    @staticmethod
+    def proporcion_tinta(binaria: np.ndarray, cajas: np.ndarray) -> np.ndarray:
+        """
+        Proporción de tinta de TODAS las cajas con una sola imagen integral.
+        """
+        integral = cv2.integral(binaria, sdepth=cv2.CV_32S)
+        x0, y0, x1, y1 = cajas[:, 0], cajas[:, 1], cajas[:, 2], cajas[:, 3]
+
+        suma = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        area = np.maximum((x1 - x0) * (y1 - y0), 1)
+
+        return suma / area
+
+    @staticmethod
+    def _rasgos(glifos: np.ndarray, agujeros: np.ndarray) -> np.ndarray:
+        """
+        Rasgos de trazo para un lote de glifos (n, 16, 16) normalizados.
+
+        - Densidad por zonas 4x4
+        - Proyecciones horizontal y vertical
+        - Cantidad de agujeros (A/D = 1, B = 2, C/E = 0), con peso alto
+        """
+        n = glifos.shape[0]
+        zonas = glifos.reshape(n, 4, 4, 4, 4).mean(axis=(2, 4)).reshape(n, 16)
+        proy_h = glifos.mean(axis=2)
+        proy_v = glifos.mean(axis=1)
+        agujeros_feat = np.minimum(agujeros, 2).reshape(n, 1) * 1.5
+
+        return np.hstack([zonas, proy_h * 0.5, proy_v * 0.5, agujeros_feat]).astype("float32")
+
+    @staticmethod
+    def _normalizar_glifo(mascara: np.ndarray) -> Tuple[np.ndarray, int]:
+        """
+        Recorta la tinta de una caja, la escala a TAM_GLIFO y cuenta agujeros.
+        """
+        ys, xs = np.nonzero(mascara)
+        if len(ys) == 0:
+            return np.zeros((TAM_GLIFO, TAM_GLIFO), dtype="float32"), 0
+
+        recorte = mascara[ys.min():ys.max() + 1, xs.min():xs.max() + 1].astype("uint8")
+
+        # Agujeros = contornos internos (hijos) de la tinta
+        con_borde = cv2.copyMakeBorder(recorte, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        contornos, jerarquia = cv2.findContours(con_borde, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        agujeros = 0
+        if jerarquia is not None:
+            minimo = max(2, 0.02 * recorte.size)
+            agujeros = sum(
+                1 for c, jer in zip(contornos, jerarquia[0])
+                if jer[3] != -1 and cv2.contourArea(c) >= minimo
+            )
+
+        glifo = cv2.resize(recorte.astype("float32"), (TAM_GLIFO, TAM_GLIFO), interpolation=cv2.INTER_AREA)
+        return glifo, agujeros
+
+    def _construir_prototipos(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Prototipos de A-E dibujados con varias fuentes, grosores y giros
+        (las instrucciones piden imitar las letras impresas).
+        """
+        fuentes = [cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_COMPLEX]
+        glifos, agujeros, clases = [], [], []
+
+        for clase, letra in enumerate(LETRAS):
+            for fuente in fuentes:
+                for grosor in (2, 4, 6):
+                    for angulo in (-8, 0, 8):
+                        lienzo = np.zeros((96, 96), dtype="uint8")
+                        cv2.putText(lienzo, letra, (18, 76), fuente, 2.5, 1, grosor, cv2.LINE_AA)
+
+                        if angulo:
+                            rot = cv2.getRotationMatrix2D((48, 48), angulo, 1.0)
+                            lienzo = cv2.warpAffine(lienzo, rot, (96, 96))
+
+                        glifo, n_agujeros = self._normalizar_glifo(lienzo > 0)
+                        glifos.append(glifo)
+                        agujeros.append(n_agujeros)
+                        clases.append(clase)
+
+        rasgos = self._rasgos(np.array(glifos), np.array(agujeros))
+        return rasgos, np.array(clases)
+
+    def clasificar_letras(self, binaria: np.ndarray, cajas: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """
+        Clasifica las cajas indicadas como A-E.
+
+        Returns:
+            (letras, confianzas) — confianza = margen relativo entre la mejor
+            clase y la segunda (0 = empate, 1 = sin ambigüedad)
+        """
+        if len(cajas) == 0:
+            return [], np.zeros(0)
+
+        glifos, agujeros = zip(*[
+            self._normalizar_glifo(binaria[y0:y1, x0:x1] > 0)
+            for x0, y0, x1, y1 in cajas
+        ])
+        rasgos = self._rasgos(np.array(glifos), np.array(agujeros))
+
+        # Distancias (n, prototipos) → mínima por clase (n, 5)
+        distancias = np.linalg.norm(rasgos[:, None, :] - self.prototipos[None, :, :], axis=2)
+        por_clase = np.stack([
+            distancias[:, self.clases_prototipo == clase].min(axis=1)
+            for clase in range(len(LETRAS))
+        ], axis=1)
+
+        orden = np.sort(por_clase, axis=1)
+        mejor = np.argmin(por_clase, axis=1)
+        confianzas = (orden[:, 1] - orden[:, 0]) / (orden[:, 1] + 1e-6)
+
+        return [LETRAS[i] for i in mejor], confianzas
+
+    # ========================================================================
+    # LECTURA COMPLETA
+    # ========================================================================
+
+    def leer(
+        self,
+        imagen: np.ndarray,
+        confianza_minima: float = CONFIANZA_MINIMA,
+        mosaico: bool = False,
+        incluir_dni: bool = False
+    ) -> Dict:
+        """
+        Lee las 100 respuestas de una imagen (BGR o gris).
+
+        Con mosaico=True agrega "mosaico" (JPEG bytes o None) con los recortes
+        de las cajas dudosas (y del DNI si incluir_dni=True) para la Vision API.
+
+        Returns:
+            {
+                "success": bool,
+                "datos": {"dni_postulante": "", "codigo_hoja": "", "respuestas": [...]},
+                "confianzas": [100 floats],
+                "dudosas": [números de pregunta con confianza baja],
+                "sugerencias": {pregunta: letra} para las dudosas con tinta,
+                "tiempo_procesamiento": float,
+                "metodo": "omr_local",
+                "mosaico": bytes | None (solo con mosaico=True)
+            }
+        """
+        inicio = time.time()
+
+        gray = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY) if imagen.ndim == 3 else imagen
+        pagina = self.registrar_pagina(gray)
+
+        if pagina is None:
+            return {
+                "success": False,
+                "error": "No se detectó el marco de la hoja (marcas de esquina)",
+                "tiempo_procesamiento": time.time() - inicio,
+                "metodo": "omr_local"
+            }
+
+        # Binarizar solo la franja de la grilla (el resto no se muestrea)
+        y_min = max(int(self.cajas[:, 1].min()) - 32, 0)
+        y_max = int(self.cajas[:, 3].max()) + 32
+        binaria = np.zeros(pagina.shape, dtype="uint8")
+        binaria[y_min:y_max] = self._binarizar(pagina[y_min:y_max])
+
+        tinta = self.proporcion_tinta(binaria, self.cajas)
+
+        vacias = tinta <= UMBRAL_VACIO
+        marcadas = tinta >= UMBRAL_MARCADO
+
+        confianzas = np.zeros(TOTAL_PREGUNTAS, dtype="float64")
+        confianzas[vacias] = 1.0 - 0.5 * (tinta[vacias] / UMBRAL_VACIO)
+
+        respuestas: List[Optional[str]] = [None] * TOTAL_PREGUNTAS
+        sugerencias: Dict[int, str] = {}
+
+        indices_marcadas = np.flatnonzero(marcadas)
+        letras, conf_letras = self.clasificar_letras(binaria, self.cajas[indices_marcadas])
+
+        for idx, letra, conf in zip(indices_marcadas, letras, conf_letras):
+            confianzas[idx] = conf
+            if conf >= confianza_minima:
+                respuestas[idx] = letra
+            else:
+                sugerencias[int(idx) + 1] = letra
+
+        # Entre vacío y marcado: tinta ambigua (borrones, puntos, marcas tenues)
+        confianzas[~vacias & ~marcadas] = 0.0
+
+        dudosas = [int(i) + 1 for i in np.flatnonzero(confianzas < confianza_minima)]
+
+        resultado = {
+            "success": True,
+            "datos": {
+                "dni_postulante": "",
+                "codigo_hoja": "",
+                "respuestas": respuestas
+            },
+            "confianzas": [round(float(c), 3) for c in confianzas],
+            "tinta": [round(float(t), 4) for t in tinta],
+            "dudosas": dudosas,
+            "sugerencias": sugerencias,
+            "tiempo_procesamiento": time.time() - inicio,
+            "metodo": "omr_local",
+            "layout_version": self.version
+        }
+
+        if mosaico:
+            resultado["mosaico"] = (
+                self.construir_mosaico(pagina, dudosas, incluir_dni)
+                if dudosas or incluir_dni else None
+            )
+
+        return resultado
+
+    # ========================================================================
+    # MOSAICO PARA LA VISION API
+    # ========================================================================
+
+    def construir_mosaico(self, pagina: np.ndarray, numeros: List[int], incluir_dni: bool = False) -> bytes:
+        """
+        Arma UNA imagen compacta con los recortes de las cajas indicadas, cada
+        uno con su número de pregunta a la izquierda. Con incluir_dni=True la
+        primera fila es la fila de rectángulos del DNI con la etiqueta "DNI".
+
+        Args:
+            pagina: Página normalizada (registrar_pagina)
+            numeros: Preguntas 1..100 a recortar
+
+        Returns:
+            JPEG en bytes
+        """
+        celdas_dni = []
+        if incluir_dni:
+            x0, y0 = self.cajas_dni[:, 0].min(), self.cajas_dni[:, 1].min()
+            x1, y1 = self.cajas_dni[:, 2].max(), self.cajas_dni[:, 3].max()
+            celdas_dni.append(self._celda("DNI", self._recortar(pagina, x0, y0, x1, y1)))
+
+        celdas = [
+            self._celda(str(numero), self._recortar(pagina, *self.cajas_completas[numero - 1]))
+            for numero in numeros
+        ]
+
+        # El DNI va solo en la primera fila; las cajas en filas de MOSAICO_COLUMNAS
+        filas = [celdas_dni] if celdas_dni else []
+        filas += [celdas[i:i + MOSAICO_COLUMNAS] for i in range(0, len(celdas), MOSAICO_COLUMNAS)]
+
+        separacion = 8
+        ancho = max(
+            sum(c.shape[1] for c in fila) + separacion * (len(fila) + 1) for fila in filas
+        )
+        alto = len(filas) * (MOSAICO_ALTO_CAJA + separacion) + separacion
+        lienzo = np.full((alto, ancho), 255, dtype="uint8")
+
+        y = separacion
+        for fila in filas:
+            x = separacion
+            for celda in fila:
+                lienzo[y:y + MOSAICO_ALTO_CAJA, x:x + celda.shape[1]] = celda
+                cv2.rectangle(lienzo, (x, y), (x + celda.shape[1] - 1, y + MOSAICO_ALTO_CAJA - 1), 160, 1)
+                x += celda.shape[1] + separacion
+            y += MOSAICO_ALTO_CAJA + separacion
+
+        _, jpeg = cv2.imencode(".jpg", lienzo, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        return jpeg.tobytes()
+
+    @staticmethod
+    def _celda(etiqueta: str, recorte: np.ndarray) -> np.ndarray:
+        """Recorte con su etiqueta (número de pregunta) en una franja gris a la izquierda."""
+        etiqueta_ancho = MOSAICO_ALTO_CAJA
+        celda = np.full((MOSAICO_ALTO_CAJA, etiqueta_ancho + recorte.shape[1]), 255, dtype="uint8")
+        celda[:, :etiqueta_ancho] = 225
+        cv2.putText(
+            celda, etiqueta, (8, MOSAICO_ALTO_CAJA // 2 + 12),
+            cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2, cv2.LINE_AA
+        )
+        celda[:, etiqueta_ancho:] = recorte
+        return celda
+
+    @staticmethod
+    def _recortar(pagina: np.ndarray, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Recorte con un poco de aire alrededor, escalado a MOSAICO_ALTO_CAJA."""
+        aire = int((y1 - y0) * 0.3)
+        recorte = pagina[max(y0 - aire, 0):y1 + aire, max(x0 - aire, 0):x1 + aire]
+        escala = MOSAICO_ALTO_CAJA / recorte.shape[0]
+        ancho = max(int(round(recorte.shape[1] * escala)), 1)
+        return cv2.resize(recorte, (ancho, MOSAICO_ALTO_CAJA), interpolation=cv2.INTER_AREA)
+
+
+_lectores: Dict[str, LectorOMR] = {}
+
+
+def obtener_lector(version: str = LAYOUT_VERSION) -> LectorOMR:
+    """Lector compartido por versión de layout (regiones y prototipos se calculan una vez)."""
+    if version not in _lectores:
+        _lectores[version] = LectorOMR(version=version)
+
+    return _lectores[version]
+
+
+def leer_hoja_omr(
+    imagen_path: Union[str, bytes],
+    confianza_minima: float = CONFIANZA_MINIMA,
+    mosaico: bool = False,
+    incluir_dni: bool = False
+) -> Dict:
+    """
+    Lee una hoja con el OMR local (síncrono, CPU) desde una ruta o desde los
+    bytes ya en memoria (JPEG/PNG). Ver LectorOMR.leer para mosaico / incluir_dni.
+    """
+    if isinstance(imagen_path, (bytes, bytearray)):
+        imagen = cv2.imdecode(np.frombuffer(imagen_path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        origen = "bytes en memoria"
+    else:
+        imagen = cv2.imread(imagen_path, cv2.IMREAD_GRAYSCALE)
+        origen = imagen_path
+
+    if imagen is None:
+        return {"success": False, "error": f"No se pudo cargar la imagen: {origen}", "metodo": "omr_local"}
+
+    return obtener_lector().leer(
+        imagen, confianza_minima=confianza_minima, mosaico=mosaico, incluir_dni=incluir_dni
+    )
@@ -1,8 +1,16 @@
 """
 Generador de PDFs GENÉRICOS - Versión Final
 100 preguntas | Rectángulos optimizados | Instrucciones claras
+
+La parte fija de la hoja (marco, marcas L, encabezado del proceso, cajas del
+DNI, las 100 cajas y el pie del profesor) se dibuja UNA vez por documento
+como form XObject de ReportLab (plantilla por layout y proceso). Cada hoja
+solo estampa encima lo que cambia: N° de orden, código de hoja y pie.
 """
 
+import re
+from typing import Dict, Sequence
+
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
@@ -11,6 +19,18 @@ from datetime import datetime
 import pytz
 
 
+# Geometría de la hoja: descriptor versionado compartido con el lector OMR
+from app.services.layout_hoja import (
+    LAYOUT_VERSION,
+    MARGEN_EXTERNO,
+    MARCA_SIZE,
+    PADDING,
+    DNI_RECT_ALTO,
+    RESP_RECT_ALTO,
+    obtener_layout
+)
+
+
 def generar_hoja_generica(
     output_path: str,
     numero_hoja: int,
@@ -21,243 +41,304 @@ def generar_hoja_generica(
     """
     Genera hoja de respuestas genérica - 100 preguntas
     """
-    
+
+    c = canvas.Canvas(output_path, pagesize=A4)
+
+    dibujar_hoja_generica(c, numero_hoja, codigo_hoja, proceso)
+
+    # ------------------------------------------------------------------------
+    # GUARDAR
+    # ------------------------------------------------------------------------
+    c.save()
+
+    print(f"  ✅ PDF generado: hoja_{numero_hoja:03d}_{codigo_hoja}.pdf")
+
+
+def generar_documento_hojas(
+    output_path: str,
+    hojas: Sequence[Dict],
+    proceso: str
+) -> int:
+    """
+    Genera UN PDF multi-página (una hoja por página, en el orden recibido)
+    con la plantilla del proceso definida una sola vez.
+
+    Args:
+        hojas: [{"numero_hoja": 1, "codigo_hoja": "ABC12345"}, ...]
+
+    Returns:
+        Cantidad de páginas generadas
+    """
     c = canvas.Canvas(output_path, pagesize=A4)
+    fecha_hora = datetime.now(pytz.timezone('America/Lima')).strftime("%d/%m/%Y %H:%M")
+
+    for hoja in hojas:
+        dibujar_hoja_generica(c, hoja["numero_hoja"], hoja["codigo_hoja"], proceso, fecha_hora)
+        c.showPage()
+
+    c.save()
+
+    print(f"  ✅ PDF generado: {len(hojas)} hojas en un documento")
+
+    return len(hojas)
+
+
+def dibujar_hoja_generica(
+    c: canvas.Canvas,
+    numero_hoja: int,
+    codigo_hoja: str,
+    proceso: str,
+    fecha_hora: str = None
+):
+    """
+    Dibuja UNA hoja en la página actual del canvas (no cierra la página).
+
+    La plantilla del proceso se define en el documento la primera vez y las
+    hojas siguientes del MISMO canvas solo la referencian.
+
+    Args:
+        fecha_hora: Texto del pie (por defecto, ahora en hora de Lima)
+    """
+    nombre = nombre_plantilla(proceso)
+
+    if not c.hasForm(nombre):
+        c.beginForm(nombre)
+        _dibujar_plantilla(c, proceso)
+        c.endForm()
+
+    c.doForm(nombre)
+
+    if fecha_hora is None:
+        fecha_hora = datetime.now(pytz.timezone('America/Lima')).strftime("%d/%m/%Y %H:%M")
+
+    _estampar_campos(c, numero_hoja, codigo_hoja, fecha_hora)
+
+
+def nombre_plantilla(proceso: str, version: str = LAYOUT_VERSION) -> str:
+    """Nombre del form XObject de la plantilla (layout + proceso)."""
+    return re.sub(r"\W", "_", f"HojaGenerica_{version}_{proceso}")
+
+
+# ============================================================================
+# PLANTILLA (parte fija, una vez por documento)
+# ============================================================================
+
+def _dibujar_plantilla(c: canvas.Canvas, proceso: str):
     width, height = A4
-    
+    geometria = obtener_layout(LAYOUT_VERSION)
+
     # ========================================================================
     # MÁRGENES Y ÁREA ÚTIL
     # ========================================================================
-    margen_externo = 1.5 * cm
-    
+    margen_externo = MARGEN_EXTERNO
+
     # Marco GRIS
     c.setStrokeColor(colors.lightgrey)
     c.setLineWidth(0.3)
-    c.rect(margen_externo, margen_externo, 
+    c.rect(margen_externo, margen_externo,
            width - 2*margen_externo, height - 2*margen_externo)
-    
+
     # Marco NEGRO GRUESO
-    margen_marco = margen_externo + 0.5*cm
-    area_x = margen_marco
-    area_y = margen_marco
-    area_width = width - 2*margen_marco
-    area_height = height - 2*margen_marco
-    
+    area_x, area_y, area_width, area_height = geometria["marco"]
+
     c.setStrokeColor(colors.black)
     c.setLineWidth(3)
     c.rect(area_x, area_y, area_width, area_height)
-    
+
     # Marcas L en esquinas
-    marca_size = 0.8 * cm
+    marca_size = MARCA_SIZE
     c.setLineWidth(3)
-    
+
     # Superior izquierda
     c.line(area_x, area_y + area_height, area_x + marca_size, area_y + area_height)
     c.line(area_x, area_y + area_height, area_x, area_y + area_height - marca_size)
-    
+
     # Superior derecha
-    c.line(area_x + area_width, area_y + area_height, 
+    c.line(area_x + area_width, area_y + area_height,
            area_x + area_width - marca_size, area_y + area_height)
-    c.line(area_x + area_width, area_y + area_height, 
+    c.line(area_x + area_width, area_y + area_height,
            area_x + area_width, area_y + area_height - marca_size)
-    
+
     # Inferior izquierda
     c.line(area_x, area_y, area_x + marca_size, area_y)
     c.line(area_x, area_y, area_x, area_y + marca_size)
-    
+
     # Inferior derecha
     c.line(area_x + area_width, area_y, area_x + area_width - marca_size, area_y)
     c.line(area_x + area_width, area_y, area_x + area_width, area_y + marca_size)
-    
+
     # ========================================================================
     # CONTENIDO
     # ========================================================================
-    padding = 0.8 * cm
-    x_start = area_x + padding
+    padding = PADDING
+    x_start = geometria["x_start"]
     y = area_y + area_height - padding - 0.8*cm
-    content_width = area_width - 2*padding
-    
+    content_width = geometria["content_width"]
+
     # ------------------------------------------------------------------------
     # ENCABEZADO
     # ------------------------------------------------------------------------
     c.setFont("Helvetica-Bold", 12)
     c.drawCentredString(width/2, y, "I. S. T. Pedro A. Del Águila H.")
     y -= 0.5*cm
-    
+
     c.setFont("Helvetica", 9)
     c.drawCentredString(width/2, y, f"EXAMEN DE ADMISIÓN - Proceso {proceso}")
     y -= 0.7*cm
-    
+
     c.setLineWidth(1.5)
     c.line(x_start, y, x_start + content_width, y)
     y -= 0.55*cm
-    
+
     # ------------------------------------------------------------------------
     # DNI POSTULANTE (8 RECTÁNGULOS MÁS ALTOS)
     # ------------------------------------------------------------------------
     c.setFont("Helvetica-Bold", 9)
     c.drawString(x_start, y, "DNI-POSTULANTE")
     y -= 0.45*cm
-    
-    # Rectángulos más altos
-    rect_ancho = 1.0*cm      # 10mm (antes 9mm)
-    rect_alto = 0.85*cm      # 8.5mm (antes 6.5mm) ← +30%
-    espaciado = 0.18*cm      # Más espacio entre rectángulos
-    
-    total_ancho_dni = (8 * rect_ancho) + (7 * espaciado)
-    dni_start_x = x_start + (content_width - total_ancho_dni) / 2
-    
+
+    # Rectángulos más altos (10mm x 8.5mm)
+    rect_alto = DNI_RECT_ALTO
+
     c.setLineWidth(1.2)
     c.setStrokeColor(colors.black)
-    
-    for i in range(8):
-        rect_x = dni_start_x + (i * (rect_ancho + espaciado))
-        c.rect(rect_x, y - rect_alto, rect_ancho, rect_alto, fill=0)
-        
+
+    for i, (rect_x, rect_y, rect_ancho, _) in enumerate(geometria["dni"]):
+        c.rect(rect_x, rect_y, rect_ancho, rect_alto, fill=0)
+
         c.setFont("Helvetica", 6)
         c.setFillColor(colors.grey)
         c.drawCentredString(rect_x + rect_ancho/2, y - rect_alto - 0.25*cm, str(i+1))
         c.setFillColor(colors.black)
-    
+
     y -= rect_alto + 0.45*cm
-    
+
     # ------------------------------------------------------------------------
-    # N° ORDEN + CÓDIGO
+    # N° ORDEN + CÓDIGO (solo etiquetas y círculo; los valores se estampan)
     # ------------------------------------------------------------------------
     col_orden_x = x_start + content_width * 0.25
     col_codigo_x = x_start + content_width * 0.75
-    
+
     # N° Orden
     c.setFont("Helvetica-Bold", 8)
     c.drawCentredString(col_orden_x, y, "N° Orden")
     y_circulo = y - 0.55*cm
-    
+
     circulo_radio = 0.45*cm
     c.setLineWidth(2.5)
     c.setStrokeColor(colors.black)
     c.circle(col_orden_x, y_circulo, circulo_radio, fill=0)
-    
-    c.setFont("Helvetica-Bold", 20)
-    c.drawCentredString(col_orden_x, y_circulo - 0.22*cm, str(numero_hoja))
-    
+
     # Código de hoja
     c.setFont("Helvetica-Bold", 8)
     c.drawCentredString(col_codigo_x, y, "CÓDIGO DE HOJA:")
-    c.setFont("Courier-Bold", 18)
-    c.drawCentredString(col_codigo_x, y - 0.55*cm, codigo_hoja)
-    
+
     y -= 1.15*cm
-    
+
     # Línea separadora
     c.setLineWidth(2)
     c.line(x_start, y, x_start + content_width, y)
     y -= 0.55*cm
-    
+
     # ------------------------------------------------------------------------
     # INSTRUCCIONES MEJORADAS
     # ------------------------------------------------------------------------
     c.setFillColor(colors.grey)
     c.setFont("Helvetica-Bold", 8)
-    
+
     texto1 = "Marque con letra MAYÚSCULA (A, B, C, D o E) dentro del recuadro."
     c.drawString(x_start, y, texto1)
     y -= 0.32*cm
-    
+
     texto2 = "Imite las letras impresas: A B C D E    |    Deje en blanco si no sabe."
     c.drawString(x_start, y, texto2)
     y -= 0.55*cm
-    
+
     c.setFillColor(colors.black)
-    
+
     # ------------------------------------------------------------------------
     # RESPUESTAS: 100 PREGUNTAS (5×20) - RECTÁNGULOS MÁS ALTOS
     # ------------------------------------------------------------------------
-    espacio_pie = 1.5*cm  # ← Aumentado para dar más espacio a firma
-    espacio_disponible = y - (area_y + padding + espacio_pie)
-    
-    filas_totales = 20
-    altura_por_fila = espacio_disponible / filas_totales
-    
-    col_ancho = content_width / 5.2
-    
-    # Rectángulos más altos
-    rect_ancho_resp = 0.75*cm
-    rect_alto_resp = 0.5*cm  # ← Aumentado de 0.45cm
-    
-    pregunta_num = 1
-    
-    for fila in range(filas_totales):
-        x = x_start + 0.1*cm
-        
-        for col in range(5):
-            if pregunta_num <= 100:
-                # Número
-                c.setFont("Helvetica-Bold", 9)
-                num_y = y + (rect_alto_resp / 2) - 0.12*cm
-                c.drawString(x, num_y, f"{pregunta_num}.")
-                
-                # Rectángulo
-                rect_x = x + 0.6*cm
-                rect_y = y - 0.05*cm
-                
-                c.setLineWidth(1)
-                c.setStrokeColor(colors.black)
-                c.rect(rect_x, rect_y, rect_ancho_resp, rect_alto_resp, fill=0)
-                
-                pregunta_num += 1
-            
-            x += col_ancho
-        
-        y -= altura_por_fila
-    
+    # Posiciones precalculadas en layout_hoja (5×20)
+    rect_alto_resp = RESP_RECT_ALTO
+
+    for pregunta_num, (rect_x, rect_y, rect_ancho_resp, _) in enumerate(geometria["respuestas"], start=1):
+        # Número
+        c.setFont("Helvetica-Bold", 9)
+        num_y = rect_y + 0.05*cm + (rect_alto_resp / 2) - 0.12*cm
+        c.drawString(rect_x - 0.6*cm, num_y, f"{pregunta_num}.")
+
+        # Rectángulo
+        c.setLineWidth(1)
+        c.setStrokeColor(colors.black)
+        c.rect(rect_x, rect_y, rect_ancho_resp, rect_alto_resp, fill=0)
+
     # ------------------------------------------------------------------------
     # PIE: SECCIÓN PROFESOR CON MÁS ESPACIO
     # ------------------------------------------------------------------------
     y = area_y + padding + 1*cm  # ← Subido para dar más espacio
-    
+
     # Recuadro
     c.setFillColor(colors.HexColor('#f5f5f5'))
     c.setStrokeColor(colors.black)
     c.setLineWidth(1)
     c.rect(x_start, y - 0.5*cm, content_width, 1.1*cm, fill=1, stroke=1)
-    
+
     c.setFillColor(colors.black)
-    
+
     # Título
     c.setFont("Helvetica-Bold", 7)
     c.drawString(x_start + 0.2*cm, y + 0.35*cm, "DATOS DEL PROFESOR VIGILANTE")
-    
+
     # Campos ajustados
     campo_y = y - 0.05*cm
-    
+
     c.setFont("Helvetica", 7)
-    
+
     # DNI (más corto)
     c.drawString(x_start + 0.3*cm, campo_y, "DNI:")
     c.setLineWidth(0.5)
     c.line(x_start + 1*cm, campo_y - 0.1*cm, x_start + 3*cm, campo_y - 0.1*cm)  # ← Acortado
-    
+
     # Nombres y Apellidos
     c.drawString(x_start + 3.5*cm, campo_y, "Nombres y Apellidos:")
     c.line(x_start + 6.5*cm, campo_y - 0.1*cm, x_start + 11*cm, campo_y - 0.1*cm)
-    
+
     # Firma (más largo)
     c.drawString(x_start + 11.5*cm, campo_y, "Firma:")
     c.line(x_start + 13*cm, campo_y - 0.1*cm, x_start + content_width - 0.3*cm, campo_y - 0.1*cm)  # ← Extendido
-    
+
+
+# ============================================================================
+# CAMPOS VARIABLES (por hoja)
+# ============================================================================
+
+def _estampar_campos(c: canvas.Canvas, numero_hoja: int, codigo_hoja: str, fecha_hora: str):
+    width, _ = A4
+    geometria = obtener_layout(LAYOUT_VERSION)
+    area_y = geometria["marco"][1]
+    x_start = geometria["x_start"]
+    content_width = geometria["content_width"]
+    y = geometria["y_orden"]
+
+    col_orden_x = x_start + content_width * 0.25
+    col_codigo_x = x_start + content_width * 0.75
+    y_circulo = y - 0.55*cm
+
+    c.setFillColor(colors.black)
+
+    # N° Orden (dentro del círculo)
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(col_orden_x, y_circulo - 0.22*cm, str(numero_hoja))
+
+    # Código de hoja
+    c.setFont("Courier-Bold", 18)
+    c.drawCentredString(col_codigo_x, y - 0.55*cm, codigo_hoja)
+
     # Footer con más espacio arriba
-    y_footer = area_y + padding + 0.3*cm
-    peru_tz = pytz.timezone('America/Lima')
-    fecha_hora = datetime.now(peru_tz).strftime("%d/%m/%Y %H:%M")
-    
+    y_footer = area_y + PADDING + 0.3*cm
+
     c.setFont("Helvetica", 6)
     c.setFillColor(colors.grey)
-    c.drawCentredString(width/2, y_footer, 
-                       f"POSTULANDO | Código: {codigo_hoja} | Hoja N° {numero_hoja} | {fecha_hora}")
-    
-    # ------------------------------------------------------------------------
-    # GUARDAR
-    # ------------------------------------------------------------------------
-    c.save()
-    
-    print(f"  ✅ PDF generado: hoja_{numero_hoja:03d}_{codigo_hoja}.pdf")
\ No newline at end of file
+    c.drawCentredString(width/2, y_footer,
+                       f"POSTULANDO | Código: {codigo_hoja} | Hoja N° {numero_hoja} | {fecha_hora} | Layout {LAYOUT_VERSION}")
@@ -0,0 +1,207 @@
+"""
+Pool de Imágenes - Procesamiento OpenCV en procesos separados
+app/services/pool_imagenes.py
+
+El pre-procesamiento (sombras, CLAHE, Otsu, perspectiva) y el OMR local son
+CPU puro: en hilos compiten por el GIL con el event loop y no escalan con
+los núcleos. Aquí se delegan a un ProcessPoolExecutor ACOTADO
+(settings.imagenes_procesos) cuyos workers quedan "calientes":
+
+- El initializer importa OpenCV y crea el preprocesador y el lector OMR una
+  sola vez por proceso (los prototipos de letras no se recalculan por hoja).
+- Entre procesos viajan rutas o bytes (JPEG/PNG codificados), nunca arrays
+  numpy completos: la imagen se decodifica dentro del worker.
+
+metricas_pool() expone la profundidad de cola (tareas esperando un proceso
+libre), las tareas en curso y la latencia promedio (incluye la espera).
+
+Con settings.imagenes_procesos = 0 todo corre en el executor de hilos de
+vision_async (útil en entornos con un solo núcleo).
+"""
+
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from app.config import settings
+from app.services.vision_async import ejecutar_bloqueante
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+_metricas = {
+    "pendientes": 0,
+    "completadas": 0,
+    "fallidas": 0,
+    "tiempo_total_ms": 0.0
+}
+
+
+# ============================================================================
+# ESTADO DENTRO DE CADA PROCESO WORKER
+# ============================================================================
+
+_preprocesador_v2 = None
+_preprocesador_v1 = None
+
+
+def _inicializar_worker():
+    """Se ejecuta UNA vez al arrancar cada proceso del pool."""
+    import cv2
+
+    # Cada proceso usa un hilo de OpenCV: el paralelismo lo da el pool
+    cv2.setNumThreads(1)
+
+    _crear_estado()
+
+
+def _crear_estado():
+    global _preprocesador_v2, _preprocesador_v1
+
+    from app.services.image_preprocessor import ImagePreprocessor
+    from app.services.image_preprocessor_v2 import ImagePreprocessorV2
+    from app.services.omr_local import obtener_lector
+
+    _preprocesador_v2 = ImagePreprocessorV2()
+    _preprocesador_v1 = ImagePreprocessor()
+    obtener_lector()
+
+
+def _ping() -> bool:
+    return True
+
+
+def preprocesar_v2_en_memoria(imagen: Union[str, bytes]) -> Tuple[bytes, Dict]:
+    """ImagePreprocessorV2.procesar_en_memoria dentro del worker."""
+    return _preprocesador_v2.procesar_en_memoria(imagen)
+
+
+def preprocesar_v1(imagen_path: str) -> Tuple[str, Dict]:
+    """ImagePreprocessor.procesar_completo (versión básica) dentro del worker."""
+    return _preprocesador_v1.procesar_completo(imagen_path)
+
+
+def leer_omr(
+    imagen: Union[str, bytes],
+    confianza_minima: float,
+    mosaico: bool = False,
+    incluir_dni: bool = False
+) -> Dict:
+    """omr_local.leer_hoja_omr dentro del worker (lector ya construido)."""
+    from app.services.omr_local import leer_hoja_omr
+
+    return leer_hoja_omr(imagen, confianza_minima, mosaico=mosaico, incluir_dni=incluir_dni)
+
+
+# ============================================================================
+# API PÚBLICA (event loop)
+# ============================================================================
+
+def obtener_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Pool compartido (se crea la primera vez). None si está desactivado.
+    """
+    global _pool
+
+    if settings.imagenes_procesos <= 0:
+        return None
+
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.imagenes_procesos,
+            initializer=_inicializar_worker
+        )
+
+    return _pool
+
+
+async def calentar_pool():
+    """
+    Arranca todos los procesos del pool (y su initializer) antes de la
+    primera hoja, para que la primera captura no pague el arranque.
+    """
+    pool = obtener_pool()
+    if pool is None:
+        return
+
+    loop = asyncio.get_running_loop()
+    inicio = time.time()
+
+    await asyncio.gather(*[
+        loop.run_in_executor(pool, _ping) for _ in range(settings.imagenes_procesos)
+    ])
+
+    print(f"🔥 Pool de imágenes listo: {settings.imagenes_procesos} procesos ({time.time() - inicio:.1f}s)")
+
+
+def cerrar_pool():
+    global _pool
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def ejecutar_en_proceso(func: Callable, *args, **kwargs) -> Any:
+    """
+    Ejecuta una función del módulo (picklable) en el pool de procesos sin
+    bloquear el event loop. Los argumentos deben ser livianos (rutas, bytes).
+
+    Uso:
+        imagen_bytes, metadata = await ejecutar_en_proceso(preprocesar_v2_en_memoria, imagen_path)
+    """
+    pool = obtener_pool()
+
+    if pool is None:
+        return await ejecutar_bloqueante(_en_hilo, func, *args, **kwargs)
+
+    _metricas["pendientes"] += 1
+    inicio = time.time()
+
+    try:
+        resultado = await asyncio.wrap_future(pool.submit(func, *args, **kwargs))
+        _metricas["completadas"] += 1
+        return resultado
+
+    except BrokenProcessPool:
+        # Un worker murió (OOM, segfault de OpenCV): el próximo llamado crea otro pool
+        _metricas["fallidas"] += 1
+        cerrar_pool()
+        raise
+
+    except Exception:
+        _metricas["fallidas"] += 1
+        raise
+
+    finally:
+        _metricas["pendientes"] -= 1
+        _metricas["tiempo_total_ms"] += (time.time() - inicio) * 1000
+
+
+def metricas_pool() -> Dict:
+    """Profundidad de cola y latencia del pool (para /health y monitoreo)."""
+    terminadas = _metricas["completadas"] + _metricas["fallidas"]
+    procesos = max(settings.imagenes_procesos, 0)
+    pendientes = _metricas["pendientes"]
+
+    return {
+        "procesos": procesos,
+        "activo": _pool is not None,
+        "en_cola": max(pendientes - procesos, 0) if procesos else 0,
+        "en_curso": min(pendientes, procesos) if procesos else pendientes,
+        "completadas": _metricas["completadas"],
+        "fallidas": _metricas["fallidas"],
+        "tiempo_promedio_ms": round(_metricas["tiempo_total_ms"] / terminadas, 1) if terminadas else None
+    }
+
+
+def _en_hilo(func: Callable, *args, **kwargs) -> Any:
+    """
+    Sin pool: las funciones de worker necesitan su estado inicializado en
+    ESTE proceso (una sola vez, fuera del event loop).
+    """
+    if _preprocesador_v2 is None:
+        _crear_estado()
+    return func(*args, **kwargs)
@@ -0,0 +1,204 @@
+"""
+Pool de PDFs - Renderizado de hojas de respuestas en procesos separados
+app/services/pool_pdf.py
+
+Generar las hojas de un proceso completo (miles de postulantes) con un
+canvas de ReportLab por hoja es CPU puro: en serie, dentro del request,
+ocupa un solo núcleo durante minutos. Aquí el renderizado se reparte en un
+ProcessPoolExecutor ACOTADO (settings.pdf_procesos):
+
+- La BD se toca SOLO en el proceso principal: el endpoint crea los
+  registros de HojaRespuesta y arma la lista de trabajos; los workers
+  reciben parámetros planos (rutas, códigos, números) y escriben el PDF.
+- Los resultados se recogen a medida que terminan (no en orden de envío)
+  y se devuelven en el orden original, así los ZIP salen ordenados.
+- iterar_renderizados() entrega cada hoja apenas está lista (en orden de
+  envío, con una ventana acotada en vuelo) para alimentar un ZIP en
+  streaming sin esperar al proceso completo.
+- Si una hoja falla, las que aún no empezaron se cancelan.
+
+Con settings.pdf_procesos = 0 todo corre en el executor de hilos de
+vision_async.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.services.vision_async import ejecutar_bloqueante
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# ============================================================================
+# DENTRO DE CADA PROCESO WORKER
+# ============================================================================
+
+def _generadores() -> Dict:
+    from app.services.pdf_generator_simple import generar_documento_hojas, generar_hoja_generica
+    from app.services.pdf_generator_v3 import generar_hoja_respuestas_v3
+
+    return {
+        "generica": generar_hoja_generica,
+        "documento_generica": generar_documento_hojas,
+        "v3": generar_hoja_respuestas_v3
+    }
+
+
+def renderizar_hoja(generador: str, parametros: Dict) -> str:
+    """
+    Genera UN PDF con el generador indicado ("generica", "v3" o
+    "documento_generica": varias hojas en un PDF multi-página).
+
+    Returns:
+        output_path del PDF generado
+    """
+    _generadores()[generador](**parametros)
+
+    output_path = parametros["output_path"]
+    if not os.path.exists(output_path):
+        raise RuntimeError(f"PDF no generado: {os.path.basename(output_path)}")
+
+    return output_path
+
+
+# ============================================================================
+# API PÚBLICA (event loop)
+# ============================================================================
+
+def obtener_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Pool compartido (se crea la primera vez). None si está desactivado.
+    """
+    global _pool
+
+    if settings.pdf_procesos <= 0:
+        return None
+
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.pdf_procesos)
+
+    return _pool
+
+
+def cerrar_pool():
+    global _pool
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _enviar(pool: Optional[ProcessPoolExecutor], generador: str, parametros: Dict) -> asyncio.Future:
+    """Una hoja al pool de procesos (o al executor de hilos si pool es None)."""
+    if pool is None:
+        return asyncio.ensure_future(ejecutar_bloqueante(renderizar_hoja, generador, parametros))
+
+    return asyncio.wrap_future(pool.submit(renderizar_hoja, generador, parametros))
+
+
+async def renderizar_hojas(trabajos: Sequence[Tuple[str, Dict]]) -> List[str]:
+    """
+    Renderiza todas las hojas en paralelo.
+
+    Args:
+        trabajos: lista de (generador, parametros) para renderizar_hoja
+
+    Returns:
+        Rutas de los PDFs en el MISMO orden que trabajos
+
+    Uso:
+        rutas = await renderizar_hojas([("generica", {"output_path": ..., ...}), ...])
+    """
+    if not trabajos:
+        return []
+
+    pool = obtener_pool()
+    futuros = [_enviar(pool, generador, parametros) for generador, parametros in trabajos]
+
+    indices = {futuro: i for i, futuro in enumerate(futuros)}
+    rutas: List[Optional[str]] = [None] * len(futuros)
+    pendientes = set(futuros)
+    total = len(futuros)
+    paso_progreso = max(total // 10, 1)
+    inicio = time.time()
+
+    try:
+        while pendientes:
+            terminados, pendientes = await asyncio.wait(
+                pendientes, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for futuro in terminados:
+                rutas[indices[futuro]] = futuro.result()
+
+            listas = total - len(pendientes)
+            if listas % paso_progreso < len(terminados) or not pendientes:
+                print(f"   🖨️  PDFs: {listas}/{total}")
+
+    except BrokenProcessPool:
+        # Un worker murió: el próximo llamado crea otro pool
+        cerrar_pool()
+        raise
+
+    finally:
+        for futuro in pendientes:
+            futuro.cancel()
+
+    duracion = time.time() - inicio
+    modo = f"{settings.pdf_procesos} procesos" if pool is not None else "hilos"
+    print(f"✅ {total} PDFs en {duracion:.1f}s ({total / duracion if duracion > 0 else 0:.0f} PDFs/s, {modo})")
+
+    return rutas
+
+
+async def iterar_renderizados(
+    trabajos: Iterable[Tuple[str, Dict]],
+    ventana: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Renderiza las hojas y entrega la ruta de cada una apenas está lista, en
+    el MISMO orden que trabajos. Nunca hay más de `ventana` hojas enviadas
+    y sin entregar (por defecto 2 por proceso), así el consumidor recibe la
+    primera hoja enseguida y en disco solo esperan las hojas en vuelo.
+
+    Uso:
+        async for ruta in iterar_renderizados(trabajos):
+            ...
+    """
+    pool = obtener_pool()
+    ventana = max(1, ventana or 2 * max(settings.pdf_procesos, 1))
+    en_vuelo = deque()
+    entregadas = 0
+    inicio = time.time()
+
+    try:
+        for generador, parametros in trabajos:
+            en_vuelo.append(_enviar(pool, generador, parametros))
+
+            if len(en_vuelo) >= ventana:
+                yield await en_vuelo.popleft()
+                entregadas += 1
+
+        while en_vuelo:
+            yield await en_vuelo.popleft()
+            entregadas += 1
+
+    except BrokenProcessPool:
+        cerrar_pool()
+        raise
+
+    finally:
+        # Error o consumidor que dejó de leer (cliente desconectado)
+        for futuro in en_vuelo:
+            futuro.cancel()
+
+    duracion = time.time() - inicio
+    print(f"✅ {entregadas} PDFs entregados en {duracion:.1f}s ({entregadas / duracion if duracion > 0 else 0:.0f} PDFs/s)")
+
@@ -161,6 +161,37 @@ Analiza cuidadosamente las preguntas 51-100.
 """
 
 
+# ============================================================================
+# MOSAICO DE CAJAS DUDOSAS (solo los recortes que el OMR local no resolvió)
+# ============================================================================
+
+PROMPT_MOSAICO_V6 = """
+Esta imagen es un MOSAICO de recortes de una hoja de respuestas.
+
+Cada recorte tiene a la IZQUIERDA, sobre fondo gris, el NÚMERO DE PREGUNTA
+y a la DERECHA el rectángulo donde el estudiante escribió a mano su respuesta.
+{instruccion_dni}
+Preguntas presentes en el mosaico: {numeros}
+
+Para cada pregunta indica la letra MAYÚSCULA escrita (A, B, C, D o E).
+- Rectángulo vacío → null
+- Varias letras o tachones ilegibles → null
+- Ignora el borde impreso del rectángulo
+
+Responde SOLO con este JSON:
+
+{{
+  "dni": "{ejemplo_dni}",
+  "respuestas": {{"<número de pregunta>": "A" | "B" | "C" | "D" | "E" | null}}
+}}
+"""
+
+INSTRUCCION_MOSAICO_DNI = """
+La PRIMERA fila (etiqueta "DNI") contiene los 8 rectángulos del DNI del
+postulante, con un dígito manuscrito en cada uno. Transcríbelos en "dni".
+"""
+
+
 # ============================================================================
 # SUFIJOS POR API
 # ============================================================================
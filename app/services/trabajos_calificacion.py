@@ -0,0 +1,317 @@
+"""
+Trabajos de Calificación - Calificación de procesos en segundo plano
+app/services/trabajos_calificacion.py
+
+Calificar un proceso grande dentro del request HTTP choca con los timeouts
+del proxy y, si se corta, deja commits a medias. Aquí la calificación corre
+como una tarea asyncio registrada en memoria:
+
+- Las hojas se califican por bloques (settings.calificacion_lote_hojas) con
+  el motor matricial, en el executor de hilos y con UN commit por bloque.
+- obtener_estado_trabajo() expone el progreso (hojas hechas, velocidad, ETA)
+  para que el frontend lo consulte por polling.
+- Reanudable: cada bloque confirmado cambia el estado de sus hojas, así que
+  un trabajo nuevo (o reanudar_trabajo) solo toma las hojas que faltan.
+- Al terminar compacta las hojas del proceso que aún no tienen columnas
+  compactas (capturadas antes de existir), para que las lecturas masivas
+  no tengan que escribir.
+
+IMPORTANTE: el registro vive en memoria del proceso. Si el servidor se
+reinicia se pierde el progreso en pantalla, pero no lo ya calificado:
+basta con lanzar la calificación otra vez.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services.calificacion_service import actualizar_orden_merito
+from app.services.motor_calificacion import calificar_hojas, cargar_clave_cacheada, compactar_pendientes
+from app.services.vision_async import ejecutar_bloqueante
+
+
+# Máximo de trabajos terminados que se conservan para consulta
+MAX_TRABAJOS_EN_MEMORIA = 50
+
+ESTADOS_ACTIVOS = ("en_cola", "procesando")
+
+_trabajos: Dict[str, Dict] = {}
+_tareas: Dict[str, asyncio.Task] = {}
+
+
+# ============================================================================
+# API PÚBLICA
+# ============================================================================
+
+def iniciar_calificacion(
+    proceso: str,
+    estados_origen: Sequence[str] = ("completado", "pendiente_calificar"),
+    estado_final: str = "calificado",
+    actualizar_calificaciones: bool = True
+) -> str:
+    """
+    Lanza la calificación de las hojas del proceso que están en estados_origen.
+    Si ya hay un trabajo activo para el proceso, retorna ese mismo.
+
+    Returns:
+        trabajo_id para consultar el progreso con obtener_estado_trabajo()
+    """
+    for trabajo in _trabajos.values():
+        if trabajo["proceso"] == proceso and trabajo["estado"] in ESTADOS_ACTIVOS:
+            return trabajo["trabajo_id"]
+
+    _limpiar_trabajos_antiguos()
+
+    trabajo_id = uuid.uuid4().hex[:12]
+
+    _trabajos[trabajo_id] = {
+        "trabajo_id": trabajo_id,
+        "proceso": proceso,
+        "estados_origen": tuple(estados_origen),
+        "estado_final": estado_final,
+        "actualizar_calificaciones": actualizar_calificaciones,
+        "estado": "en_cola",
+        "total": 0,
+        "procesadas": 0,
+        "calificadas": 0,
+        "bloques": 0,
+        "errores": [],
+        "suma_notas": 0.0,
+        "nota_maxima": None,
+        "nota_minima": None,
+        "puestos_movidos": None,
+        "compactadas": 0,
+        "error": None,
+        "reanudado_por": None,
+        "creado_at": datetime.now(),
+        "iniciado_at": None,
+        "finalizado_at": None
+    }
+
+    _tareas[trabajo_id] = asyncio.create_task(_ejecutar(trabajo_id))
+
+    print(f"📥 Calificación {trabajo_id} encolada (proceso {proceso})")
+
+    return trabajo_id
+
+
+def reanudar_trabajo(trabajo_id: str) -> Optional[str]:
+    """
+    Relanza un trabajo que terminó con error o fue interrumpido. Solo se
+    califican las hojas que quedaron sin calificar.
+
+    Returns:
+        trabajo_id del nuevo trabajo (None si no existe el original)
+    """
+    trabajo = _trabajos.get(trabajo_id)
+    if not trabajo:
+        return None
+
+    if trabajo["estado"] in ESTADOS_ACTIVOS:
+        return trabajo_id
+
+    nuevo_id = iniciar_calificacion(
+        trabajo["proceso"],
+        estados_origen=trabajo["estados_origen"],
+        estado_final=trabajo["estado_final"],
+        actualizar_calificaciones=trabajo["actualizar_calificaciones"]
+    )
+    trabajo["reanudado_por"] = nuevo_id
+
+    return nuevo_id
+
+
+def obtener_estado_trabajo(trabajo_id: str) -> Optional[Dict]:
+    """
+    Retorna el progreso de un trabajo (o None si no existe).
+    """
+    trabajo = _trabajos.get(trabajo_id)
+    if not trabajo:
+        return None
+
+    ahora = trabajo["finalizado_at"] or datetime.now()
+    transcurrido = (ahora - trabajo["iniciado_at"]).total_seconds() if trabajo["iniciado_at"] else 0
+    velocidad = trabajo["procesadas"] / transcurrido if transcurrido > 0 else 0
+    pendientes = trabajo["total"] - trabajo["procesadas"]
+
+    return {
+        "trabajo_id": trabajo_id,
+        "proceso": trabajo["proceso"],
+        "estado": trabajo["estado"],
+        "total": trabajo["total"],
+        "procesadas": trabajo["procesadas"],
+        "calificadas": trabajo["calificadas"],
+        "hojas_con_error": len(trabajo["errores"]),
+        "pendientes": pendientes,
+        "bloques": trabajo["bloques"],
+        "porcentaje": round(trabajo["procesadas"] / trabajo["total"] * 100, 1) if trabajo["total"] else 100.0,
+        "hojas_por_segundo": round(velocidad, 1),
+        "eta_segundos": round(pendientes / velocidad) if velocidad > 0 else None,
+        "tiempo_segundos": round(transcurrido, 2),
+        "promedio_nota": round(trabajo["suma_notas"] / trabajo["calificadas"], 2) if trabajo["calificadas"] else 0,
+        "nota_maxima": trabajo["nota_maxima"] or 0,
+        "nota_minima": trabajo["nota_minima"] or 0,
+        "puestos_movidos": trabajo["puestos_movidos"],
+        "compactadas": trabajo["compactadas"],
+        "error": trabajo["error"],
+        "reanudable": trabajo["estado"] in ("error", "interrumpido"),
+        "reanudado_por": trabajo["reanudado_por"],
+        "errores": trabajo["errores"],
+        "creado_at": trabajo["creado_at"].isoformat(),
+        "iniciado_at": trabajo["iniciado_at"].isoformat() if trabajo["iniciado_at"] else None,
+        "finalizado_at": trabajo["finalizado_at"].isoformat() if trabajo["finalizado_at"] else None
+    }
+
+
+# ============================================================================
+# EJECUCIÓN
+# ============================================================================
+
+async def _ejecutar(trabajo_id: str):
+    trabajo = _trabajos[trabajo_id]
+    proceso = trabajo["proceso"]
+
+    trabajo["estado"] = "procesando"
+    trabajo["iniciado_at"] = datetime.now()
+
+    try:
+        hoja_ids, clave = await ejecutar_bloqueante(
+            _listar_pendientes, proceso, trabajo["estados_origen"]
+        )
+
+        if not clave.any():
+            raise ValueError(f"No existe gabarito para el proceso {proceso}")
+
+        trabajo["total"] = len(hoja_ids)
+        tamano = max(1, settings.calificacion_lote_hojas)
+
+        for inicio in range(0, len(hoja_ids), tamano):
+            bloque = hoja_ids[inicio:inicio + tamano]
+
+            resultado = await ejecutar_bloqueante(
+                _calificar_bloque,
+                proceso,
+                bloque,
+                clave,
+                trabajo["estado_final"],
+                trabajo["actualizar_calificaciones"]
+            )
+
+            notas = [r["nota_final"] for r in resultado["resultados"]]
+            if notas:
+                trabajo["suma_notas"] += sum(notas)
+                trabajo["nota_maxima"] = max(notas) if trabajo["nota_maxima"] is None else max(trabajo["nota_maxima"], *notas)
+                trabajo["nota_minima"] = min(notas) if trabajo["nota_minima"] is None else min(trabajo["nota_minima"], *notas)
+
+            trabajo["procesadas"] += len(bloque)
+            trabajo["calificadas"] += len(resultado["resultados"])
+            trabajo["errores"].extend(resultado["errores"])
+            trabajo["bloques"] += 1
+
+            print(f"⚙️  Calificación {trabajo_id}: {trabajo['procesadas']}/{trabajo['total']} hojas")
+
+        trabajo["compactadas"] = await ejecutar_bloqueante(_compactar_pendientes, proceso)
+
+        if trabajo["actualizar_calificaciones"] and trabajo["calificadas"]:
+            trabajo["puestos_movidos"] = await ejecutar_bloqueante(_actualizar_merito, proceso)
+
+        trabajo["estado"] = "completado"
+        print(f"✅ Calificación {trabajo_id} terminada: {trabajo['calificadas']} hojas, {len(trabajo['errores'])} con error")
+
+    except asyncio.CancelledError:
+        # Apagado del servidor: lo ya confirmado se conserva
+        trabajo["estado"] = "interrumpido"
+        raise
+
+    except Exception as e:
+        trabajo["estado"] = "error"
+        trabajo["error"] = str(e)
+        print(f"❌ Calificación {trabajo_id} con error ({trabajo['procesadas']}/{trabajo['total']} hojas confirmadas): {e}")
+
+    finally:
+        trabajo["finalizado_at"] = datetime.now()
+        _tareas.pop(trabajo_id, None)
+
+
+def _listar_pendientes(proceso: str, estados: Sequence[str]):
+    """Ids de las hojas a calificar y la clave del proceso (una lectura)."""
+    db = SessionLocal()
+    try:
+        filas = db.execute(
+            text("""
+                SELECT id
+                FROM hojas_respuestas
+                WHERE proceso_admision = :proceso AND estado IN :estados
+                ORDER BY id
+            """).bindparams(bindparam("estados", expanding=True)),
+            {"proceso": proceso, "estados": list(estados)}
+        ).fetchall()
+
+        return [f.id for f in filas], cargar_clave_cacheada(db, proceso)
+    finally:
+        db.close()
+
+
+def _calificar_bloque(
+    proceso: str,
+    hoja_ids: List[int],
+    clave: np.ndarray,
+    estado_final: str,
+    actualizar_calificaciones: bool
+) -> Dict:
+    """Un bloque = una sesión y un commit."""
+    db = SessionLocal()
+    try:
+        resultado = calificar_hojas(
+            db,
+            proceso,
+            hoja_ids,
+            estado=estado_final,
+            actualizar_calificaciones=actualizar_calificaciones,
+            clave=clave
+        )
+        db.commit()
+        return resultado
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _compactar_pendientes(proceso: str) -> int:
+    db = SessionLocal()
+    try:
+        compactadas = compactar_pendientes(db, proceso)
+        db.commit()
+        return compactadas
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _actualizar_merito(proceso: str) -> int:
+    db = SessionLocal()
+    try:
+        return actualizar_orden_merito(proceso, db)
+    finally:
+        db.close()
+
+
+def _limpiar_trabajos_antiguos():
+    terminados = sorted(
+        (t for t in _trabajos.values() if t["estado"] not in ESTADOS_ACTIVOS),
+        key=lambda t: t["finalizado_at"]
+    )
+
+    while len(_trabajos) >= MAX_TRABAJOS_EN_MEMORIA and terminados:
+        antiguo = terminados.pop(0)
+        _trabajos.pop(antiguo["trabajo_id"], None)
@@ -0,0 +1,85 @@
+"""
+Vision Async - Capa asíncrona para las Vision APIs
+app/services/vision_async.py
+
+Los SDK de Anthropic y OpenAI tienen clientes async nativos y Gemini expone
+generate_content_async, pero genai.upload_file / genai.delete_file y la
+lectura de archivos siguen siendo bloqueantes. Esas llamadas se delegan a un
+ThreadPoolExecutor ACOTADO para no congelar el event loop de uvicorn mientras
+una hoja se procesa.
+
+Además cada proveedor tiene un semáforo de concurrencia (settings.vision_limite_*)
+para no exceder su rate limit cuando varios workers procesan hojas en paralelo.
+"""
+
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+import aiofiles
+
+from app.config import settings
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_semaforos: Dict[str, asyncio.Semaphore] = {}
+
+
+def obtener_executor() -> ThreadPoolExecutor:
+    """
+    Retorna el executor compartido para llamadas bloqueantes de Vision.
+    Se crea la primera vez que se usa (tamaño: settings.vision_max_workers).
+    """
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.vision_max_workers),
+            thread_name_prefix="vision"
+        )
+
+    return _executor
+
+
+async def ejecutar_bloqueante(func: Callable, *args, **kwargs) -> Any:
+    """
+    Ejecuta una función síncrona en el executor de Vision sin bloquear el loop.
+
+    Uso:
+        uploaded_file = await ejecutar_bloqueante(genai.upload_file, imagen_path)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(obtener_executor(), partial(func, *args, **kwargs))
+
+
+async def leer_imagen_bytes(imagen_path: str) -> bytes:
+    """Lee la imagen de disco sin bloquear el event loop."""
+    async with aiofiles.open(imagen_path, "rb") as f:
+        return await f.read()
+
+
+async def leer_imagen_base64(imagen_path: str) -> str:
+    """Lee la imagen y la retorna codificada en base64 (str)."""
+    image_bytes = await leer_imagen_bytes(imagen_path)
+    return base64.b64encode(image_bytes).decode("utf-8")
+
+
+def limite_proveedor(proveedor: str) -> asyncio.Semaphore:
+    """
+    Semáforo de concurrencia para un proveedor ("gemini", "claude", "openai").
+
+    Uso:
+        async with limite_proveedor("gemini"):
+            response = await model.generate_content_async([...])
+    """
+    if proveedor not in _semaforos:
+        limites = {
+            "gemini": settings.vision_limite_gemini,
+            "claude": settings.vision_limite_claude,
+            "openai": settings.vision_limite_openai
+        }
+        _semaforos[proveedor] = asyncio.Semaphore(max(1, limites.get(proveedor, 4)))
+
+    return _semaforos[proveedor]
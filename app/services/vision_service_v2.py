@@ -19,7 +19,7 @@ import anthropic
 from openai import OpenAI
 import google.generativeai as genai
 
-from app.services.image_preprocessor import ImagePreprocessor
+from app.services.pool_imagenes import ejecutar_en_proceso, preprocesar_v1
 
 from sqlalchemy.orm import Session
 from app.models import HojaRespuesta, Respuesta
@@ -336,12 +336,12 @@ async def procesar_hoja_completa_v2(imagen_path: str) -> Dict:
     # PASO 1: PRE-PROCESAMIENTO CON OPENCV
     # ========================================================================
     
-    preprocessor = ImagePreprocessor()
     imagen_procesada = imagen_path
     preprocessing_metadata = {"used": False}
     
     try:
-        imagen_procesada, preprocessing_metadata = preprocessor.procesar_completo(imagen_path)
+        # OpenCV en el pool de procesos: no bloquea el event loop
+        imagen_procesada, preprocessing_metadata = await ejecutar_en_proceso(preprocesar_v1, imagen_path)
         preprocessing_metadata["used"] = True
         print("✅ Pre-procesamiento OpenCV completado")
     except Exception as e:
@@ -438,6 +438,9 @@ async def procesar_y_guardar_respuestas(
     """
     Procesa el resultado de la Vision API y guarda cada respuesta en la BD.
     
+    Una sola transacción: las respuestas van en UN INSERT multi-fila y la
+    metadata de la hoja en un UPDATE.
+    
     Args:
         hoja_respuesta_id: ID de la hoja de respuesta procesada
         resultado_api: Resultado JSON de la Vision API
@@ -447,7 +450,12 @@ async def procesar_y_guardar_respuestas(
         Dict con estadísticas del procesamiento
     """
     
+    from datetime import datetime
+    from sqlalchemy import insert
     from app.models import HojaRespuesta, Respuesta
+    from app.services.motor_calificacion import empaquetar_dict
+    
+    ahora = datetime.now()
     
     # Extraer respuestas del JSON
     respuestas_raw = resultado_api.get("respuestas", [])
@@ -467,7 +475,7 @@ async def procesar_y_guardar_respuestas(
         "requieren_revision": 0
     }
     
-    respuestas_guardadas = []
+    filas = []
     
     for resp_data in respuestas_raw:
         numero = resp_data.get("numero")
@@ -485,20 +493,17 @@ async def procesar_y_guardar_respuestas(
         # Determinar si requiere revisión
         requiere_rev = requiere_revision(respuesta_detectada, confianza)
         
-        # Crear objeto Respuesta
-        respuesta = Respuesta(
-            hoja_respuesta_id=hoja_respuesta_id,
-            numero_pregunta=numero,
-            respuesta_marcada=respuesta_detectada,
-            es_correcta=False,  # Se actualizará al calificar con gabarito
-            confianza=confianza if es_valida else None,
-            respuesta_raw=str(resp_data),  # Convertir a string directamente
-            observacion=observacion,
-            requiere_revision=requiere_rev
-        )
-        
-        db.add(respuesta)
-        respuestas_guardadas.append(respuesta)
+        filas.append({
+            "hoja_respuesta_id": hoja_respuesta_id,
+            "numero_pregunta": numero,
+            "respuesta_marcada": respuesta_detectada,
+            "es_correcta": False,  # Se actualizará al calificar con gabarito
+            "confianza": confianza if es_valida else None,
+            "respuesta_raw": str(resp_data),  # Convertir a string directamente
+            "observacion": observacion,
+            "requiere_revision": requiere_rev,
+            "created_at": ahora
+        })
         
         # Actualizar estadísticas
         stats["total"] += 1
@@ -515,16 +520,17 @@ async def procesar_y_guardar_respuestas(
         elif respuesta_detectada == "ILEGIBLE":
             stats["ilegible"] += 1
         
-        if respuesta.requiere_revision:
+        if requiere_rev:
             stats["requieren_revision"] += 1
     
-    # Commit a la base de datos
-    db.commit()
+    # Todas las respuestas en un solo INSERT
+    db.execute(insert(Respuesta.__table__).values(filas))
     
-    # Actualizar metadata de la hoja
-    hoja = db.query(HojaRespuesta).filter(HojaRespuesta.id == hoja_respuesta_id).first()
+    # Actualizar metadata de la hoja (misma transacción)
+    hoja = db.get(HojaRespuesta, hoja_respuesta_id)
     if hoja:
         hoja.respuestas_detectadas = stats["total"]
+        hoja.respuestas_compactas = empaquetar_dict({f["numero_pregunta"]: f["respuesta_marcada"] for f in filas})
         
         # Obtener metadata actual
         metadata_actual = {}
@@ -539,12 +545,13 @@ async def procesar_y_guardar_respuestas(
         
         # Guardar como string JSON
         hoja.metadata_json = json.dumps(metadata_actual)
-        db.commit()
+    
+    db.commit()
     
     return {
         "success": True,
         "hoja_respuesta_id": hoja_respuesta_id,
-        "respuestas_guardadas": len(respuestas_guardadas),
+        "respuestas_guardadas": len(filas),
         "estadisticas": stats
     }
 
@@ -589,7 +596,8 @@ async def calificar_hoja_con_gabarito(
         Dict con resultados de la calificación
     """
     
-    from app.models import ClaveRespuesta, HojaRespuesta, Respuesta
+    from app.models import ClaveRespuesta
+    from app.services.motor_calificacion import calificar_hoja
     
     # Obtener gabarito
     gabarito = db.query(ClaveRespuesta).filter(
@@ -599,66 +607,27 @@ async def calificar_hoja_con_gabarito(
     if not gabarito:
         raise ValueError(f"Gabarito {gabarito_id} no encontrado")
     
-    # Obtener respuestas de la hoja
-    respuestas = db.query(Respuesta).filter(
-        Respuesta.hoja_respuesta_id == hoja_respuesta_id
-    ).order_by(Respuesta.numero_pregunta).all()
-    
-    if not respuestas:
-        raise ValueError(f"No hay respuestas para la hoja {hoja_respuesta_id}")
-    
-    # Gabarito como dict (numero_pregunta: respuesta_correcta)
-    clave_dict = {}
-    if gabarito.respuestas_json:
-        if isinstance(gabarito.respuestas_json, str):
-            clave_dict = json.loads(gabarito.respuestas_json)
-        else:
-            clave_dict = gabarito.respuestas_json
-    
-    correctas = 0
-    incorrectas = 0
-    no_calificables = 0
-    
-    for respuesta in respuestas:
-        num_pregunta = str(respuesta.numero_pregunta)
-        respuesta_correcta = clave_dict.get(num_pregunta)
-        
-        # Solo calificar respuestas válidas (A-E)
-        if respuesta.respuesta_marcada in ['A', 'B', 'C', 'D', 'E']:
-            if respuesta.respuesta_marcada == respuesta_correcta:
-                respuesta.es_correcta = True
-                correctas += 1
-            else:
-                respuesta.es_correcta = False
-                incorrectas += 1
-        else:
-            # No calificable (VACIO, LETRA_INVALIDA, etc.)
-            respuesta.es_correcta = False
-            no_calificables += 1
+    # Mismo motor que la calificación masiva (N = 1). La nota vigesimal y
+    # el estado quedan en la hoja; la tabla calificaciones la maneja quien llama
+    resultado = calificar_hoja(
+        db,
+        hoja_respuesta_id,
+        proceso=gabarito.proceso_admision,
+        estado="calificado",
+        actualizar_calificaciones=False
+    )
     
     db.commit()
     
-    # Calcular nota (sobre 20)
-    total_preguntas = len(respuestas)
-    nota_final = (correctas / total_preguntas) * 20 if total_preguntas > 0 else 0
-    
-    # Actualizar hoja de respuestas
-    hoja = db.query(HojaRespuesta).filter(HojaRespuesta.id == hoja_respuesta_id).first()
-    if hoja:
-        hoja.nota_final = nota_final
-        hoja.respuestas_correctas_count = correctas
-        hoja.estado = "calificado"
-        db.commit()
-    
     return {
         "success": True,
         "hoja_respuesta_id": hoja_respuesta_id,
-        "correctas": correctas,
-        "incorrectas": incorrectas,
-        "no_calificables": no_calificables,
-        "total": total_preguntas,
-        "nota_final": round(nota_final, 2),
-        "porcentaje": round((correctas / total_preguntas) * 100, 2) if total_preguntas > 0 else 0
+        "correctas": resultado["correctas"],
+        "incorrectas": resultado["incorrectas"],
+        "no_calificables": resultado["no_calificables"],
+        "total": resultado["total"],
+        "nota_final": resultado["nota_final"],
+        "porcentaje": resultado["porcentaje"]
     }
 
 
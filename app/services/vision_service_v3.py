@@ -25,31 +25,38 @@ VENTAJAS:
 """
 
 import os
-import base64
 import json
 import time
 import asyncio
+import base64
 from typing import Dict, List, Optional, Tuple
 import anthropic
-from openai import OpenAI
+from openai import AsyncOpenAI
 import google.generativeai as genai
 
-from app.services.json_parser_robust import parsear_respuesta_vision_api
-from app.services.image_preprocessor_v2 import ImagePreprocessorV2
+from app.config import settings
+from app.services.json_parser_robust import parsear_json_robusto, parsear_respuesta_vision_api
+from app.services.vision_async import ejecutar_bloqueante, leer_imagen_base64, limite_proveedor
+from app.services.pool_imagenes import ejecutar_en_proceso, leer_omr, preprocesar_v2_en_memoria
+from app.services.layout_hoja import LAYOUT_VERSION
+from app.services.cache_vision import con_cache
 from app.services.prompt_vision_v6 import (
     PROMPT_PARTE_1_V6,
     PROMPT_PARTE_2_V6,
     SYSTEM_MESSAGE_OPENAI,
     SUFFIX_CLAUDE,
-    SUFFIX_GEMINI
+    SUFFIX_GEMINI,
+    PROMPT_MOSAICO_V6,
+    INSTRUCCION_MOSAICO_DNI
 )
 
 # ============================================================================
 # CONFIGURACIÓN DE APIs
 # ============================================================================
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# Clientes ASYNC: las llamadas no bloquean el event loop de uvicorn
+openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+anthropic_client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 # Importar DESPUÉS de configurar Gemini
@@ -65,32 +72,32 @@ async def extraer_parte1_con_gpt4o(imagen_path: str) -> Dict:
     Extrae metadatos + respuestas 1-50 con GPT-4O.
     """
     try:
-        with open(imagen_path, "rb") as f:
-            image_data = base64.b64encode(f.read()).decode("utf-8")
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYSTEM_MESSAGE_OPENAI
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": PROMPT_PARTE_1_V6},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}"
+        image_data = await leer_imagen_base64(imagen_path)
+        
+        async with limite_proveedor("openai"):
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": SYSTEM_MESSAGE_OPENAI
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": PROMPT_PARTE_1_V6},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{image_data}"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=3000,
-            temperature=0
-        )
+                        ]
+                    }
+                ],
+                max_tokens=3000,
+                temperature=0
+            )
         
         texto_raw = response.choices[0].message.content.strip()
         
@@ -159,32 +166,32 @@ async def extraer_parte2_con_gpt4o(imagen_path: str) -> Dict:
     Extrae respuestas 51-100 con GPT-4O (en lugar de GPT-4O-MINI).
     """
     try:
-        with open(imagen_path, "rb") as f:
-            image_data = base64.b64encode(f.read()).decode("utf-8")
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYSTEM_MESSAGE_OPENAI
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": PROMPT_PARTE_2_V6},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}"
+        image_data = await leer_imagen_base64(imagen_path)
+        
+        async with limite_proveedor("openai"):
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": SYSTEM_MESSAGE_OPENAI
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": PROMPT_PARTE_2_V6},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{image_data}"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=3500,
-            temperature=0
-        )
+                        ]
+                    }
+                ],
+                max_tokens=3500,
+                temperature=0
+            )
         
         texto_raw = response.choices[0].message.content.strip()
         
@@ -246,48 +253,57 @@ async def extraer_parte2_con_gpt4o(imagen_path: str) -> Dict:
 # EXTRACCIÓN CON CLAUDE (FALLBACK)
 # ============================================================================
 
-async def extraer_parte1_con_claude(imagen_path: str) -> Dict:
+async def _imagen_para_claude(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Tuple[str, str]:
+    """
+    (base64, media_type) de la imagen. Si se pasan imagen_bytes (imagen ya
+    pre-procesada en memoria) no se lee el archivo.
+    """
+    if imagen_bytes is not None:
+        media_type = "image/png" if imagen_bytes[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+        return base64.b64encode(imagen_bytes).decode("utf-8"), media_type
+    
+    ext = imagen_path.lower().split('.')[-1]
+    media_type_map = {
+        'jpg': 'image/jpeg',
+        'jpeg': 'image/jpeg',
+        'png': 'image/png',
+        'webp': 'image/webp'
+    }
+    return await leer_imagen_base64(imagen_path), media_type_map.get(ext, 'image/jpeg')
+
+
+async def extraer_parte1_con_claude(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Dict:
     """
     Extrae metadatos + respuestas 1-50 con Claude Sonnet 4.
     Usado como fallback si GPT-4O falla.
     """
     try:
-        with open(imagen_path, "rb") as f:
-            image_data = base64.b64encode(f.read()).decode("utf-8")
-        
-        # Detectar tipo de imagen
-        ext = imagen_path.lower().split('.')[-1]
-        media_type_map = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'webp': 'image/webp'
-        }
-        media_type = media_type_map.get(ext, 'image/jpeg')
-        
-        message = anthropic_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=3000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data
+        image_data, media_type = await _imagen_para_claude(imagen_path, imagen_bytes)
+        
+        async with limite_proveedor("claude"):
+            message = await anthropic_client.messages.create(
+                model="claude-sonnet-4-20250514",
+                max_tokens=3000,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "image",
+                                "source": {
+                                    "type": "base64",
+                                    "media_type": media_type,
+                                    "data": image_data
+                                }
+                            },
+                            {
+                                "type": "text",
+                                "text": PROMPT_PARTE_1_V6 + SUFFIX_CLAUDE
                             }
-                        },
-                        {
-                            "type": "text",
-                            "text": PROMPT_PARTE_1_V6 + SUFFIX_CLAUDE
-                        }
-                    ]
-                }
-            ]
-        )
+                        ]
+                    }
+                ]
+            )
         
         texto_raw = message.content[0].text.strip()
         
@@ -336,47 +352,38 @@ async def extraer_parte1_con_claude(imagen_path: str) -> Dict:
         }
 
 
-async def extraer_parte2_con_claude(imagen_path: str) -> Dict:
+async def extraer_parte2_con_claude(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Dict:
     """
     Extrae respuestas 51-100 con Claude Sonnet 4.
     Usado como fallback si GPT-4O falla.
     """
     try:
-        with open(imagen_path, "rb") as f:
-            image_data = base64.b64encode(f.read()).decode("utf-8")
-        
-        ext = imagen_path.lower().split('.')[-1]
-        media_type_map = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'webp': 'image/webp'
-        }
-        media_type = media_type_map.get(ext, 'image/jpeg')
-        
-        message = anthropic_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=2500,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data
+        image_data, media_type = await _imagen_para_claude(imagen_path, imagen_bytes)
+        
+        async with limite_proveedor("claude"):
+            message = await anthropic_client.messages.create(
+                model="claude-sonnet-4-20250514",
+                max_tokens=2500,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "image",
+                                "source": {
+                                    "type": "base64",
+                                    "media_type": media_type,
+                                    "data": image_data
+                                }
+                            },
+                            {
+                                "type": "text",
+                                "text": PROMPT_PARTE_2_V6 + SUFFIX_CLAUDE
                             }
-                        },
-                        {
-                            "type": "text",
-                            "text": PROMPT_PARTE_2_V6 + SUFFIX_CLAUDE
-                        }
-                    ]
-                }
-            ]
-        )
+                        ]
+                    }
+                ]
+            )
         
         texto_raw = message.content[0].text.strip()
         
@@ -435,15 +442,16 @@ async def extraer_parte1_con_gemini(imagen_path: str) -> Dict:
     """
     try:
         # Subir imagen a Gemini
-        uploaded_file = genai.upload_file(imagen_path)
+        uploaded_file = await ejecutar_bloqueante(genai.upload_file, imagen_path)
         
         # Usar gemini-2.5-flash (más disponible)
         model = genai.GenerativeModel("gemini-2.5-flash")
         
-        response = model.generate_content([
-            uploaded_file,
-            PROMPT_PARTE_1_V6 + SUFFIX_GEMINI
-        ])
+        async with limite_proveedor("gemini"):
+            response = await model.generate_content_async([
+                uploaded_file,
+                PROMPT_PARTE_1_V6 + SUFFIX_GEMINI
+            ])
         
         texto_raw = response.text.strip()
         
@@ -475,7 +483,7 @@ async def extraer_parte1_con_gemini(imagen_path: str) -> Dict:
         
         # Limpiar archivo
         try:
-            genai.delete_file(uploaded_file.name)
+            await ejecutar_bloqueante(genai.delete_file, uploaded_file.name)
         except:
             pass
         
@@ -505,14 +513,15 @@ async def extraer_parte2_con_gemini(imagen_path: str) -> Dict:
     """
     try:
         # Subir imagen a Gemini
-        uploaded_file = genai.upload_file(imagen_path)
+        uploaded_file = await ejecutar_bloqueante(genai.upload_file, imagen_path)
         
         model = genai.GenerativeModel("gemini-2.5-flash")
         
-        response = model.generate_content([
-            uploaded_file,
-            PROMPT_PARTE_2_V6 + SUFFIX_GEMINI
-        ])
+        async with limite_proveedor("gemini"):
+            response = await model.generate_content_async([
+                uploaded_file,
+                PROMPT_PARTE_2_V6 + SUFFIX_GEMINI
+            ])
         
         texto_raw = response.text.strip()
         
@@ -544,7 +553,7 @@ async def extraer_parte2_con_gemini(imagen_path: str) -> Dict:
         
         # Limpiar archivo
         try:
-            genai.delete_file(uploaded_file.name)
+            await ejecutar_bloqueante(genai.delete_file, uploaded_file.name)
         except:
             pass
         
@@ -576,32 +585,32 @@ async def extraer_parte2_con_gpt4o_mini(imagen_path: str) -> Dict:
     Extrae respuestas 51-100 con GPT-4O-MINI.
     """
     try:
-        with open(imagen_path, "rb") as f:
-            image_data = base64.b64encode(f.read()).decode("utf-8")
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYSTEM_MESSAGE_OPENAI
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": PROMPT_PARTE_2_V6},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}"
+        image_data = await leer_imagen_base64(imagen_path)
+        
+        async with limite_proveedor("openai"):
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": SYSTEM_MESSAGE_OPENAI
+                    },
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": PROMPT_PARTE_2_V6},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{image_data}"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=3500,  # Aumentado de 2500 a 3500
-            temperature=0
-        )
+                        ]
+                    }
+                ],
+                max_tokens=3500,  # Aumentado de 2500 a 3500
+                temperature=0
+            )
         
         texto_raw = response.choices[0].message.content.strip()
         
@@ -704,11 +713,260 @@ def merge_resultados_divididos(resultado1: Dict, resultado2: Dict) -> Dict:
     }
 
 
+# ============================================================================
+# MOSAICO DE CAJAS DUDOSAS (una sola imagen pequeña en vez de la página)
+# ============================================================================
+
+async def leer_mosaico_con_vision(
+    mosaico: bytes,
+    numeros: List[int],
+    incluir_dni: bool = False,
+    proveedor: str = "claude"
+) -> Dict:
+    """
+    Pide a la Vision API SOLO las cajas recortadas en el mosaico del OMR
+    local (omr_local.LectorOMR.construir_mosaico).
+
+    Args:
+        mosaico: JPEG con los recortes etiquetados
+        numeros: Preguntas (1..100) presentes en el mosaico
+        incluir_dni: Si la primera fila del mosaico es el DNI
+        proveedor: "claude" o "gemini"
+
+    Returns:
+        {
+            "success": bool,
+            "respuestas": {numero: letra | None},
+            "dni": str,
+            "api": str
+        }
+    """
+    prompt = PROMPT_MOSAICO_V6.format(
+        instruccion_dni=INSTRUCCION_MOSAICO_DNI if incluir_dni else "",
+        numeros=", ".join(str(n) for n in numeros),
+        ejemplo_dni="12345678" if incluir_dni else ""
+    )
+
+    try:
+        if proveedor == "gemini":
+            model = genai.GenerativeModel(
+                "gemini-2.5-flash",
+                generation_config=genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    temperature=0.0
+                )
+            )
+            async with limite_proveedor("gemini"):
+                response = await model.generate_content_async([
+                    {"mime_type": "image/jpeg", "data": mosaico},
+                    prompt + SUFFIX_GEMINI
+                ])
+            texto_raw = response.text
+
+        else:
+            async with limite_proveedor("claude"):
+                message = await anthropic_client.messages.create(
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=1000,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "image",
+                                    "source": {
+                                        "type": "base64",
+                                        "media_type": "image/jpeg",
+                                        "data": base64.b64encode(mosaico).decode("utf-8")
+                                    }
+                                },
+                                {
+                                    "type": "text",
+                                    "text": prompt + SUFFIX_CLAUDE
+                                }
+                            ]
+                        }
+                    ]
+                )
+            texto_raw = message.content[0].text.strip()
+
+        datos = parsear_json_robusto(texto_raw)
+
+        respuestas = {}
+        leidas = datos.get("respuestas") or {}
+        for numero in numeros:
+            letra = leidas.get(str(numero))
+            letra = letra.strip().upper() if isinstance(letra, str) else None
+            respuestas[numero] = letra if letra in ["A", "B", "C", "D", "E"] else None
+
+        dni = "".join(c for c in str(datos.get("dni") or "") if c.isdigit())
+
+        print(f"✅ [MOSAICO {proveedor.upper()}] {len(numeros)} cajas leídas"
+              + (f", DNI: {dni}" if incluir_dni else ""))
+
+        return {
+            "success": True,
+            "respuestas": respuestas,
+            "dni": dni,
+            "api": proveedor
+        }
+
+    except Exception as e:
+        print(f"❌ Error en leer_mosaico_con_vision ({proveedor}): {str(e)}")
+        return {
+            "success": False,
+            "api": proveedor,
+            "error": str(e)
+        }
+
+
+# ============================================================================
+# OMR LOCAL + VISION SOLO PARA LO DUDOSO
+# ============================================================================
+
+async def procesar_hoja_con_omr(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Dict:
+    """
+    Lee las 100 respuestas con el OMR local (OpenCV, sin red) y usa la
+    Vision API solo para:
+    - El DNI manuscrito (extraer_dni_con_zoom)
+    - Las cajas con confianza baja (omr["dudosas"]), enviadas como mosaico
+
+    Returns:
+        Mismo formato que procesar_hoja_dividida. success=False si la página
+        no se pudo registrar (no es la hoja genérica, foto muy inclinada, etc.)
+    """
+    from app.services.vision_service_v3_simple import extraer_dni_con_zoom
+
+    inicio = time.time()
+
+    print("\n🔎 OMR LOCAL: leyendo grilla de respuestas...")
+
+    omr = await ejecutar_en_proceso(
+        leer_omr, imagen_bytes or imagen_path, settings.omr_confianza_minima, mosaico=True
+    )
+
+    if not omr["success"]:
+        print(f"⚠️  OMR local no aplicable: {omr.get('error')}")
+        return omr
+
+    dudosas = omr["dudosas"]
+    print(f"✅ OMR: {100 - len(dudosas)}/100 cajas resueltas en {omr['tiempo_procesamiento']*1000:.0f}ms")
+
+    datos = omr["datos"]
+    apis_usadas = ["omr-local"]
+
+    # DNI manuscrito y cajas dudosas en paralelo
+    tareas = [extraer_dni_con_zoom(imagen_path, imagen_bytes)]
+    if dudosas:
+        print(f"🤖 {len(dudosas)} cajas dudosas → Gemini (mosaico): {dudosas}")
+        tareas.append(leer_mosaico_con_vision(omr["mosaico"], dudosas, proveedor="gemini"))
+
+    resultados = await asyncio.gather(*tareas, return_exceptions=True)
+
+    dni = resultados[0]
+    if isinstance(dni, Exception) or not dni:
+        return {
+            "success": False,
+            "error": f"No se pudo leer el DNI: {dni}",
+            "metodo": "omr_local_v1"
+        }
+    datos["dni_postulante"] = dni
+    apis_usadas.append("gemini-dni")
+
+    if dudosas:
+        vision = resultados[1]
+        if isinstance(vision, Exception) or not vision.get("success"):
+            return {
+                "success": False,
+                "error": f"Vision API falló para las cajas dudosas: {vision}",
+                "metodo": "omr_local_v1"
+            }
+
+        for numero, letra in vision["respuestas"].items():
+            datos["respuestas"][numero - 1] = letra
+
+        apis_usadas.append("gemini-mosaico")
+
+    tiempo_total = time.time() - inicio
+
+    print(f"✅ OMR + Vision: {tiempo_total:.2f}s (APIs: {', '.join(apis_usadas)})")
+
+    return {
+        "success": True,
+        "datos": datos,
+        "tiempo_procesamiento": tiempo_total,
+        "metodo": "omr_local_v1",
+        "apis_usadas": apis_usadas,
+        "preprocessing": {
+            "used": True,
+            "reason": "OMR local (registro por marco + muestreo de cajas)"
+        },
+        "omr": {
+            "dudosas": dudosas,
+            "confianzas": omr["confianzas"]
+        }
+    }
+
+
+async def procesar_fallback_mosaico(imagen_path: str, inicio: float, imagen_bytes: Optional[bytes] = None) -> Dict:
+    """
+    Fallback cuando Gemini falla: el OMR local resuelve las cajas seguras y
+    Claude recibe UNA imagen con el DNI + solo las cajas dudosas, en lugar de
+    la página completa dos veces (respuestas 1-50 y 51-100).
+
+    Returns:
+        Mismo formato que procesar_hoja_dividida. success=False si la hoja no
+        se pudo registrar o Claude falló (se usa el fallback de página completa).
+    """
+    omr = await ejecutar_en_proceso(
+        leer_omr, imagen_bytes or imagen_path, settings.omr_confianza_minima,
+        mosaico=True, incluir_dni=True
+    )
+
+    if not omr["success"]:
+        return omr
+
+    dudosas = omr["dudosas"]
+    print(f"\n🧩 Fallback CLAUDE por mosaico: DNI + {len(dudosas)} cajas dudosas")
+
+    vision = await leer_mosaico_con_vision(
+        omr["mosaico"], dudosas, incluir_dni=True, proveedor="claude"
+    )
+
+    if not vision["success"]:
+        return {"success": False, "error": vision.get("error"), "metodo": "claude_mosaico_v7"}
+
+    datos = omr["datos"]
+    datos["dni_postulante"] = vision["dni"]
+    for numero, letra in vision["respuestas"].items():
+        datos["respuestas"][numero - 1] = letra
+
+    tiempo_total = time.time() - inicio
+
+    print(f"✅ PROCESAMIENTO EXITOSO (FALLBACK MOSAICO) en {tiempo_total:.2f}s")
+
+    return {
+        "success": True,
+        "datos": datos,
+        "tiempo_procesamiento": tiempo_total,
+        "metodo": "claude_mosaico_v7",
+        "apis_usadas": ["omr-local", "claude-mosaico"],
+        "preprocessing": {
+            "used": True,
+            "reason": "OMR local + mosaico de cajas dudosas"
+        },
+        "omr": {
+            "dudosas": dudosas,
+            "confianzas": omr["confianzas"]
+        }
+    }
+
+
 # ============================================================================
 # FUNCIÓN PRINCIPAL - PROCESAMIENTO PARALELO
 # ============================================================================
 
-async def procesar_hoja_dividida(imagen_path: str) -> Dict:
+async def _procesar_hoja_dividida_sin_cache(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Dict:
     """
     Procesa una hoja usando Gemini con schema estructurado.
     
@@ -722,6 +980,7 @@ async def procesar_hoja_dividida(imagen_path: str) -> Dict:
     
     Args:
         imagen_path: Ruta de la imagen original
+        imagen_bytes: Contenido ya en memoria (evita releer el archivo)
         
     Returns:
         Dict con todos los datos extraídos
@@ -734,6 +993,19 @@ async def procesar_hoja_dividida(imagen_path: str) -> Dict:
     print("="*60)
     print(f"📸 Imagen original: {os.path.basename(imagen_path)}")
     
+    # ========================================================================
+    # PASO PREVIO: OMR LOCAL (si está habilitado)
+    # ========================================================================
+    
+    if settings.omr_local_habilitado:
+        try:
+            resultado_omr = await procesar_hoja_con_omr(imagen_path, imagen_bytes)
+            if resultado_omr["success"]:
+                return resultado_omr
+            print("🔄 Continuando con el flujo Gemini completo...")
+        except Exception as e:
+            print(f"⚠️  OMR local exception: {str(e)}")
+    
     # ========================================================================
     # PASO 0: SALTAR PRE-PROCESAMIENTO OPENCV PARA GEMINI
     # ========================================================================
@@ -759,7 +1031,7 @@ async def procesar_hoja_dividida(imagen_path: str) -> Dict:
         print("   📸 Imagen: ORIGINAL (sin OpenCV)")
         
         # Usar imagen ORIGINAL para Gemini (mejor para OCR)
-        resultado_gemini = await extract_data_compatible(imagen_para_gemini)
+        resultado_gemini = await extract_data_compatible(imagen_para_gemini, imagen_bytes=imagen_bytes)
         
         if resultado_gemini["success"]:
             print("\n✅ GEMINI ESTRUCTURADO: ÉXITO")
@@ -803,33 +1075,47 @@ async def procesar_hoja_dividida(imagen_path: str) -> Dict:
         print("🔄 Intentando con CLAUDE (fallback)...")
     
     # ========================================================================
-    # PASO 2: FALLBACK CON CLAUDE (DIVIDIDO EN 2 PARTES)
+    # PASO 2A: FALLBACK CON CLAUDE SOLO SOBRE LAS CAJAS DUDOSAS (MOSAICO)
+    # ========================================================================
+    
+    if settings.vision_fallback_mosaico:
+        try:
+            resultado_mosaico = await procesar_fallback_mosaico(imagen_path, inicio, imagen_bytes)
+            if resultado_mosaico["success"]:
+                return resultado_mosaico
+            print(f"⚠️  Fallback por mosaico no aplicable: {resultado_mosaico.get('error')}")
+        except Exception as e:
+            print(f"⚠️  Fallback por mosaico exception: {str(e)}")
+    
+    # ========================================================================
+    # PASO 2B: FALLBACK CON CLAUDE (PÁGINA COMPLETA, DIVIDIDO EN 2 PARTES)
     # ========================================================================
     
     try:
         print("\n🔄 Ejecutando fallback con CLAUDE...")
         print("🔧 Pre-procesando imagen con OpenCV para Claude...")
         
-        # Para Claude, SÍ usar OpenCV (mejor para rectángulos)
-        preprocessor = ImagePreprocessorV2()
-        imagen_procesada = imagen_path
+        # Para Claude, SÍ usar OpenCV (mejor para rectángulos). En memoria:
+        # la imagen procesada va directo a Claude sin archivo intermedio.
+        imagen_procesada = None
         
         try:
-            imagen_procesada, preprocessing_metadata = preprocessor.procesar_completo(imagen_path)
+            imagen_procesada, preprocessing_metadata = await ejecutar_en_proceso(
+                preprocesar_v2_en_memoria, imagen_bytes or imagen_path
+            )
             preprocessing_metadata["used"] = True
-            print(f"✅ Pre-procesamiento completado para Claude")
-            print(f"📸 Imagen procesada: {os.path.basename(imagen_procesada)}")
+            print(f"✅ Pre-procesamiento completado para Claude ({preprocessing_metadata['bytes'] // 1024} KB)")
         except Exception as e:
             print(f"⚠️ Pre-procesamiento falló: {e}")
             print(f"ℹ️  Usando imagen original")
-            imagen_procesada = imagen_path
+            preprocessing_metadata = {"used": False, "error": str(e)}
         
         print("   📍 Parte 1: CLAUDE (Metadatos + Resp 1-50)")
         print("   📍 Parte 2: CLAUDE (Resp 51-100)")
         
         resultado1, resultado2 = await asyncio.gather(
-            extraer_parte1_con_claude(imagen_procesada),
-            extraer_parte2_con_claude(imagen_procesada)
+            extraer_parte1_con_claude(imagen_path, imagen_procesada),
+            extraer_parte2_con_claude(imagen_path, imagen_procesada)
         )
         
         print(f"\n✅ Parte 1 (CLAUDE): {'OK' if resultado1['success'] else 'FALLÓ'}")
@@ -892,6 +1178,30 @@ async def procesar_hoja_dividida(imagen_path: str) -> Dict:
         }
 
 
+def version_extractor() -> str:
+    """
+    Versión de la extracción para el cache de Vision: si cambia el prompt,
+    el layout o el flujo (OMR / mosaico), los resultados viejos no se reutilizan.
+    """
+    return (
+        f"dividida-v7|{LAYOUT_VERSION}"
+        f"|omr={settings.omr_local_habilitado}:{settings.omr_confianza_minima}"
+        f"|mosaico={settings.vision_fallback_mosaico}"
+    )
+
+
+async def procesar_hoja_dividida(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Dict:
+    """
+    Procesa una hoja (ver _procesar_hoja_dividida_sin_cache).
+
+    Si la misma imagen ya se procesó con éxito (re-subida tras DNI_INCOMPLETO,
+    DNI duplicado, etc.) se retorna el resultado guardado sin llamar a la API.
+    """
+    return await con_cache(
+        imagen_path, version_extractor(), _procesar_hoja_dividida_sin_cache, imagen_bytes=imagen_bytes
+    )
+
+
 # ============================================================================
 # WRAPPER PARA COMPATIBILIDAD
 # ============================================================================
@@ -908,8 +1218,11 @@ async def procesar_hoja_completa_v3(imagen_path: str) -> Dict:
 # FUNCIONES AUXILIARES PARA GUARDAR EN BD
 # ============================================================================
 
+from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from app.models import HojaRespuesta, Respuesta
+from app.services.motor_calificacion import empaquetar_dict
 
 
 async def procesar_y_guardar_respuestas(
@@ -920,6 +1233,10 @@ async def procesar_y_guardar_respuestas(
     """
     Procesa el resultado de la Vision API y guarda cada respuesta en la BD.
     
+    Una sola transacción: las 100 filas van en UN INSERT multi-fila y la
+    metadata de la hoja en un UPDATE (la hoja se toma del identity map de
+    la sesión si ya está cargada).
+    
     ADAPTADO PARA FORMATO DIVIDIDO:
     resultado_api["datos"] = {
         "dni_postulante": "...",
@@ -949,6 +1266,8 @@ async def procesar_y_guardar_respuestas(
     if len(respuestas_array) != 100:
         raise ValueError(f"Se esperaban 100 respuestas, se recibieron {len(respuestas_array)}")
     
+    ahora = datetime.now()
+    
     # Estadísticas
     stats = {
         "total": 0,
@@ -958,7 +1277,7 @@ async def procesar_y_guardar_respuestas(
         "requieren_revision": 0
     }
     
-    respuestas_guardadas = []
+    filas = []
     
     for idx, respuesta_detectada in enumerate(respuestas_array, start=1):
         # Normalizar
@@ -979,20 +1298,17 @@ async def procesar_y_guardar_respuestas(
         # Determinar si requiere revisión
         requiere_rev = not es_valida
         
-        # Crear objeto Respuesta
-        respuesta = Respuesta(
-            hoja_respuesta_id=hoja_respuesta_id,
-            numero_pregunta=idx,
-            respuesta_marcada=respuesta_final,
-            es_correcta=False,  # Se actualizará al calificar
-            confianza=confianza,
-            respuesta_raw=str(respuesta_detectada),
-            observacion=None,
-            requiere_revision=requiere_rev
-        )
-        
-        db.add(respuesta)
-        respuestas_guardadas.append(respuesta)
+        filas.append({
+            "hoja_respuesta_id": hoja_respuesta_id,
+            "numero_pregunta": idx,
+            "respuesta_marcada": respuesta_final,
+            "es_correcta": False,  # Se actualizará al calificar
+            "confianza": confianza,
+            "respuesta_raw": str(respuesta_detectada),
+            "observacion": None,
+            "requiere_revision": requiere_rev,
+            "created_at": ahora
+        })
         
         # Actualizar estadísticas
         stats["total"] += 1
@@ -1004,13 +1320,14 @@ async def procesar_y_guardar_respuestas(
         if requiere_rev:
             stats["requieren_revision"] += 1
     
-    # Commit a la base de datos
-    db.commit()
+    # Las 100 respuestas en un solo INSERT
+    db.execute(insert(Respuesta.__table__).values(filas))
     
-    # Actualizar metadata de la hoja
-    hoja = db.query(HojaRespuesta).filter(HojaRespuesta.id == hoja_respuesta_id).first()
+    # Actualizar metadata de la hoja (misma transacción)
+    hoja = db.get(HojaRespuesta, hoja_respuesta_id)
     if hoja:
         hoja.respuestas_detectadas = stats["total"]
+        hoja.respuestas_compactas = empaquetar_dict({f["numero_pregunta"]: f["respuesta_marcada"] for f in filas})
         
         # Guardar metadatos extraídos
         metadata_actual = {}
@@ -1031,12 +1348,13 @@ async def procesar_y_guardar_respuestas(
         }
         
         hoja.metadata_json = json.dumps(metadata_actual)
-        db.commit()
+    
+    db.commit()
     
     return {
         "success": True,
         "hoja_respuesta_id": hoja_respuesta_id,
-        "respuestas_guardadas": len(respuestas_guardadas),
+        "respuestas_guardadas": len(filas),
         "estadisticas": stats
     }
 
@@ -1065,6 +1383,7 @@ async def calificar_hoja_con_gabarito(
     Califica una hoja comparando con el gabarito.
     """
     from app.models import ClaveRespuesta
+    from app.services.motor_calificacion import calificar_hoja
     
     # Obtener gabarito
     gabarito = db.query(ClaveRespuesta).filter(
@@ -1074,65 +1393,27 @@ async def calificar_hoja_con_gabarito(
     if not gabarito:
         raise ValueError(f"Gabarito {gabarito_id} no encontrado")
     
-    # Obtener respuestas de la hoja
-    respuestas = db.query(Respuesta).filter(
-        Respuesta.hoja_respuesta_id == hoja_respuesta_id
-    ).order_by(Respuesta.numero_pregunta).all()
-    
-    if not respuestas:
-        raise ValueError(f"No hay respuestas para la hoja {hoja_respuesta_id}")
-    
-    # Gabarito como dict
-    clave_dict = {}
-    if gabarito.respuestas_json:
-        if isinstance(gabarito.respuestas_json, str):
-            clave_dict = json.loads(gabarito.respuestas_json)
-        else:
-            clave_dict = gabarito.respuestas_json
-    
-    correctas = 0
-    incorrectas = 0
-    no_calificables = 0
-    
-    for respuesta in respuestas:
-        num_pregunta = str(respuesta.numero_pregunta)
-        respuesta_correcta = clave_dict.get(num_pregunta)
-        
-        # Solo calificar respuestas válidas (A-E)
-        if respuesta.respuesta_marcada in ['A', 'B', 'C', 'D', 'E']:
-            if respuesta.respuesta_marcada == respuesta_correcta:
-                respuesta.es_correcta = True
-                correctas += 1
-            else:
-                respuesta.es_correcta = False
-                incorrectas += 1
-        else:
-            respuesta.es_correcta = False
-            no_calificables += 1
+    # Mismo motor que la calificación masiva (N = 1). La nota vigesimal y
+    # el estado quedan en la hoja; la tabla calificaciones la maneja quien llama
+    resultado = calificar_hoja(
+        db,
+        hoja_respuesta_id,
+        proceso=gabarito.proceso_admision,
+        estado="calificado",
+        actualizar_calificaciones=False
+    )
     
     db.commit()
     
-    # Calcular nota
-    total_preguntas = len(respuestas)
-    nota_final = (correctas / total_preguntas) * 20 if total_preguntas > 0 else 0
-    
-    # Actualizar hoja
-    hoja = db.query(HojaRespuesta).filter(HojaRespuesta.id == hoja_respuesta_id).first()
-    if hoja:
-        hoja.nota_final = nota_final
-        hoja.respuestas_correctas_count = correctas
-        hoja.estado = "calificado"
-        db.commit()
-    
     return {
         "success": True,
         "hoja_respuesta_id": hoja_respuesta_id,
-        "correctas": correctas,
-        "incorrectas": incorrectas,
-        "no_calificables": no_calificables,
-        "total": total_preguntas,
-        "nota_final": round(nota_final, 2),
-        "porcentaje": round((correctas / total_preguntas) * 100, 2) if total_preguntas > 0 else 0
+        "correctas": resultado["correctas"],
+        "incorrectas": resultado["incorrectas"],
+        "no_calificables": resultado["no_calificables"],
+        "total": resultado["total"],
+        "nota_final": resultado["nota_final"],
+        "porcentaje": resultado["porcentaje"]
     }
 
 
@@ -1196,4 +1477,4 @@ def generar_reporte_detallado(hoja_respuesta_id: int, db: Session) -> Dict:
             }
             for r in respuestas if r.requiere_revision
         ]
-    }
\ No newline at end of file
+    }
\ No newline at end of file
@@ -4,20 +4,30 @@ Usa schema estructurado para extracción precisa
 """
 import os
 import google.generativeai as genai
-from typing import Dict, TypedDict, List
+from typing import Dict, TypedDict, List, Optional
 from pathlib import Path
 import json
-from app.services.gemini_extractor_structured import extract_data_compatible
+from app.services.gemini_extractor_structured import (
+    extract_data_compatible,
+    LIMITE_INLINE_BYTES,
+    _jpeg_reducido
+)
+from app.services.vision_async import ejecutar_bloqueante, leer_imagen_bytes, limite_proveedor
+from app.services.cache_vision import con_cache
 
 # ============================================================================
 # FUNCIÓN: Extraer DNI con zoom
 # ============================================================================
-async def extraer_dni_con_zoom(image_path: str) -> str:
+async def extraer_dni_con_zoom(image_path: str, imagen_bytes: Optional[bytes] = None) -> str:
     """
     Extrae SOLO el DNI con zoom a la zona superior de la hoja.
     Incluye limpieza robusta de JSON para evitar errores 'Here is...'.
+    
+    El recorte se hace en memoria y se envía INLINE (sin archivo temporal
+    ni upload/delete en Gemini). imagen_bytes evita releer image_path.
     """
     from PIL import Image
+    import io
     import json
     import re
     
@@ -25,18 +35,24 @@ async def extraer_dni_con_zoom(image_path: str) -> str:
         print(f"\n🔍 EXTRACCIÓN OPTIMIZADA DE DNI (con zoom)")
         print(f"{'='*70}")
         
-        # 1. RECORTAR IMAGEN
-        img = Image.open(image_path)
-        width, height = img.size
-        crop_height = int(height * 0.15)
-        dni_zone = img.crop((0, 0, width, crop_height))
+        # 1. RECORTAR IMAGEN (en memoria)
+        if imagen_bytes is None:
+            imagen_bytes = await leer_imagen_bytes(image_path)
+        
+        def _recortar_zona_dni() -> bytes:
+            img = Image.open(io.BytesIO(imagen_bytes))
+            width, height = img.size
+            crop_height = int(height * 0.15)
+            dni_zone = img.crop((0, 0, width, crop_height)).convert("RGB")
+            buffer = io.BytesIO()
+            dni_zone.save(buffer, "JPEG", quality=95)
+            return buffer.getvalue()
         
-        temp_path = Path(image_path).parent / f"dni_zone_{Path(image_path).stem}.jpg"
-        dni_zone.save(temp_path, "JPEG", quality=95)
+        zona_dni = await ejecutar_bloqueante(_recortar_zona_dni)
         
-        # 2. SUBIR
-        print(f"📤 Subiendo zona DNI...")
-        uploaded_file = genai.upload_file(path=str(temp_path), mime_type="image/jpeg")
+        # 2. ENVÍO INLINE
+        print(f"📎 Zona DNI inline: {len(zona_dni) / 1024:.1f} KB")
+        imagen_part = {"mime_type": "image/jpeg", "data": zona_dni}
         
         # 3. PROMPT ESTRICTO
         prompt = """Analyze this image crop.
@@ -75,7 +91,8 @@ async def extraer_dni_con_zoom(image_path: str) -> str:
         )
         
         print(f"🚀 Enviando request...")
-        response = model.generate_content([uploaded_file, prompt])
+        async with limite_proveedor("gemini"):
+            response = await model.generate_content_async([imagen_part, prompt])
         
         # 5. PARSEAR CON LIMPIEZA (SANITIZACIÓN)
         print(f"📄 Respuesta cruda: {response.text[:100]}...")
@@ -108,15 +125,6 @@ async def extraer_dni_con_zoom(image_path: str) -> str:
         except Exception as e:
             print(f"❌ Error: {e}")
             return ""
-        
-        # 6. LIMPIAR ARCHIVOS
-        try:
-            genai.delete_file(uploaded_file.name)
-            temp_path.unlink()
-        except:
-            pass
-            
-        return dni
 
     except Exception as e:
         print(f"❌ Error crítico en zoom: {e}")
@@ -162,7 +170,24 @@ def validar_consistencia_dni(dni: str, imagen_path: str) -> tuple[str, bool]:
     return dni, False
 
 
-async def procesar_hoja_completa_v3(imagen_path: str) -> Dict:
+# Cambiar si se modifica el prompt o el schema: invalida el cache de Vision
+VERSION_EXTRACTOR = "simple-v3|gemini-2.5-flash|zoom-dni"
+
+
+async def procesar_hoja_completa_v3(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Dict:
+    """
+    Procesa hoja de respuestas con Gemini 2.5 Flash.
+    Si la misma imagen ya se procesó con éxito, retorna el resultado cacheado.
+    
+    imagen_bytes: contenido ya en memoria (upload recién recibido); la imagen
+    no se vuelve a leer de disco.
+    """
+    return await con_cache(
+        imagen_path, VERSION_EXTRACTOR, _procesar_hoja_completa_sin_cache, imagen_bytes=imagen_bytes
+    )
+
+
+async def _procesar_hoja_completa_sin_cache(imagen_path: str, imagen_bytes: Optional[bytes] = None) -> Dict:
     """
     Procesa hoja de respuestas con Gemini 2.5 Flash.
     Usa doble pasada: zoom en DNI + hoja completa para respuestas.
@@ -195,8 +220,16 @@ async def procesar_hoja_completa_v3(imagen_path: str) -> Dict:
         # 2. PRIMERA PASADA: ZOOM EN DNI (Alta precisión)
         # ================================================================
         
+        if imagen_bytes is None:
+            if not Path(imagen_path).exists():
+                return {
+                    "success": False,
+                    "error": f"Archivo no encontrado: {imagen_path}"
+                }
+            imagen_bytes = await leer_imagen_bytes(imagen_path)
+        
         print(f"\n🔍 PASO 1: Extrayendo DNI con zoom optimizado...")
-        dni_optimizado = await extraer_dni_con_zoom(imagen_path)
+        dni_optimizado = await extraer_dni_con_zoom(imagen_path, imagen_bytes)
         
         # ================================================================
         # 3. SEGUNDA PASADA: HOJA COMPLETA
@@ -205,25 +238,18 @@ async def procesar_hoja_completa_v3(imagen_path: str) -> Dict:
         print(f"\n📸 PASO 2: Procesando hoja completa...")
         print(f"{'='*70}")
         print(f"📸 Imagen: {Path(imagen_path).name}")
+        print(f"📊 Tamaño: {len(imagen_bytes) / 1024:.1f} KB")
         
-        if not Path(imagen_path).exists():
-            return {
-                "success": False,
-                "error": f"Archivo no encontrado: {imagen_path}"
+        # Envío INLINE (sin upload/delete). Si no entra, JPEG reducido.
+        if len(imagen_bytes) <= LIMITE_INLINE_BYTES and imagen_bytes[:3] == b"\xff\xd8\xff":
+            imagen_part = {"mime_type": "image/jpeg", "data": imagen_bytes}
+        else:
+            imagen_part = {
+                "mime_type": "image/jpeg",
+                "data": await ejecutar_bloqueante(_jpeg_reducido, imagen_bytes)
             }
         
-        file_size = Path(imagen_path).stat().st_size / 1024
-        print(f"📄 Mime type: image/jpeg")
-        print(f"📊 Tamaño: {file_size:.1f} KB")
-        
-        print(f"📤 Subiendo imagen a Gemini...")
-        
-        uploaded_file = genai.upload_file(
-            path=imagen_path,
-            mime_type="image/jpeg"
-        )
-        
-        print(f"✅ Archivo subido: {uploaded_file.name}")
+        print(f"📎 Envío INLINE: {len(imagen_part['data']) / 1024:.1f} KB")
         
         # ================================================================
         # 4. SCHEMA DE RESPUESTA
@@ -293,10 +319,11 @@ async def procesar_hoja_completa_v3(imagen_path: str) -> Dict:
         
         print(f"🚀 Enviando request a Gemini...")
         
-        response = model.generate_content([
-            uploaded_file,
-            prompt
-        ])
+        async with limite_proveedor("gemini"):
+            response = await model.generate_content_async([
+                imagen_part,
+                prompt
+            ])
         
         print(f"✅ Respuesta recibida")
         
@@ -363,12 +390,6 @@ async def procesar_hoja_completa_v3(imagen_path: str) -> Dict:
         print(f"   - Válidas: {respuestas_validas}")
         print(f"   - Vacías: {respuestas_vacias}")
         
-        try:
-            genai.delete_file(uploaded_file.name)
-            print(f"🗑️  Archivo temporal eliminado")
-        except:
-            pass
-        
         print(f"{'='*70}")
         print(f"✅ EXTRACCIÓN COMPLETADA")
         print(f"{'='*70}\n")
@@ -412,12 +433,25 @@ async def procesar_hoja_completa_v3(imagen_path: str) -> Dict:
 # FUNCIONES AUXILIARES (mantener para compatibilidad)
 # ============================================================================
 
-async def procesar_y_guardar_respuestas(hoja_respuesta_id: int, resultado_api: Dict, db):
-    """Guarda las 100 respuestas"""
+async def procesar_y_guardar_respuestas(
+    hoja_respuesta_id: int,
+    resultado_api: Dict,
+    db,
+    es_correcta: Optional[List[bool]] = None
+):
+    """
+    Guarda las 100 respuestas en UN solo INSERT multi-fila (sin commit).
+    
+    Con es_correcta (la hoja ya calificada en memoria, ver
+    motor_calificacion.calificar_respuestas) las filas se escriben
+    calificadas y no hace falta releerlas para calificar.
+    """
     from app.models import Respuesta
     from datetime import datetime
+    from sqlalchemy import insert
     
     respuestas_array = resultado_api.get("respuestas", [])
+    ahora = datetime.now()
     
     stats = {
         "validas": 0,
@@ -426,6 +460,8 @@ async def procesar_y_guardar_respuestas(hoja_respuesta_id: int, resultado_api: D
         "requieren_revision": 0
     }
     
+    filas = []
+    
     for i, resp in enumerate(respuestas_array, 1):
         respuesta_upper = resp.strip().upper() if resp else ""
         
@@ -435,22 +471,20 @@ async def procesar_y_guardar_respuestas(hoja_respuesta_id: int, resultado_api: D
             stats["validas"] += 1
         else:
             stats["letra_invalida"] += 1
-        
-        respuesta_obj = Respuesta(
-            hoja_respuesta_id=hoja_respuesta_id,
-            numero_pregunta=i,
-            respuesta_marcada=respuesta_upper if respuesta_upper else None,
-            confianza=0.95,  # Gemini tiene alta confianza
-            requiere_revision=(respuesta_upper not in ['A', 'B', 'C', 'D', 'E', '']),
-            created_at=datetime.now()
-        )
-        
-        db.add(respuesta_obj)
-        
-        if respuesta_upper and respuesta_upper not in ['A', 'B', 'C', 'D', 'E']:
             stats["requieren_revision"] += 1
+        
+        filas.append({
+            "hoja_respuesta_id": hoja_respuesta_id,
+            "numero_pregunta": i,
+            "respuesta_marcada": respuesta_upper if respuesta_upper else None,
+            "es_correcta": bool(es_correcta[i - 1]) if es_correcta and i <= len(es_correcta) else False,
+            "confianza": 0.95,  # Gemini tiene alta confianza
+            "requiere_revision": respuesta_upper not in ['A', 'B', 'C', 'D', 'E', ''],
+            "created_at": ahora
+        })
     
-    db.flush()
+    if filas:
+        db.execute(insert(Respuesta.__table__).values(filas))
     
     return {
         "success": True,
@@ -459,13 +493,9 @@ async def procesar_y_guardar_respuestas(hoja_respuesta_id: int, resultado_api: D
 
 
 async def calificar_hoja_con_gabarito(hoja_respuesta_id: int, gabarito_id: int, db):
-    """Califica con gabarito"""
-    from app.models import Respuesta, ClaveRespuesta
-    from sqlalchemy import text
-    
-    respuestas = db.query(Respuesta).filter(
-        Respuesta.hoja_respuesta_id == hoja_respuesta_id
-    ).order_by(Respuesta.numero_pregunta).all()
+    """Califica con gabarito (motor compartido, sin commit)"""
+    from app.models import ClaveRespuesta
+    from app.services.motor_calificacion import calificar_hoja
     
     gabarito = db.query(ClaveRespuesta).filter(
         ClaveRespuesta.id == gabarito_id
@@ -474,46 +504,23 @@ async def calificar_hoja_con_gabarito(hoja_respuesta_id: int, gabarito_id: int,
     if not gabarito:
         raise Exception("Gabarito no disponible")
     
-    query = text("""
-        SELECT numero_pregunta, respuesta_correcta
-        FROM clave_respuestas
-        WHERE proceso_admision = :proceso
-        ORDER BY numero_pregunta
-    """)
-    
-    claves = db.execute(query, {"proceso": gabarito.proceso_admision}).fetchall()
-    clave_dict = {str(c.numero_pregunta): c.respuesta_correcta.upper() for c in claves}
-    
-    correctas = 0
-    incorrectas = 0
-    no_calificables = 0
-    
-    for resp in respuestas:
-        num = str(resp.numero_pregunta)
-        respuesta_correcta = clave_dict.get(num, "").upper()
-        respuesta_alumno = (resp.respuesta_marcada or "").upper()
-        
-        if not respuesta_alumno:
-            no_calificables += 1
-            resp.es_correcta = None
-        elif respuesta_alumno == respuesta_correcta:
-            correctas += 1
-            resp.es_correcta = True
-        else:
-            incorrectas += 1
-            resp.es_correcta = False
-    
-    nota_final = (correctas / 100) * 20
-    porcentaje = (correctas / 100) * 100
-    
+    # Las respuestas recién agregadas deben estar en la BD antes de leerlas
     db.flush()
     
+    resultado = calificar_hoja(
+        db,
+        hoja_respuesta_id,
+        proceso=gabarito.proceso_admision,
+        estado=None,
+        actualizar_calificaciones=False
+    )
+    
     return {
-        "correctas": correctas,
-        "incorrectas": incorrectas,
-        "no_calificables": no_calificables,
-        "nota_final": round(nota_final, 2),
-        "porcentaje": round(porcentaje, 2)
+        "correctas": resultado["correctas"],
+        "incorrectas": resultado["incorrectas"],
+        "no_calificables": resultado["no_calificables"],
+        "nota_final": resultado["nota_final"],
+        "porcentaje": resultado["porcentaje"]
     }
 
 
@@ -2,13 +2,19 @@
 Utilidades del sistema
 """
 
-from .codigo_generator import generar_codigo_hoja_unico, generar_codigo_unico_postulante
+from .codigo_generator import generar_codigo_hoja_unico, generar_codigo_unico_postulante, reservar_codigos_hoja
 from .file_utils import guardar_foto_temporal, crear_directorio_capturas, crear_directorio_generadas
+from .zip_stream import iterar_zip, iterar_zip_async, escribir_zip, respuesta_zip
 
 __all__ = [
     'generar_codigo_hoja_unico',
     'generar_codigo_unico_postulante',
+    'reservar_codigos_hoja',
     'guardar_foto_temporal',
     'crear_directorio_capturas',
-    'crear_directorio_generadas'
+    'crear_directorio_generadas',
+    'iterar_zip',
+    'iterar_zip_async',
+    'escribir_zip',
+    'respuesta_zip'
 ]
\ No newline at end of file
@@ -5,8 +5,16 @@ Generador de códigos únicos para hojas de respuestas
 import random
 import string
 from datetime import datetime
+from typing import Callable, List
 import uuid
 
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+# Llave del advisory lock (PostgreSQL) que serializa la reserva de códigos
+LLAVE_LOCK_CODIGOS_HOJA = 7250001
+
 
 def generar_codigo_hoja_unico():
     """
@@ -29,6 +37,69 @@ def generar_codigo_hoja_unico():
     return codigo
 
 
+def reservar_codigos_hoja(
+    db: Session,
+    cantidad: int,
+    generador: Callable[[], str] = generar_codigo_hoja_unico,
+    max_rondas: int = 10
+) -> List[str]:
+    """
+    Reserva `cantidad` códigos de hoja distintos entre sí y que no existen
+    en hojas_respuestas.
+    
+    En vez de un SELECT por hoja, los candidatos se generan por lote y se
+    verifican con UNA consulta (codigo_hoja = ANY(:codigos)) por ronda; solo
+    se vuelven a sortear los que chocaron.
+    
+    En PostgreSQL toma además un advisory lock de transacción: dos
+    generaciones simultáneas no pueden repartir el mismo código antes de
+    insertar sus hojas. El lock se libera con el commit/rollback del llamador,
+    así que las hojas deben insertarse en la MISMA transacción.
+    
+    Args:
+        generador: Función que sortea UN código (formato del llamador)
+    
+    Returns:
+        Lista de códigos en el orden en que deben asignarse
+    """
+    if cantidad <= 0:
+        return []
+    
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:llave)"), {"llave": LLAVE_LOCK_CODIGOS_HOJA})
+    
+    codigos: List[str] = []
+    elegidos = set()
+    
+    for _ in range(max_rondas):
+        candidatos = []
+        vistos = set()
+        
+        while len(candidatos) < cantidad - len(codigos):
+            codigo = generador()
+            if codigo not in elegidos and codigo not in vistos:
+                vistos.add(codigo)
+                candidatos.append(codigo)
+        
+        existentes = {
+            fila.codigo_hoja
+            for fila in db.execute(
+                text("SELECT codigo_hoja FROM hojas_respuestas WHERE codigo_hoja = ANY(:codigos)"),
+                {"codigos": candidatos}
+            )
+        }
+        
+        for codigo in candidatos:
+            if codigo not in existentes:
+                elegidos.add(codigo)
+                codigos.append(codigo)
+        
+        if len(codigos) == cantidad:
+            return codigos
+    
+    raise Exception(f"No se pudieron reservar {cantidad} códigos únicos después de {max_rondas} intentos")
+
+
 def generar_codigo_unico_postulante(dni: str = None):
     """
     Genera código único para postulante (uso legacy)
@@ -0,0 +1,173 @@
+"""
+ZIP en streaming para descargas masivas de hojas
+app/utils/zip_stream.py
+
+Los PDFs ya vienen comprimidos (ReportLab comprime cada página), así que
+las entradas se guardan con ZIP_STORED: volver a comprimirlos cuesta CPU
+y no ahorra casi nada.
+
+iterar_zip() arma el ZIP sobre una salida NO posicionable (zipfile usa
+data descriptors) y entrega los bytes por bloques a medida que lee cada
+PDF de disco: la memoria pico es un bloque, sin importar cuántas hojas
+tenga el proceso, y el cliente recibe los primeros bytes de inmediato.
+iterar_zip_async() hace lo mismo con archivos que todavía se están
+generando (ZIP alimentado por el pool de PDFs).
+"""
+
+import io
+import os
+import zipfile
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+
+TAMANO_BLOQUE = 1024 * 1024  # 1 MB por lectura
+
+
+class _SalidaStream(io.RawIOBase):
+    """Salida de solo escritura: acumula lo escrito hasta que se vacía."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _escribir_entrada(
+    zip_file: zipfile.ZipFile,
+    salida: _SalidaStream,
+    ruta: str,
+    arcname: str,
+    tamano_bloque: int
+) -> Iterator[bytes]:
+    """Agrega UN archivo al ZIP y entrega los bytes producidos por bloques."""
+    info = zipfile.ZipInfo.from_file(ruta, arcname)
+    info.compress_type = zipfile.ZIP_STORED
+
+    with open(ruta, "rb") as origen, zip_file.open(info, "w") as destino:
+        while True:
+            bloque = origen.read(tamano_bloque)
+            if not bloque:
+                break
+            destino.write(bloque)
+
+            datos = salida.vaciar()
+            if datos:
+                yield datos
+
+
+def iterar_zip(
+    archivos: Iterable[Tuple[str, str]],
+    tamano_bloque: int = TAMANO_BLOQUE
+) -> Iterator[bytes]:
+    """
+    Genera el ZIP por bloques.
+
+    Args:
+        archivos: (ruta en disco, nombre dentro del ZIP) en el orden deseado
+    """
+    salida = _SalidaStream()
+
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_STORED) as zip_file:
+        for ruta, arcname in archivos:
+            yield from _escribir_entrada(zip_file, salida, ruta, arcname, tamano_bloque)
+
+    # Data descriptor de la última entrada + directorio central
+    datos = salida.vaciar()
+    if datos:
+        yield datos
+
+
+async def iterar_zip_async(
+    archivos: AsyncIterable[Tuple[str, str]],
+    tamano_bloque: int = TAMANO_BLOQUE,
+    borrar: bool = False,
+    al_terminar: Optional[Callable[[], None]] = None
+) -> AsyncIterator[bytes]:
+    """
+    Igual que iterar_zip, pero los archivos llegan a medida que se producen
+    (por ejemplo, iterar_renderizados del pool de PDFs): cada entrada se
+    envía apenas su PDF está listo.
+
+    Args:
+        borrar: Borrar cada archivo del disco después de agregarlo
+        al_terminar: Se ejecuta al final, también si hubo error o el
+            cliente se desconectó
+    """
+    salida = _SalidaStream()
+
+    try:
+        with zipfile.ZipFile(salida, "w", zipfile.ZIP_STORED) as zip_file:
+            async for ruta, arcname in archivos:
+                for datos in _escribir_entrada(zip_file, salida, ruta, arcname, tamano_bloque):
+                    yield datos
+
+                if borrar:
+                    os.remove(ruta)
+
+        datos = salida.vaciar()
+        if datos:
+            yield datos
+
+    finally:
+        # Cierra el productor (cancela lo que quede en vuelo)
+        if hasattr(archivos, "aclose"):
+            await archivos.aclose()
+
+        if al_terminar:
+            al_terminar()
+
+
+def escribir_zip(zip_path: str, archivos: Iterable[Tuple[str, str]]):
+    """ZIP en disco con las mismas reglas (ZIP_STORED)."""
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zip_file:
+        for ruta, arcname in archivos:
+            zip_file.write(ruta, arcname)
+
+
+def respuesta_zip(
+    archivos: Union[Iterable[Tuple[str, str]], AsyncIterable[Tuple[str, str]]],
+    filename: str,
+    headers: Optional[Dict[str, str]] = None,
+    al_terminar: Optional[Callable[[], None]] = None,
+    borrar: bool = False
+) -> StreamingResponse:
+    """
+    StreamingResponse con el ZIP en streaming (sin Content-Length: se envía
+    por chunks). al_terminar se ejecuta después de enviar el último byte,
+    por ejemplo para borrar el directorio temporal de los PDFs.
+
+    Con un iterable asíncrono (PDFs que aún se generan) el ZIP se arma con
+    iterar_zip_async; borrar elimina cada PDF apenas se envía.
+    """
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Cache-Control": "no-cache",
+        **(headers or {})
+    }
+
+    if hasattr(archivos, "__aiter__"):
+        return StreamingResponse(
+            iterar_zip_async(archivos, borrar=borrar, al_terminar=al_terminar),
+            media_type="application/zip",
+            headers=headers
+        )
+
+    return StreamingResponse(
+        iterar_zip(archivos),
+        media_type="application/zip",
+        headers=headers,
+        background=BackgroundTask(al_terminar) if al_terminar else None
+    )
@@ -34,9 +34,10 @@ from app.services import (
     generar_hoja_respuestas_pdf,
     procesar_con_api_seleccionada,
     validar_codigos,
-    calcular_calificacion,
     gabarito_existe
 )
+from app.services.motor_calificacion import calificar_hojas
+from app.api.calificacion import calificar_hoja_individual
 from app.utils import (
     generar_codigo_hoja_unico,
     guardar_foto_temporal,
@@ -701,35 +702,17 @@ async def calificar_hojas_pendientes(proceso_admision: str = "2025-2"):
                 "calificadas": 0
             }
         
-        calificadas = 0
-        errores = []
+        # Calificar todas las pendientes a la vez (matriz NumPy)
+        calificacion = calificar_hojas(
+            db,
+            proceso_admision,
+            [hoja.id for hoja in hojas_pendientes],
+            estado="completado",
+            actualizar_calificaciones=False
+        )
         
-        for hoja in hojas_pendientes:
-            try:
-                # Obtener respuestas
-                respuestas = db.query(Respuesta).filter_by(
-                    hoja_respuesta_id=hoja.id
-                ).order_by(Respuesta.numero_pregunta).all()
-                
-                respuestas_array = [r.respuesta_marcada for r in respuestas]
-                
-                # Calificar
-                calificacion = calcular_calificacion(
-                    respuestas_array,
-                    proceso_admision,
-                    db
-                )
-                
-                # Actualizar
-                hoja.nota_final = calificacion["nota"]
-                hoja.respuestas_correctas_count = calificacion["correctas"]
-                hoja.estado = "completado"
-                hoja.fecha_calificacion = datetime.now(timezone.utc)
-                
-                calificadas += 1
-                
-            except Exception as e:
-                errores.append({"hoja_id": hoja.id, "error": str(e)})
+        calificadas = len(calificacion["resultados"])
+        errores = calificacion["errores"]
         
         db.commit()
         
@@ -1795,9 +1778,6 @@ async def calificar_hojas_masivo(
             detail=f"No existe gabarito para el proceso {proceso}"
         )
     
-    # Obtener respuestas correctas como dict
-    respuestas_correctas = json.loads(gabarito.respuestas_json) if isinstance(gabarito.respuestas_json, str) else gabarito.respuestas_json
-    
     # Obtener hojas procesadas sin calificar
     hojas_sin_calificar = db.query(HojaRespuesta).filter(
         HojaRespuesta.estado == "procesado"
@@ -1810,15 +1790,18 @@ async def calificar_hojas_masivo(
             "calificadas": 0
         }
     
+    # Calificar todas las hojas a la vez (matriz NumPy)
+    codigos = {hoja.id: hoja.codigo_hoja for hoja in hojas_sin_calificar}
+    
+    calificacion = calificar_hojas(db, proceso, list(codigos))
+    db.commit()
+    
     resultados = []
+    for resultado in calificacion["resultados"]:
+        resultados.append({"success": True, "codigo_hoja": codigos[resultado["hoja_id"]], **resultado})
     
-    for hoja in hojas_sin_calificar:
-        try:
-            resultado = await calificar_hoja_individual(hoja.id, gabarito.id, db)
-            resultados.append(resultado)
-        except Exception as e:
-            print(f"Error al calificar hoja {hoja.id}: {e}")
-            continue
+    for error in calificacion["errores"]:
+        print(f"Error al calificar hoja {error['hoja_id']}: {error['error']}")
     
     return {
         "success": True,
@@ -1860,131 +1843,6 @@ async def calificar_hoja_endpoint(
     return resultado
 
 
-async def calificar_hoja_individual(hoja_id: int, gabarito_id: int, db: Session):
-    """
-    Lógica de calificación de una hoja individual.
-    """
-    
-    from app.models import HojaRespuesta, Respuesta, ClaveRespuesta, Calificacion, Postulante
-    import json
-    
-    # Obtener hoja
-    hoja = db.query(HojaRespuesta).filter(HojaRespuesta.id == hoja_id).first()
-    
-    if not hoja:
-        raise HTTPException(status_code=404, detail=f"Hoja {hoja_id} no encontrada")
-    
-    # Obtener gabarito
-    gabarito = db.query(ClaveRespuesta).filter(ClaveRespuesta.id == gabarito_id).first()
-    
-    if not gabarito:
-        raise HTTPException(status_code=404, detail="Gabarito no encontrado")
-    
-    # Respuestas correctas
-    respuestas_correctas = json.loads(gabarito.respuestas_json) if isinstance(gabarito.respuestas_json, str) else gabarito.respuestas_json
-    
-    # Obtener respuestas del postulante
-    respuestas_postulante = db.query(Respuesta).filter(
-        Respuesta.hoja_respuesta_id == hoja_id
-    ).order_by(Respuesta.numero_pregunta).all()
-    
-    if not respuestas_postulante:
-        raise HTTPException(
-            status_code=400,
-            detail=f"No hay respuestas registradas para la hoja {hoja_id}"
-        )
-    
-    # Calificar
-    correctas = 0
-    incorrectas = 0
-    en_blanco = 0
-    no_legibles = 0
-    
-    for respuesta in respuestas_postulante:
-        num_pregunta = str(respuesta.numero_pregunta)
-        respuesta_correcta = respuestas_correctas.get(num_pregunta)
-        
-        # Solo calificar respuestas válidas (A-E)
-        if respuesta.respuesta_marcada in ['A', 'B', 'C', 'D', 'E']:
-            if respuesta.respuesta_marcada == respuesta_correcta:
-                respuesta.es_correcta = True
-                correctas += 1
-            else:
-                respuesta.es_correcta = False
-                incorrectas += 1
-        
-        elif respuesta.respuesta_marcada == 'VACIO':
-            en_blanco += 1
-        
-        else:
-            # LETRA_INVALIDA, GARABATO, MULTIPLE, ILEGIBLE
-            no_legibles += 1
-    
-    db.commit()
-    
-    # Calcular nota (sobre 20, sistema vigesimal peruano)
-    total_preguntas = len(respuestas_postulante)
-    porcentaje = (correctas / total_preguntas) * 100 if total_preguntas > 0 else 0
-    nota_final = (correctas / total_preguntas) * 20 if total_preguntas > 0 else 0
-    
-    # Nota mínima de aprobación (típicamente 10.5 en Perú)
-    nota_minima = 10.5
-    aprobado = nota_final >= nota_minima
-    
-    # Actualizar hoja
-    hoja.nota_final = round(nota_final, 2)
-    hoja.respuestas_correctas_count = correctas
-    hoja.estado = "calificado"
-    
-    # Crear o actualizar registro en tabla calificaciones
-    calificacion_existente = db.query(Calificacion).filter(
-        Calificacion.postulante_id == hoja.postulante_id
-    ).first()
-    
-    if calificacion_existente:
-        # Actualizar
-        calificacion_existente.nota = round(nota_final, 2)
-        calificacion_existente.correctas = correctas
-        calificacion_existente.incorrectas = incorrectas
-        calificacion_existente.en_blanco = en_blanco
-        calificacion_existente.no_legibles = no_legibles
-        calificacion_existente.porcentaje_aciertos = round(porcentaje, 2)
-        calificacion_existente.aprobado = aprobado
-        calificacion_existente.nota_minima = nota_minima
-        calificacion_existente.calificado_at = datetime.now()
-    else:
-        # Crear nuevo
-        calificacion = Calificacion(
-            postulante_id=hoja.postulante_id,
-            nota=round(nota_final, 2),
-            correctas=correctas,
-            incorrectas=incorrectas,
-            en_blanco=en_blanco,
-            no_legibles=no_legibles,
-            porcentaje_aciertos=round(porcentaje, 2),
-            aprobado=aprobado,
-            nota_minima=nota_minima,
-            calificado_at=datetime.now()
-        )
-        db.add(calificacion)
-    
-    db.commit()
-    
-    return {
-        "success": True,
-        "hoja_id": hoja_id,
-        "codigo_hoja": hoja.codigo_hoja,
-        "nota_final": round(nota_final, 2),
-        "correctas": correctas,
-        "incorrectas": incorrectas,
-        "en_blanco": en_blanco,
-        "no_legibles": no_legibles,
-        "total": total_preguntas,
-        "porcentaje": round(porcentaje, 2),
-        "aprobado": aprobado
-    }
-
-
 # ============================================================================
 # ENDPOINT ESTADÍSTICAS - AGREGAR A app/main.py
 # ============================================================================
@@ -0,0 +1,19 @@
+-- ============================================================================
+-- MIGRACIÓN 001: índice compuesto de respuestas (hoja, pregunta)
+-- ============================================================================
+--
+-- La calificación actualiza respuestas por (hoja_respuesta_id, numero_pregunta).
+-- En BD nuevas create_all ya lo crea (Respuesta.__table_args__); en BD
+-- existentes se crea con esta migración, fuera del arranque de la app.
+--
+-- CONCURRENTLY no bloquea las escrituras mientras se construye, pero no puede
+-- correr dentro de una transacción: ejecutar con psql en modo autocommit
+-- (el predeterminado), sin BEGIN:
+--
+--     psql "$DATABASE_URL" -f migrations/001_ix_respuestas_hoja_pregunta.sql
+--
+-- Si se interrumpe, el índice queda INVALID: borrarlo con
+-- DROP INDEX CONCURRENTLY ix_respuestas_hoja_pregunta; y volver a ejecutar.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_respuestas_hoja_pregunta
+    ON respuestas (hoja_respuesta_id, numero_pregunta);